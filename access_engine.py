@@ -0,0 +1,384 @@
+import os
+import json
+import uuid
+import time
+import threading
+import datetime
+from zoneinfo import ZoneInfo
+from prometheus_client import Counter, Gauge, Histogram
+from db import get_db_connection, get_notify_listener
+from uids import format_uid
+from schedule import compile_schedule, minute_of_week, bitmap_allows, bitmap_windows
+
+NOTIFY_CHANNEL = 'access_changes'
+
+# Prometheus metrics
+ACCESS_DECISIONS = Counter(
+    'access_decisions_total',
+    'Access decisions made by the in-memory index',
+    ['result', 'reason']
+)
+
+ACCESS_DECISION_LATENCY = Histogram(
+    'access_decision_duration_seconds',
+    'Time to evaluate one tap against the in-memory index',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+)
+
+ACCESS_INDEX_CARDS = Gauge(
+    'access_index_cards',
+    'Cards held in the in-memory permission index',
+    multiprocess_mode='liveall'
+)
+
+ACCESS_INDEX_REFRESHES = Counter(
+    'access_index_refreshes_total',
+    'Permission index refreshes',
+    ['kind']
+)
+
+
+class CardEntry:
+    __slots__ = ('card_id', 'card_uid', 'status', 'user_id', 'grants')
+
+    def __init__(self, card_id, card_uid, status, user_id=None, grants=None):
+        self.card_id = card_id
+        self.card_uid = card_uid
+        self.status = status
+        self.user_id = user_id
+        # access_point_id -> (access_level, schedule bitmap or None)
+        self.grants = grants if grants is not None else {}
+
+
+class Decision:
+    __slots__ = ('granted', 'reason', 'card_id', 'access_point_id', 'user_id')
+
+    def __init__(self, granted, reason, card_id=None, access_point_id=None, user_id=None):
+        self.granted = granted
+        self.reason = reason
+        self.card_id = card_id
+        self.access_point_id = access_point_id
+        # The card's owner; kept off the response
+        self.user_id = user_id
+
+    def to_dict(self):
+        return {
+            'granted': self.granted,
+            'reason': self.reason,
+            'card_id': self.card_id,
+            'access_point_id': self.access_point_id
+        }
+
+
+CARD_QUERY = 'SELECT id, card_uid, status, user_id FROM cards'
+GRANT_QUERY = '''
+    SELECT card_id, access_point_id, access_level, schedule_start, schedule_end, days_of_week
+    FROM card_access
+'''
+GRANT_PAIRS_FILTER = ' WHERE (card_id, access_point_id) IN (SELECT * FROM unnest(%s::uuid[], %s::uuid[]))'
+ACCESS_POINT_QUERY = 'SELECT id, access_level FROM access_points'
+
+
+def access_point_key(access_point_id):
+    """``access_point_id`` as the index keys it (lower-case UUID text), or None."""
+    if not isinstance(access_point_id, (str, uuid.UUID)):
+        return None
+    try:
+        return str(uuid.UUID(str(access_point_id)))
+    except ValueError:
+        return None
+
+
+class PermissionIndex:
+    """In-process index of every card's permissions, keyed by ``card_uid``.
+
+    Readers never take a lock: entries are replaced wholesale, and a full
+    reload swaps the dictionaries in one assignment.
+    """
+
+    def __init__(self, timezone=None):
+        self.timezone = ZoneInfo(timezone or os.getenv('ACCESS_TIMEZONE', 'UTC'))
+        self._by_uid = {}
+        self._uid_by_card_id = {}
+        self._ap_levels = {}
+        self._write_lock = threading.Lock()
+        self.loaded_at = None
+        self.pid = os.getpid()
+
+    def __len__(self):
+        return len(self._by_uid)
+
+    @staticmethod
+    def _grant(level, schedule_start, schedule_end, days_of_week):
+        days = tuple(days_of_week) if days_of_week is not None else None
+        return (level if level is not None else 1, compile_schedule(schedule_start, schedule_end, days))
+
+    def load(self, conn):
+        """Bulk-load every card, grant and access point."""
+        cur = conn.cursor()
+        cur.execute(ACCESS_POINT_QUERY)
+        ap_levels = {str(ap_id): level if level is not None else 1 for ap_id, level in cur.fetchall()}
+        cur.execute(CARD_QUERY)
+        by_card_id = {}
+        for card_id, card_uid, status, user_id in cur.fetchall():
+            by_card_id[str(card_id)] = CardEntry(str(card_id), bytes(card_uid), status, str(user_id))
+        cur.execute(GRANT_QUERY)
+        for card_id, ap_id, level, start, end, days in cur.fetchall():
+            entry = by_card_id.get(str(card_id))
+            if entry is not None:
+                entry.grants[str(ap_id)] = self._grant(level, start, end, days)
+        cur.close()
+        conn.rollback()
+        with self._write_lock:
+            self._ap_levels = ap_levels
+            self._by_uid = {entry.card_uid: entry for entry in by_card_id.values()}
+            self._uid_by_card_id = {card_id: entry.card_uid for card_id, entry in by_card_id.items()}
+            self.loaded_at = time.time()
+        ACCESS_INDEX_CARDS.set(len(self._by_uid))
+        ACCESS_INDEX_REFRESHES.labels(kind='full').inc()
+
+    def refresh_cards(self, conn, card_ids, with_grants=True):
+        """Reload the given cards; their grants too unless ``with_grants`` is false.
+
+        Without grants, cards already indexed keep their compiled bitmaps,
+        which is all a status or UID change needs.
+        """
+        card_ids = list(card_ids)
+        if not card_ids:
+            return
+        cur = conn.cursor()
+        cur.execute(CARD_QUERY + ' WHERE id = ANY(%s::uuid[])', (card_ids,))
+        entries = {str(card_id): CardEntry(str(card_id), bytes(card_uid), status, str(user_id))
+                   for card_id, card_uid, status, user_id in cur.fetchall()}
+        reuse = {}
+        if not with_grants:
+            for card_id in entries:
+                current = self._by_uid.get(self._uid_by_card_id.get(card_id))
+                if current is not None:
+                    reuse[card_id] = current.grants
+        missing = [card_id for card_id in entries if card_id not in reuse]
+        if missing:
+            cur.execute(GRANT_QUERY + ' WHERE card_id = ANY(%s::uuid[])', (missing,))
+            for card_id, ap_id, level, start, end, days in cur.fetchall():
+                entry = entries.get(str(card_id))
+                if entry is not None:
+                    entry.grants[str(ap_id)] = self._grant(level, start, end, days)
+        cur.close()
+        conn.rollback()
+        for card_id, grants in reuse.items():
+            entries[card_id].grants = grants
+        with self._write_lock:
+            for card_id in card_ids:
+                old_uid = self._uid_by_card_id.pop(card_id, None)
+                if old_uid is not None:
+                    self._by_uid.pop(old_uid, None)
+            for card_id, entry in entries.items():
+                self._by_uid[entry.card_uid] = entry
+                self._uid_by_card_id[card_id] = entry.card_uid
+        ACCESS_INDEX_CARDS.set(len(self._by_uid))
+        ACCESS_INDEX_REFRESHES.labels(kind='cards').inc()
+
+    def refresh_grants(self, conn, pairs):
+        """Recompile only the given ``(card_id, access_point_id)`` grants."""
+        pairs = set(pairs)
+        if not pairs:
+            return
+        card_ids, ap_ids = zip(*pairs)
+        cur = conn.cursor()
+        cur.execute(GRANT_QUERY + GRANT_PAIRS_FILTER, (list(card_ids), list(ap_ids)))
+        compiled = {(str(card_id), str(ap_id)): self._grant(level, start, end, days)
+                    for card_id, ap_id, level, start, end, days in cur.fetchall()}
+        cur.close()
+        conn.rollback()
+        by_card = {}
+        for card_id, ap_id in pairs:
+            by_card.setdefault(card_id, []).append(ap_id)
+        with self._write_lock:
+            for card_id, ap_ids in by_card.items():
+                current = self._by_uid.get(self._uid_by_card_id.get(card_id))
+                if current is None:
+                    continue
+                grants = dict(current.grants)
+                for ap_id in ap_ids:
+                    grant = compiled.get((card_id, ap_id))
+                    if grant is None:
+                        grants.pop(ap_id, None)
+                    else:
+                        grants[ap_id] = grant
+                # Replace the entry so lock-free readers never see a half update
+                self._by_uid[current.card_uid] = CardEntry(
+                    card_id, current.card_uid, current.status, current.user_id, grants)
+        ACCESS_INDEX_REFRESHES.labels(kind='grants').inc()
+
+    def refresh_access_points(self, conn, access_point_ids):
+        access_point_ids = list(access_point_ids)
+        if not access_point_ids:
+            return
+        cur = conn.cursor()
+        cur.execute(ACCESS_POINT_QUERY + ' WHERE id = ANY(%s::uuid[])', (access_point_ids,))
+        levels = {str(ap_id): level if level is not None else 1 for ap_id, level in cur.fetchall()}
+        cur.close()
+        conn.rollback()
+        with self._write_lock:
+            ap_levels = dict(self._ap_levels)
+            for ap_id in access_point_ids:
+                ap_levels.pop(ap_id, None)
+            ap_levels.update(levels)
+            self._ap_levels = ap_levels
+        ACCESS_INDEX_REFRESHES.labels(kind='access_points').inc()
+
+    def effective_access(self, card_id, when=None):
+        """Compiled permissions of one card, for auditing; None if unknown.
+
+        Lists every access point the card holds a grant on, whether the
+        grant is usable at all, its schedule windows in the index's
+        timezone and whether it would open now (or at ``when``).
+        """
+        entry = self._by_uid.get(self._uid_by_card_id.get(card_id))
+        if entry is None:
+            return None
+        if when is None:
+            when = datetime.datetime.now(self.timezone)
+        elif when.tzinfo is not None:
+            when = when.astimezone(self.timezone)
+        minute = minute_of_week(when)
+        access_points = []
+        for ap_id, (level, bitmap) in sorted(entry.grants.items()):
+            required_level = self._ap_levels.get(ap_id)
+            if entry.status != 'active':
+                reason = f'card_{entry.status}'
+            elif required_level is None:
+                reason = 'unknown_access_point'
+            elif level < required_level:
+                reason = 'insufficient_level'
+            else:
+                reason = None
+            windows = bitmap_windows(bitmap)
+            access_points.append({
+                'access_point_id': ap_id,
+                'level': level,
+                'required_level': required_level,
+                'usable': reason is None,
+                'reason': reason,
+                'always': bitmap is None,
+                'windows': windows,
+                'minutes_per_week': None if bitmap is None else sum(w['minutes'] for w in windows),
+                'open_now': reason is None and bitmap_allows(bitmap, minute)
+            })
+        return {
+            'card_id': entry.card_id,
+            'card_uid': format_uid(entry.card_uid),
+            'user_id': entry.user_id,
+            'status': entry.status,
+            'timezone': str(self.timezone),
+            'evaluated_at': when.isoformat(),
+            'access_points': access_points
+        }
+
+    def check(self, card_uid, access_point_id, when=None):
+        """Decide whether ``card_uid`` (bytes) may open ``access_point_id`` at ``when``.
+
+        A naive ``when`` is taken to be in the index's timezone; None means now.
+        ``access_point_id`` matches in any case; anything but a UUID is an
+        unknown access point.
+        """
+        started = time.perf_counter()
+        key = access_point_key(access_point_id)
+        decision = self._decide(card_uid, access_point_id if key is None else key, when)
+        ACCESS_DECISION_LATENCY.observe(time.perf_counter() - started)
+        ACCESS_DECISIONS.labels(
+            result='granted' if decision.granted else 'denied',
+            reason=decision.reason
+        ).inc()
+        return decision
+
+    def _decide(self, card_uid, access_point_id, when):
+        entry = self._by_uid.get(card_uid)
+        if entry is None:
+            return Decision(False, 'unknown_card', access_point_id=access_point_id)
+        if entry.status != 'active':
+            return Decision(False, f'card_{entry.status}', entry.card_id, access_point_id, entry.user_id)
+        required_level = self._ap_levels.get(access_point_id) if isinstance(access_point_id, str) else None
+        if required_level is None:
+            return Decision(False, 'unknown_access_point', entry.card_id, access_point_id, entry.user_id)
+        grant = entry.grants.get(access_point_id)
+        if grant is None:
+            return Decision(False, 'no_grant', entry.card_id, access_point_id, entry.user_id)
+        level, bitmap = grant
+        if level < required_level:
+            return Decision(False, 'insufficient_level', entry.card_id, access_point_id, entry.user_id)
+        if bitmap is not None:
+            if when is None:
+                when = datetime.datetime.now(self.timezone)
+            elif when.tzinfo is not None:
+                when = when.astimezone(self.timezone)
+            if not bitmap_allows(bitmap, minute_of_week(when)):
+                return Decision(False, 'outside_schedule', entry.card_id, access_point_id, entry.user_id)
+        return Decision(True, 'granted', entry.card_id, access_point_id, entry.user_id)
+
+
+class ChangeListener:
+    """Apply ``NOTIFY access_changes`` payloads to a PermissionIndex.
+
+    Fed by the process's shared ``NotifyListener``. After every LISTEN,
+    reconnects included, the index is fully reloaded, since notifications
+    may have been missed.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def reload(self):
+        with get_db_connection() as db:
+            self.index.load(db)
+
+    def apply(self, notifies):
+        card_ids = set()
+        grant_card_ids = set()
+        grants = set()
+        access_point_ids = set()
+        for notify in notifies:
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                continue
+            table = payload.get('table')
+            if table == 'access_points':
+                access_point_ids.add(payload['id'])
+            elif table == 'card_access' and payload.get('access_point_id'):
+                grants.add((payload['card_id'], payload['access_point_id']))
+            elif table == 'card_access' and payload.get('card_id'):
+                grant_card_ids.add(payload['card_id'])
+            elif payload.get('card_id'):
+                card_ids.add(payload['card_id'])
+        if not (card_ids or grant_card_ids or grants or access_point_ids):
+            return
+        with get_db_connection() as db:
+            self.index.refresh_access_points(db, access_point_ids)
+            # A card row change keeps its compiled grants; only changed grants are recompiled
+            self.index.refresh_cards(db, card_ids - grant_card_ids, with_grants=False)
+            self.index.refresh_cards(db, grant_card_ids)
+            self.index.refresh_grants(db, {g for g in grants if g[0] not in grant_card_ids})
+
+
+_index = None
+_listener = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's permission index, loading it on first use."""
+    global _index, _listener
+    pid = os.getpid()
+    if _index is not None and _index.pid == pid:
+        return _index
+    with _index_lock:
+        if _index is None or _index.pid != pid:
+            index = PermissionIndex()
+            with get_db_connection() as conn:
+                index.load(conn)
+            _index = index
+            if os.getenv('ACCESS_INDEX_LISTEN', '1') == '1':
+                _listener = ChangeListener(index)
+                get_notify_listener().subscribe(NOTIFY_CHANNEL, _listener.apply, _listener.reload)
+        return _index
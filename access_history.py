@@ -0,0 +1,199 @@
+import uuid
+import base64
+import datetime
+
+DEFAULT_WINDOW = datetime.timedelta(days=7)
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+ROLLUP_TABLES = {
+    'hour': 'access_log_hourly',
+    'day': 'access_log_daily',
+}
+
+
+# Corporate admins see every access point; building admins those of their buildings
+ADMIN_ACCESS_POINTS_WHERE = '''
+    (access_point_id IN (SELECT ap.id FROM access_points ap
+                         JOIN building_admins ba ON ba.building_id = ap.building_id
+                         WHERE ba.user_id = %s)
+     OR EXISTS (SELECT 1 FROM corporate_admins WHERE user_id = %s))
+'''
+# ...and anyone sees the entries of their own cards
+VISIBLE_LOGS_WHERE = f'''
+    (card_id IN (SELECT id FROM cards WHERE user_id = %s) OR {ADMIN_ACCESS_POINTS_WHERE})
+'''
+
+
+class HistoryArgsError(ValueError):
+    """Raised for malformed history query parameters."""
+
+
+def encode_cursor(moment, row_id):
+    raw = f'{moment.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        moment, row_id = raw.split('|', 1)
+        return datetime.datetime.fromisoformat(moment), str(uuid.UUID(row_id))
+    except (ValueError, UnicodeDecodeError):
+        raise HistoryArgsError('after is not a valid cursor')
+
+
+def _parse_uuid(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        raise HistoryArgsError(f'{name} must be an id')
+
+
+def _parse_time(args, name, default):
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise HistoryArgsError(f'{name} must be ISO-8601')
+    # access_logs timestamps are naive UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_history_args(args):
+    """Read the filters shared by the history endpoints.
+
+    ``since``/``until`` default to the last seven days so every query is
+    bounded to a few partitions. Offsets are converted to naive UTC.
+    """
+    until = _parse_time(args, 'until', datetime.datetime.utcnow())
+    since = _parse_time(args, 'since', until - DEFAULT_WINDOW)
+    if since >= until:
+        raise HistoryArgsError('since must be before until')
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise HistoryArgsError('limit must be an integer')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise HistoryArgsError(f'limit must be between 1 and {MAX_LIMIT}')
+    after = args.get('after')
+    return {
+        'access_point_id': _parse_uuid(args, 'access_point_id'),
+        'card_id': _parse_uuid(args, 'card_id'),
+        'since': since,
+        'until': until,
+        'limit': limit,
+        'after': decode_cursor(after) if after else None,
+    }
+
+
+def build_logs_query(viewer_id, access_point_id=None, card_id=None, since=None, until=None,
+                     limit=DEFAULT_LIMIT, after=None):
+    """Only entries ``viewer_id`` may see (``VISIBLE_LOGS_WHERE``) are returned."""
+    clauses = ['timestamp >= %s', 'timestamp < %s', VISIBLE_LOGS_WHERE]
+    params = [since, until, viewer_id, viewer_id, viewer_id]
+    if access_point_id:
+        clauses.append('access_point_id = %s')
+        params.append(access_point_id)
+    if card_id:
+        clauses.append('card_id = %s')
+        params.append(card_id)
+    if after:
+        clauses.append('(timestamp, id) < (%s, %s::uuid)')
+        params.extend(after)
+    params.append(limit + 1)
+    query = f'''
+        SELECT id, card_id, access_point_id, access_granted, timestamp
+        FROM access_logs
+        WHERE {' AND '.join(clauses)}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s
+    '''
+    return query, params
+
+
+def shape_logs(rows, limit):
+    """Trim the look-ahead row and build ``(items, next_cursor)``."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][4], rows[-1][0])
+    items = [{
+        'id': str(row_id),
+        'card_id': str(row_card_id),
+        'access_point_id': str(row_ap_id),
+        'access_granted': granted,
+        'timestamp': moment.isoformat()
+    } for row_id, row_card_id, row_ap_id, granted, moment in rows]
+    return items, next_cursor
+
+
+def query_logs(conn, viewer_id, limit=DEFAULT_LIMIT, **filters):
+    """Return one page of access_logs, newest first, and the next cursor."""
+    query, params = build_logs_query(viewer_id, limit=limit, **filters)
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    return shape_logs(rows, limit)
+
+
+def build_stats_query(viewer_id, granularity='hour', access_point_id=None, since=None, until=None,
+                      limit=DEFAULT_LIMIT, after=None):
+    """Only the access points ``viewer_id`` administers are counted."""
+    table = ROLLUP_TABLES.get(granularity)
+    if table is None:
+        raise HistoryArgsError(f"granularity must be one of {', '.join(ROLLUP_TABLES)}")
+    clauses = ['bucket >= %s', 'bucket < %s', ADMIN_ACCESS_POINTS_WHERE]
+    params = [since, until, viewer_id, viewer_id]
+    if access_point_id:
+        clauses.append('access_point_id = %s')
+        params.append(access_point_id)
+    if after:
+        clauses.append('(bucket, access_point_id) < (%s, %s::uuid)')
+        params.extend(after)
+    params.append(limit + 1)
+    query = f'''
+        SELECT access_point_id, bucket, granted_count, denied_count
+        FROM {table}
+        WHERE {' AND '.join(clauses)}
+        ORDER BY bucket DESC, access_point_id DESC
+        LIMIT %s
+    '''
+    return query, params
+
+
+def shape_stats(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    items = [{
+        'access_point_id': str(ap_id),
+        'bucket': bucket.isoformat(),
+        'granted': granted,
+        'denied': denied
+    } for ap_id, bucket, granted, denied in rows]
+    return items, next_cursor
+
+
+def stats_filters(args):
+    """The subset of ``parse_history_args`` output the stats query accepts."""
+    return {key: args[key] for key in ('access_point_id', 'since', 'until', 'limit', 'after')}
+
+
+def query_stats(conn, viewer_id, limit=DEFAULT_LIMIT, **filters):
+    """Return one page of rollup buckets, newest first, and the next cursor."""
+    query, params = build_stats_query(viewer_id, limit=limit, **filters)
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    return shape_stats(rows, limit)
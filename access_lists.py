@@ -0,0 +1,251 @@
+"""Versioned per-building access lists for door controllers.
+
+A controller downloads the full list once, then polls with ``since`` set
+to the version it holds and applies the returned diff. Versions are
+``access_list_log`` sequence numbers, so a diff is one index range scan.
+
+Binary layout (little-endian)::
+
+    header   4s magic b'NFAL', B format (1), B kind (0 full, 1 diff),
+             B flags (bit 0: bloom filter follows), B reserved,
+             16s building id, Q version, Q since (0 for a full list)
+    section  B tag (1 allowed, 2 revoked, 3 removed), B uid length,
+             I count, then count * length bytes of UIDs sorted bytewise
+    ...      sections end with a single 0 tag byte
+    bloom    I bit count m, B hash count k, then ceil(m / 8) bytes
+
+UIDs of different lengths (4, 7 or 10 bytes) go in separate sections so
+each section can be binary-searched in place. Bloom bit ``i`` of a UID
+is ``(h1 + i * h2) % m`` for ``i < k``, where ``h1`` and ``h2`` are the
+first two little-endian uint32 words of ``sha256(uid)``.
+"""
+import os
+import math
+import uuid
+import struct
+import hmac
+import hashlib
+from sync_changes import HORIZON_CTE, SETTLE_SECONDS
+from uids import try_parse_uid
+
+MAGIC = b'NFAL'
+FORMAT_VERSION = 1
+KIND_FULL = 0
+KIND_DIFF = 1
+FLAG_BLOOM = 1
+TAG_END = 0
+TAG_ALLOWED = 1
+TAG_REVOKED = 2
+TAG_REMOVED = 3
+HEADER = struct.Struct('<4sBBBB16sQQ')
+SECTION = struct.Struct('<BBI')
+BLOOM_HEADER = struct.Struct('<IB')
+
+MEDIA_TYPE = 'application/vnd.nfc-one.access-list'
+# Shared secret door controllers present as a bearer token
+CONTROLLER_TOKEN = os.getenv('ACCESS_LIST_TOKEN')
+BLOOM_FP_RATE = float(os.getenv('ACCESS_LIST_BLOOM_FP', '0.01'))
+
+STATES = {'a': 'allowed', 'r': 'revoked', 'n': 'removed'}
+
+PURGED_SQL = 'SELECT purged_through FROM access_list_purges'
+
+# Current standing of every card granted somewhere in the building;
+# lost and suspended cards are listed as revoked
+FULL_SQL = '''
+    SELECT uid_hex(c.card_uid), c.status FROM cards c
+    WHERE c.status IN ('active', 'revoked', 'lost', 'suspended') AND EXISTS (
+        SELECT 1 FROM card_access ca JOIN access_points ap ON ap.id = ca.access_point_id
+        WHERE ca.card_id = c.id AND ap.building_id = %(building_id)s)
+'''
+
+# Only changes stamped before the horizon are exposed, so no lower seq can
+# still commit after a version has been handed out
+VERSION_SQL = f'''
+    WITH {HORIZON_CTE}
+    SELECT max(seq) FROM access_list_log, horizon
+    WHERE building_id = %(building_id)s AND changed_at <= horizon.until
+'''
+
+DIFF_SQL = f'''
+    WITH {HORIZON_CTE}
+    SELECT DISTINCT ON (card_uid) uid_hex(card_uid), state, seq FROM access_list_log, horizon
+    WHERE building_id = %(building_id)s AND seq > %(since)s AND changed_at <= horizon.until
+    ORDER BY card_uid, seq DESC
+'''
+
+
+class AccessListArgsError(ValueError):
+    """Raised for malformed access list requests."""
+
+
+def parse_access_list_args(building_id, args):
+    """Validate the building id and read ``since`` and ``format``.
+
+    Returns ``(building_id, since, bloom)``; ``since`` is None for a full list.
+    """
+    try:
+        building_id = str(uuid.UUID(building_id))
+    except ValueError:
+        raise AccessListArgsError('building_id must be a UUID')
+    since = args.get('since')
+    if since:
+        try:
+            since = int(since)
+        except ValueError:
+            raise AccessListArgsError('since must be an integer version')
+        if since < 0:
+            raise AccessListArgsError('since must not be negative')
+    else:
+        since = None
+    fmt = args.get('format', 'sorted')
+    if fmt not in ('sorted', 'bloom'):
+        raise AccessListArgsError("format must be 'sorted' or 'bloom'")
+    return building_id, since, fmt == 'bloom'
+
+
+def controller_token_valid(token):
+    return bool(CONTROLLER_TOKEN and token) and hmac.compare_digest(token, CONTROLLER_TOKEN)
+
+
+def _empty(version, since):
+    return {'version': version, 'since': since, 'allowed': [], 'revoked': [], 'removed': []}
+
+
+def shape_diff(since, purged_through, rows):
+    """Diff payload from ``DIFF_SQL`` rows."""
+    result = _empty(max(since, purged_through), since)
+    for card_uid, state, seq in rows:
+        result[STATES[state]].append(card_uid)
+        result['version'] = max(result['version'], seq)
+    return result
+
+
+def shape_full(version, purged_through, rows):
+    """Full list payload from the ``VERSION_SQL`` value and ``FULL_SQL`` rows."""
+    result = _empty(max(version or 0, purged_through), None)
+    for card_uid, status in rows:
+        result['allowed' if status == 'active' else 'revoked'].append(card_uid)
+    return result
+
+
+def query_access_list(conn, building_id, since=None):
+    """Read a full list, or the diff since ``since`` when it is still covered.
+
+    Returns a dict with ``version``, ``since`` (None for a full list) and
+    UID strings under ``allowed``, ``revoked`` and ``removed``. A diff is
+    the latest state of each changed UID, so applying one twice, or on top
+    of a newer full list, is harmless.
+    """
+    params = access_list_params(building_id, since)
+    cur = conn.cursor()
+    try:
+        cur.execute(PURGED_SQL)
+        row = cur.fetchone()
+        purged_through = row[0] if row else 0
+        if since is not None and since >= purged_through:
+            cur.execute(DIFF_SQL, params)
+            return shape_diff(since, purged_through, cur.fetchall())
+        # Version first: anything after it is re-sent as a diff, and
+        # re-applying a state the snapshot already has is a no-op
+        cur.execute(VERSION_SQL, params)
+        version = cur.fetchone()[0]
+        cur.execute(FULL_SQL, params)
+        return shape_full(version, purged_through, cur.fetchall())
+    finally:
+        cur.close()
+
+
+def access_list_params(building_id, since):
+    return {'building_id': building_id, 'since': since or 0, 'settle': SETTLE_SECONDS}
+
+
+def _sections(tag, card_uids):
+    by_length = {}
+    for card_uid in card_uids:
+        value = try_parse_uid(card_uid)
+        if value is not None:
+            by_length.setdefault(len(value), set()).add(value)
+    parts = []
+    for length in sorted(by_length):
+        values = sorted(by_length[length])
+        parts.append(SECTION.pack(tag, length, len(values)))
+        parts.append(b''.join(values))
+    return parts
+
+
+def bloom_bits(value, k, m):
+    digest = hashlib.sha256(value).digest()
+    h1, h2 = struct.unpack_from('<II', digest)
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+def build_bloom(card_uids, fp_rate=BLOOM_FP_RATE):
+    """Bloom filter of ``card_uids`` as ``(m, k, bitmap bytes)``."""
+    values = [v for v in (try_parse_uid(u) for u in card_uids) if v is not None]
+    n = max(len(values), 1)
+    m = max(64, int(math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2))))
+    k = max(1, int(round(m / n * math.log(2))))
+    bitmap = bytearray((m + 7) // 8)
+    for value in values:
+        for bit in bloom_bits(value, k, m):
+            bitmap[bit >> 3] |= 1 << (bit & 7)
+    return m, k, bytes(bitmap)
+
+
+def encode_access_list(building_id, result, bloom=False):
+    """Serialise a ``query_access_list`` result in the binary layout above.
+
+    With ``bloom`` a full list carries the allowed UIDs as a Bloom filter
+    instead of a sorted section; revoked UIDs and diffs stay exact.
+    """
+    full = result['since'] is None
+    use_bloom = bloom and full
+    parts = [HEADER.pack(
+        MAGIC, FORMAT_VERSION, KIND_FULL if full else KIND_DIFF, FLAG_BLOOM if use_bloom else 0, 0,
+        uuid.UUID(building_id).bytes, result['version'], result['since'] or 0
+    )]
+    if not use_bloom:
+        parts.extend(_sections(TAG_ALLOWED, result['allowed']))
+    parts.extend(_sections(TAG_REVOKED, result['revoked']))
+    if not full:
+        parts.extend(_sections(TAG_REMOVED, result['removed']))
+    parts.append(bytes([TAG_END]))
+    if use_bloom:
+        m, k, bitmap = build_bloom(result['allowed'])
+        parts.append(BLOOM_HEADER.pack(m, k))
+        parts.append(bitmap)
+    return b''.join(parts)
+
+
+CARD_STATUSES = ('active', 'revoked', 'pending', 'lost', 'suspended')
+# A cardholder can only take their own card out of service; putting a
+# card back into service, or revoking it, is up to the building's admins
+OWNER_STATUSES = ('lost', 'suspended')
+
+SET_STATUS_SQL = '''
+    UPDATE cards SET status = %s
+    WHERE id = %s AND user_id = %s AND status <> 'revoked'
+    RETURNING id, uid_hex(card_uid), status, updated_at, user_id
+'''
+
+# Any card granted somewhere in the building
+ADMIN_SET_STATUS_SQL = '''
+    UPDATE cards SET status = %s
+    WHERE id = %s AND id IN (SELECT ca.card_id FROM card_access ca
+                             JOIN access_points ap ON ap.id = ca.access_point_id
+                             WHERE ap.building_id = %s)
+    RETURNING id, uid_hex(card_uid), status, updated_at, user_id
+'''
+
+
+def access_list_json(building_id, result):
+    return {
+        'building_id': building_id,
+        'version': result['version'],
+        'since': result['since'],
+        'full': result['since'] is None,
+        'allowed': sorted(result['allowed']),
+        'revoked': sorted(result['revoked']),
+        'removed': sorted(result['removed']),
+    }
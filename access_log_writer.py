@@ -0,0 +1,376 @@
+import os
+import glob
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import datetime
+import threading
+import psycopg2
+from psycopg2.extras import execute_values
+from prometheus_client import Counter, Gauge, Histogram
+from db import get_db_connection, PoolTimeout
+from schedule import naive_utc
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics
+LOG_QUEUE_DEPTH = Gauge(
+    'access_log_queue_depth',
+    'Access log records waiting to be flushed',
+    multiprocess_mode='livesum'
+)
+
+LOG_FLUSH_LATENCY = Histogram(
+    'access_log_flush_duration_seconds',
+    'Time to write one batch of access log records',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+LOG_WRITTEN = Counter(
+    'access_log_records_written_total',
+    'Access log records written to Postgres',
+    ['source']
+)
+
+LOG_SPILLED = Counter(
+    'access_log_records_spilled_total',
+    'Access log records written to the local journal because Postgres was unreachable'
+)
+
+LOG_DROPPED = Counter(
+    'access_log_records_dropped_total',
+    'Access log records lost',
+    ['reason']
+)
+
+LOG_DEAD_LETTERED = Counter(
+    'access_log_records_dead_lettered_total',
+    'Access log records Postgres kept rejecting, moved to the dead-letter file'
+)
+
+# Errors that say nothing about the rows themselves; anything else is
+# narrowed down to the record that caused it
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+# Rejected records go back to the journal until they have failed this often
+MAX_ATTEMPTS = int(os.getenv('ACCESS_LOG_MAX_ATTEMPTS', '5'))
+DEAD_LETTER_NAME = 'access_logs.dead'
+
+# Rows skipped by ON CONFLICT are not RETURNed, so replays never double-count rollups
+_WRITE_CTES = '''
+    WITH inserted AS (
+        INSERT INTO access_logs (id, card_id, access_point_id, access_granted, timestamp)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        RETURNING id, card_id, access_point_id, timestamp, access_granted
+    ), hourly AS (
+        INSERT INTO access_log_hourly (access_point_id, bucket, granted_count, denied_count)
+        SELECT access_point_id, date_trunc('hour', timestamp),
+               count(*) FILTER (WHERE access_granted), count(*) FILTER (WHERE NOT access_granted)
+        FROM inserted GROUP BY 1, 2 ORDER BY 1, 2
+        ON CONFLICT (access_point_id, bucket) DO UPDATE SET
+            granted_count = access_log_hourly.granted_count + EXCLUDED.granted_count,
+            denied_count = access_log_hourly.denied_count + EXCLUDED.denied_count
+    ), daily AS (
+        INSERT INTO access_log_daily (access_point_id, bucket, granted_count, denied_count)
+        SELECT access_point_id, date_trunc('day', timestamp),
+               count(*) FILTER (WHERE access_granted), count(*) FILTER (WHERE NOT access_granted)
+        FROM inserted GROUP BY 1, 2 ORDER BY 1, 2
+        ON CONFLICT (access_point_id, bucket) DO UPDATE SET
+            granted_count = access_log_daily.granted_count + EXCLUDED.granted_count,
+            denied_count = access_log_daily.denied_count + EXCLUDED.denied_count
+    )
+'''
+
+INSERT_SQL = _WRITE_CTES + 'SELECT count(*) FROM inserted'
+
+# Also announce every new row on NOTIFY access_events for the live event
+# stream; the notifications are delivered when the batch commits
+EVENTS_CHANNEL = 'access_events'
+INSERT_NOTIFY_SQL = _WRITE_CTES + f'''
+    , notified AS (
+        SELECT pg_notify('{EVENTS_CHANNEL}', json_build_object(
+            'type', 'access',
+            'id', inserted.id,
+            'card_id', inserted.card_id,
+            'access_point_id', inserted.access_point_id,
+            'building_id', ap.building_id,
+            'granted', inserted.access_granted,
+            'timestamp', inserted.timestamp
+        )::text)
+        FROM inserted JOIN access_points ap ON ap.id = inserted.access_point_id
+    )
+    SELECT count(*) FROM notified
+'''
+
+
+class AccessLogWriter:
+    """Buffer access decisions and write them to ``access_logs`` in batches.
+
+    ``submit`` only enqueues. A background thread flushes when
+    ``batch_size`` records are waiting or ``flush_interval`` seconds have
+    passed, bumping the hourly and daily rollups in the same statement.
+    Records carry a client-side UUID, so a batch replayed from the
+    journal after a failure is inserted at most once. A batch Postgres
+    rejects is halved until the offending records are isolated; those go
+    to the journal and, after ``max_attempts`` failed writes, to
+    ``access_logs.dead`` next to it. With ``notify`` each inserted row is
+    also published on ``NOTIFY access_events``.
+    """
+
+    def __init__(self, maxsize=10000, batch_size=500, flush_interval=0.5, block_timeout=0.01,
+                 journal_path=None, notify=False, max_attempts=MAX_ATTEMPTS):
+        self.insert_sql = INSERT_NOTIFY_SQL if notify else INSERT_SQL
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.journal_path = journal_path
+        self.dead_letter_path = os.path.join(os.path.dirname(journal_path), DEAD_LETTER_NAME) if journal_path else None
+        self.max_attempts = max_attempts
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._journal_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        if journal_path:
+            self._adopt_orphaned_journals()
+        self._thread = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, card_id, access_point_id, granted, timestamp=None):
+        """Queue one access decision; returns False if it had to be dropped.
+
+        When the queue is full the caller waits up to ``block_timeout``
+        seconds for the flusher to catch up before the record is dropped.
+        ``timestamp`` is stored as naive UTC; see ``schedule.naive_utc``.
+        """
+        record = (
+            str(uuid.uuid4()),
+            card_id,
+            access_point_id,
+            bool(granted),
+            naive_utc(timestamp)
+        )
+        try:
+            self._queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            LOG_DROPPED.labels(reason='queue_full').inc()
+            return False
+        LOG_QUEUE_DEPTH.inc()
+        return True
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if batch:
+            LOG_QUEUE_DEPTH.dec(len(batch))
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            elif self._has_journal():
+                self._replay_journal()
+
+    def _has_journal(self):
+        if not self.journal_path:
+            return False
+        return os.path.exists(self.journal_path) or os.path.exists(self.journal_path + '.replaying')
+
+    def _adopt_orphaned_journals(self):
+        """Take over journals left behind by workers that have exited."""
+        directory = os.path.dirname(self.journal_path)
+        for path in glob.glob(os.path.join(directory, 'access_logs.*.journal*')):
+            if path.startswith(self.journal_path):
+                continue
+            try:
+                pid = int(os.path.basename(path).split('.')[1])
+                os.kill(pid, 0)
+                continue  # owner is still running
+            except (ValueError, ProcessLookupError):
+                pass
+            except PermissionError:
+                continue
+            try:
+                with self._journal_lock, open(path) as orphan, open(self.journal_path, 'a') as journal:
+                    for line in orphan:
+                        journal.write(line)
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Could not adopt access log journal {path}: {str(e)}")
+
+    def _write(self, records, source):
+        started = time.perf_counter()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            execute_values(cur, self.insert_sql, records, page_size=self.batch_size)
+            conn.commit()
+            cur.close()
+        LOG_FLUSH_LATENCY.observe(time.perf_counter() - started)
+        LOG_WRITTEN.labels(source=source).inc(len(records))
+
+    def _write_isolating(self, records, source):
+        """Write ``records``, halving them on errors that are not about the connection.
+
+        Returns ``(record, error)`` for every record that failed on its own;
+        the rest are written.
+        """
+        try:
+            self._write(records, source)
+            return []
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            if len(records) == 1:
+                return [(records[0], e)]
+        middle = len(records) // 2
+        return self._write_isolating(records[:middle], source) + self._write_isolating(records[middle:], source)
+
+    def _flush(self, batch):
+        try:
+            rejected = self._write_isolating(batch, 'queue')
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Access log flush failed, spilling {len(batch)} records: {str(e)}")
+            self._spill(batch)
+            return
+        if rejected:
+            logger.error(f"Access log flush rejected {len(rejected)} of {len(batch)} records, "
+                         f"journaling them for retry: {str(rejected[0][1])}")
+            if self.journal_path:
+                self._spill([record for record, _ in rejected], attempts=1)
+            else:
+                LOG_DROPPED.labels(reason='write_error').inc(len(rejected))
+
+    def _spill(self, batch, attempts=0):
+        if not self.journal_path:
+            LOG_DROPPED.labels(reason='db_unreachable').inc(len(batch))
+            return
+        try:
+            with self._journal_lock, open(self.journal_path, 'a') as journal:
+                for record in batch:
+                    journal.write(_journal_line(record, attempts))
+                journal.flush()
+                os.fsync(journal.fileno())
+            LOG_SPILLED.inc(len(batch))
+        except OSError as e:
+            logger.error(f"Access log journal write failed: {str(e)}")
+            LOG_DROPPED.labels(reason='journal_error').inc(len(batch))
+
+    def _dead_letter(self, record, attempts, error):
+        try:
+            with open(self.dead_letter_path, 'a') as dead:
+                dead.write(json.dumps(_journal_fields(record, attempts) + [str(error)]) + '\n')
+            LOG_DEAD_LETTERED.inc()
+        except OSError as e:
+            logger.error(f"Access log dead-letter write failed: {str(e)}")
+            LOG_DROPPED.labels(reason='journal_error').inc()
+
+    def _replay_batch(self, batch, attempts):
+        for record, error in self._write_isolating(batch, 'journal'):
+            tries = attempts.get(record[0], 0) + 1
+            if tries >= self.max_attempts:
+                logger.error(f"Access log record {record[0]} rejected {tries} times, dead-lettering it: {str(error)}")
+                self._dead_letter(record, tries, error)
+            else:
+                self._spill([record], attempts=tries)
+
+    def _replay_journal(self):
+        """Move journaled records into Postgres once it is reachable again.
+
+        Records Postgres rejects are journaled again with their attempt
+        count, so they never hold up the entries after them.
+        """
+        replaying = self.journal_path + '.replaying'
+        with self._journal_lock:
+            if not os.path.exists(replaying):
+                if not os.path.exists(self.journal_path):
+                    return
+                os.replace(self.journal_path, replaying)
+        try:
+            with open(replaying) as journal:
+                batch = []
+                attempts = {}
+                for line in journal:
+                    try:
+                        fields = json.loads(line)
+                        record_id, card_id, ap_id, granted, timestamp = fields[:5]
+                        timestamp = datetime.datetime.fromisoformat(timestamp)
+                    except (ValueError, TypeError):
+                        LOG_DROPPED.labels(reason='journal_corrupt').inc()
+                        continue
+                    batch.append((record_id, card_id, ap_id, granted, timestamp))
+                    if len(fields) > 5:
+                        attempts[record_id] = fields[5]
+                    if len(batch) >= self.batch_size:
+                        self._replay_batch(batch, attempts)
+                        batch = []
+                        attempts = {}
+                if batch:
+                    self._replay_batch(batch, attempts)
+            os.remove(replaying)
+        except CONNECTION_ERRORS:
+            # Still unreachable; keep the file and retry on the next idle tick
+            self._stop_event.wait(self.flush_interval)
+        except Exception as e:
+            logger.error(f"Access log journal replay failed: {str(e)}")
+            self._stop_event.wait(self.flush_interval)
+
+    def close(self, timeout=5.0):
+        """Stop the flusher and write out whatever is still queued."""
+        self._stop_event.set()
+        self._thread.join(timeout)
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            LOG_QUEUE_DEPTH.dec(len(batch))
+            self._flush(batch)
+
+
+def _journal_fields(record, attempts=0):
+    record_id, card_id, ap_id, granted, timestamp = record
+    fields = [record_id, card_id, ap_id, granted, timestamp.isoformat()]
+    return fields + [attempts] if attempts else fields
+
+
+def _journal_line(record, attempts=0):
+    return json.dumps(_journal_fields(record, attempts)) + '\n'
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return this process's access log writer, starting it on first use."""
+    global _writer
+    pid = os.getpid()
+    if _writer is not None and _writer.pid == pid:
+        return _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != pid:
+            journal_dir = os.getenv('ACCESS_LOG_JOURNAL_DIR', os.getenv('LOG_DIR', '/app/logs'))
+            _writer = AccessLogWriter(
+                maxsize=int(os.getenv('ACCESS_LOG_QUEUE_SIZE', '10000')),
+                batch_size=int(os.getenv('ACCESS_LOG_BATCH_SIZE', '500')),
+                flush_interval=float(os.getenv('ACCESS_LOG_FLUSH_INTERVAL', '0.5')),
+                block_timeout=float(os.getenv('ACCESS_LOG_BLOCK_TIMEOUT', '0.01')),
+                journal_path=os.path.join(journal_dir, f'access_logs.{pid}.journal'),
+                notify=os.getenv('ACCESS_EVENTS_NOTIFY', '1') == '1',
+            )
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,1001 @@
+"""Asyncio serving mode: the routes of ``web_server.py`` on Starlette.
+
+Request-path queries use a psycopg 3 async pool so the ``%s`` SQL stays
+shared with the WSGI app. Start with ``SERVER_MODE=asgi python serve.py``.
+"""
+import os
+import math
+import asyncio
+import time
+import secrets
+import logging
+import contextlib
+from datetime import datetime
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST
+from psycopg import AsyncCursor, OperationalError
+from psycopg.pq import TransactionStatus
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse as BaseJSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from db import POOL_WAIT, POOL_IN_USE, POOL_TIMEOUTS, ASYNC_POOL_OPEN, PoolTimeout as SyncPoolTimeout
+from instrumentation import begin_request, end_request, observe, timed, metrics_payload
+from logging_config import configure_logging, request_id_var, request_id_from, log_request
+from streaming import (
+    CARD_COLUMNS, LOCATION_COLUMNS, NDJSON_MIMETYPE, DEFAULT_ITERSIZE, PageArgsError,
+    parse_page_args, build_keyset_query, encode_chunk, dumps
+)
+from http_compression import (
+    MIN_BYTES as COMPRESS_MIN_BYTES, StreamCompressor, negotiate, should_compress, weak_etag, compress
+)
+from bulk_ingest import (
+    BulkParseError, parse_upload, validate_rows, keep_own_rows, rows_to_csv, collect_results,
+    STAGE_SQL, COPY_SQL, DROP_UNKNOWN_USERS_SQL, MOVE_SQL
+)
+from access_engine import get_index
+from access_log_writer import get_writer
+from sightings import get_tracker
+from dashboard import DashboardArgsError, parse_dashboard_args, build_dashboard_query
+from tenants import (
+    UNSCOPED, BUILDING_ADMIN_SQL, ADMIN_BUILDINGS_SQL, TenantArgsError, parse_tenant_id, user_scope,
+    building_cards_scope, shape_admin_buildings
+)
+from handlers import (
+    INSERT_CARD_SQL, INSERT_LOCATION_SQL, LOGIN_SQL, REHASH_SQL, BodyError, card_params, location_params,
+    parse_login, login_body, parse_check, invalidate_user_lists
+)
+from cache import cache_from_env
+from access_history import (
+    HistoryArgsError, parse_history_args, stats_filters,
+    build_logs_query, shape_logs, build_stats_query, shape_stats
+)
+from auth import (
+    VerifierBusy, VerifierTimeout, RateLimited, login_limiter_from_env, session_tokens_from_env,
+    get_verifier, hash_rounds, bearer_token
+)
+from sync_changes import (
+    SyncArgsError, VERSION_SQL, version_params, parse_sync_args, build_sync_query, shape_changes,
+    list_etag, etag_matches, user_id_from_claims
+)
+from access_lists import (
+    AccessListArgsError, MEDIA_TYPE, CARD_STATUSES, OWNER_STATUSES, SET_STATUS_SQL, ADMIN_SET_STATUS_SQL,
+    PURGED_SQL, VERSION_SQL as LIST_VERSION_SQL, FULL_SQL, DIFF_SQL, parse_access_list_args, access_list_params,
+    shape_diff, shape_full, encode_access_list, access_list_json, controller_token_valid
+)
+from events import (
+    EventArgsError, KEEPALIVE_SECONDS, Subscriber, parse_event_filters, scope_event_filters, format_sse,
+    format_dropped, get_hub
+)
+
+load_dotenv()
+
+log_dir = os.getenv('LOG_DIR', '/app/logs')
+configure_logging(os.path.join(log_dir, 'app.log'))
+logger = logging.getLogger('asgi_server')
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+SECRET_KEY = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+login_limiter = login_limiter_from_env()
+session_tokens = session_tokens_from_env(SECRET_KEY)
+
+BUSY = {'error': 'Database busy, retry later'}
+
+# Lists are read straight from the database here, but web_server workers
+# sharing CACHE_REDIS_URL must still see our writes
+list_cache = cache_from_env('lists')
+
+
+async def check_connection(conn):
+    """Cheap checkout check: drop connections already known to be dead, without a round-trip."""
+    if conn.closed or conn.broken:
+        raise OperationalError('connection is closed')
+
+
+class TimedAsyncCursor(AsyncCursor):
+    """Adds statement time to the current request's ``db`` phase."""
+
+    async def execute(self, query, params=None, **kwargs):
+        with timed('db'):
+            return await super().execute(query, params, **kwargs)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        with timed('db'):
+            return await super().executemany(query, params_seq, **kwargs)
+
+
+class JSONResponse(BaseJSONResponse):
+    """Encodes with orjson, timed as the request's ``serialize`` phase."""
+
+    def render(self, content):
+        with timed('serialize'):
+            return dumps(content)
+
+
+pool = AsyncConnectionPool(
+    os.getenv('DATABASE_URL'),
+    min_size=int(os.getenv('DB_POOL_MIN', '1')),
+    max_size=int(os.getenv('DB_POOL_MAX', '10')),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    max_lifetime=float(os.getenv('DB_POOL_MAX_AGE', '1800')),
+    check=check_connection,
+    # The Supabase pooler runs in transaction mode, which breaks prepared statements.
+    # Reads autocommit, so no connection goes back to the pool mid-transaction;
+    # writes open ``conn.transaction()``.
+    kwargs={'prepare_threshold': None, 'cursor_factory': TimedAsyncCursor, 'autocommit': True},
+    open=False,
+)
+
+
+async def checkout():
+    started = time.perf_counter()
+    try:
+        conn = await pool.getconn()
+    except PoolTimeout:
+        POOL_TIMEOUTS.inc()
+        raise
+    finally:
+        waited = time.perf_counter() - started
+        POOL_WAIT.observe(waited)
+        observe('pool_wait', waited)
+        # The pool grows on checkout, so the gauge is current between scrapes
+        ASYNC_POOL_OPEN.set(pool.get_stats().get('pool_size', 0))
+    POOL_IN_USE.inc()
+    return conn
+
+
+async def checkin(conn):
+    POOL_IN_USE.dec()
+    await pool.putconn(conn)
+    ASYNC_POOL_OPEN.set(pool.get_stats().get('pool_size', 0))
+
+
+async def invalidate_lists(table, user_ids):
+    """``invalidate_user_lists`` off the event loop; the shared tier is a Redis round trip."""
+    await run_in_threadpool(invalidate_user_lists, list_cache, table, user_ids)
+
+
+@contextlib.asynccontextmanager
+async def connection():
+    """Check out a pooled async connection, in autocommit mode."""
+    conn = await checkout()
+    try:
+        yield conn
+    finally:
+        await checkin(conn)
+
+
+async def end_transaction(conn):
+    """Roll back a transaction begun by hand, so the connection goes back idle."""
+    if conn.info.transaction_status == TransactionStatus.IDLE:
+        return
+    try:
+        await conn.rollback()
+    except Exception as e:
+        # The pool discards a connection it cannot reset
+        logger.warning(f"Could not end transaction: {str(e)}")
+
+
+async def metrics(request):
+    """Expose Prometheus metrics."""
+    stats = pool.get_stats()
+    ASYNC_POOL_OPEN.set(stats.get('pool_size', 0))
+    return Response(metrics_payload(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+async def health_check(request):
+    """Health check endpoint."""
+    return JSONResponse({'status': 'healthy'})
+
+
+async def index(request):
+    return PlainTextResponse("Backend is running!")
+
+
+async def json_body(request):
+    """The request's JSON body, or None if it is missing or malformed."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def wants_ndjson(request):
+    if request.query_params.get('format') == 'ndjson':
+        return True
+    return NDJSON_MIMETYPE in request.headers.get('accept', '')
+
+
+async def stream_table(request, table, columns, label, scope=UNSCOPED):
+    """Stream a keyset page of ``table`` within ``scope`` as JSON or NDJSON, with an ETag."""
+    try:
+        limit, after = parse_page_args(request.query_params)
+    except PageArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    ndjson = wants_ndjson(request)
+    query, params = build_keyset_query(table, columns, after=after, limit=limit,
+                                       where=scope.where, params=scope.params)
+    try:
+        conn = await checkout()
+    except PoolTimeout as e:
+        logger.warning(f"Error getting {label}: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(VERSION_SQL, version_params(table, *scope.tables))
+            version = await cur.fetchone()
+        etag = list_etag(table, version[0] if version else None, scope.key, limit, after, ndjson)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            await checkin(conn)
+            return Response(status_code=304, headers=headers)
+        # A server-side cursor only lives inside a transaction; see ``end_transaction``
+        await conn.execute('BEGIN')
+        cur = conn.cursor(name=f'stream_{table}')
+        await cur.execute(query, params)
+    except Exception as e:
+        await end_transaction(conn)
+        await checkin(conn)
+        logger.error(f"Error getting {label}: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+    async def body():
+        try:
+            if not ndjson:
+                yield b'['
+            first = True
+            while True:
+                rows = await cur.fetchmany(DEFAULT_ITERSIZE)
+                if not rows:
+                    break
+                chunk, first = encode_chunk(rows, columns, ndjson, first)
+                yield chunk
+            if not ndjson:
+                yield b']'
+        except Exception as e:
+            logger.error(f"Error streaming rows: {str(e)}")
+            raise
+        finally:
+            try:
+                await cur.close()
+            finally:
+                await end_transaction(conn)
+                await checkin(conn)
+
+    return StreamingResponse(body(), media_type=NDJSON_MIMETYPE if ndjson else 'application/json',
+                             headers=headers)
+
+
+async def get_cards(request):
+    """Get the session user's cards, ordered by id; see ``web_server.get_cards``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    return await stream_table(request, 'cards', CARD_COLUMNS, 'cards', user_scope(user_id))
+
+
+async def stream_user_table(request, table, columns, label):
+    """``stream_table`` over the session user's own rows; see ``web_server.stream_user_table``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    session_user = user_id_from_claims(claims) if claims else None
+    if session_user is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        user_id = parse_tenant_id(request.path_params['user_id'], 'user_id')
+    except TenantArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    if user_id != session_user:
+        return JSONResponse({'error': 'Access denied'}, 403)
+    return await stream_table(request, table, columns, label, user_scope(user_id))
+
+
+async def get_user_cards(request):
+    """Get the session user's cards; see ``web_server.get_user_cards``."""
+    return await stream_user_table(request, 'cards', CARD_COLUMNS, 'user cards')
+
+
+async def get_building_cards(request):
+    """Get the cards granted in a building; see ``web_server.get_building_cards``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        building_id = parse_tenant_id(request.path_params['building_id'], 'building_id')
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(BUILDING_ADMIN_SQL, {'building_id': building_id, 'user_id': user_id})
+                allowed = (await cur.fetchone())[0]
+    except TenantArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting building cards: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting building cards: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    if not allowed:
+        return JSONResponse({'error': 'Access denied'}, 403)
+    return await stream_table(request, 'cards', CARD_COLUMNS, 'building cards', building_cards_scope(building_id))
+
+
+async def add_card(request):
+    """Add a card for the session user; see ``web_server.add_card``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        params = card_params(user_id, await json_body(request))
+    except BodyError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        async with connection() as conn, conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(INSERT_CARD_SQL, params)
+        await invalidate_lists('cards', [user_id])
+        return JSONResponse({'message': 'Card added successfully'}, 201)
+    except PoolTimeout as e:
+        logger.warning(f"Error adding card: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error adding card: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def add_cards_bulk(request):
+    """Enroll many cards in one transaction; see ``web_server.add_cards_bulk``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None:
+            return JSONResponse({'error': 'Missing file field'}, 400)
+        body, content_type = await upload.read(), upload.content_type
+        if upload.filename and upload.filename.lower().endswith('.csv'):
+            content_type = 'text/csv'
+    else:
+        body, content_type = await request.body(), request.headers.get('content-type')
+    try:
+        records = await run_in_threadpool(parse_upload, body, content_type)
+    except (BulkParseError, UnicodeDecodeError) as e:
+        return JSONResponse({'error': f'Could not parse upload: {str(e)}'}, 400)
+    max_rows = int(os.getenv('BULK_MAX_ROWS', '100000'))
+    if len(records) > max_rows:
+        return JSONResponse({'error': f'Upload exceeds {max_rows} rows'}, 413)
+
+    inserted = 0
+    try:
+        rows, errors = await run_in_threadpool(validate_rows, records, user_id)
+        if rows and any(row[1] != user_id for row in rows):
+            async with connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(ADMIN_BUILDINGS_SQL, {'user_id': user_id})
+                    if shape_admin_buildings(await cur.fetchone()) == frozenset():
+                        rows = keep_own_rows(rows, errors, user_id)
+        if rows:
+            payload = await run_in_threadpool(lambda: rows_to_csv(rows).getvalue())
+            async with connection() as conn, conn.transaction():
+                async with conn.cursor() as cur:
+                    await cur.execute(STAGE_SQL)
+                    async with cur.copy(COPY_SQL) as copy:
+                        await copy.write(payload)
+                    await cur.execute(DROP_UNKNOWN_USERS_SQL)
+                    unknown_users = await cur.fetchall()
+                    await cur.execute(MOVE_SQL)
+                    moved = await cur.fetchall()
+            inserted, db_errors = collect_results(unknown_users, moved)
+            errors.extend(db_errors)
+            if inserted:
+                await invalidate_lists('cards', [row[1] for row in rows])
+    except PoolTimeout as e:
+        logger.warning(f"Error adding cards in bulk: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error adding cards in bulk: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    errors.sort(key=lambda err: err['row'])
+    return JSONResponse({
+        'received': len(records),
+        'inserted': inserted,
+        'failed': len(errors),
+        'errors': errors
+    }, 201 if inserted else 200)
+
+
+async def card_status_body(request):
+    data = await json_body(request)
+    return data.get('status') if isinstance(data, dict) else None
+
+
+async def card_status_response(row):
+    if row is None:
+        return JSONResponse({'error': 'Card not found'}, 404)
+    await invalidate_lists('cards', [str(row[4])])
+    return JSONResponse({
+        'id': str(row[0]), 'card_uid': row[1], 'status': row[2], 'updated_at': row[3].isoformat()
+    })
+
+
+async def set_card_status(request):
+    """Report a card lost or suspend it; see ``web_server.set_card_status``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    status = await card_status_body(request)
+    if status not in OWNER_STATUSES:
+        return JSONResponse({'error': f"status must be one of {', '.join(OWNER_STATUSES)}"}, 400)
+    try:
+        card_id = parse_tenant_id(request.path_params['card_id'], 'card_id')
+        async with connection() as conn, conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(SET_STATUS_SQL, (status, card_id, user_id))
+                row = await cur.fetchone()
+    except TenantArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error setting card status: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error setting card status: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    return await card_status_response(row)
+
+
+async def set_building_card_status(request):
+    """Set the status of a card granted in a building; see ``web_server.set_building_card_status``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    status = await card_status_body(request)
+    if status not in CARD_STATUSES:
+        return JSONResponse({'error': f"status must be one of {', '.join(CARD_STATUSES)}"}, 400)
+    try:
+        building_id = parse_tenant_id(request.path_params['building_id'], 'building_id')
+        card_id = parse_tenant_id(request.path_params['card_id'], 'card_id')
+        async with connection() as conn, conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(BUILDING_ADMIN_SQL, {'building_id': building_id, 'user_id': user_id})
+                if not (await cur.fetchone())[0]:
+                    return JSONResponse({'error': 'Access denied'}, 403)
+                await cur.execute(ADMIN_SET_STATUS_SQL, (status, card_id, building_id))
+                row = await cur.fetchone()
+    except TenantArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error setting card status: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error setting card status: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    return await card_status_response(row)
+
+
+async def get_effective_access(request):
+    """Audit view of a card's compiled permissions; see ``web_server.get_effective_access``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    when = None
+    if request.query_params.get('at'):
+        try:
+            when = datetime.fromisoformat(request.query_params['at'])
+        except ValueError:
+            return JSONResponse({'error': 'at must be ISO-8601'}, 400)
+    try:
+        # The first call in a process loads the index from the database
+        index = await run_in_threadpool(get_index)
+    except (PoolTimeout, SyncPoolTimeout) as e:
+        logger.warning(f"Error loading access index: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error loading access index: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    result = index.effective_access(request.path_params['card_id'], when)
+    if result is None or result['user_id'] != user_id:
+        return JSONResponse({'error': 'Card not found'}, 404)
+    return JSONResponse(result)
+
+
+async def get_access_list(request):
+    """Versioned access list of a building; see ``web_server.get_access_list``."""
+    token = bearer_token(request) or ''
+    admin_id = None
+    if not controller_token_valid(token):
+        claims = session_tokens.verify(token)
+        admin_id = user_id_from_claims(claims) if claims else None
+        if admin_id is None:
+            return JSONResponse({'error': 'Invalid or expired token'}, 401)
+    try:
+        building_id, since, bloom = parse_access_list_args(request.path_params['building_id'], request.query_params)
+        params = access_list_params(building_id, since)
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                if admin_id is not None:
+                    await cur.execute(BUILDING_ADMIN_SQL, {'building_id': building_id, 'user_id': admin_id})
+                    if not (await cur.fetchone())[0]:
+                        return JSONResponse({'error': 'Access denied'}, 403)
+                await cur.execute(PURGED_SQL)
+                row = await cur.fetchone()
+                purged_through = row[0] if row else 0
+                if since is not None and since >= purged_through:
+                    await cur.execute(DIFF_SQL, params)
+                    result = shape_diff(since, purged_through, await cur.fetchall())
+                else:
+                    await cur.execute(LIST_VERSION_SQL, params)
+                    version = (await cur.fetchone())[0]
+                    await cur.execute(FULL_SQL, params)
+                    result = shape_full(version, purged_through, await cur.fetchall())
+    except AccessListArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting access list: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting access list: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    as_json = 'application/json' in request.headers.get('accept', '')
+    etag = list_etag('access_list', result['version'], building_id, result['since'], bloom, as_json)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Access-List-Version': str(result['version'])}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    if as_json:
+        return JSONResponse(access_list_json(building_id, result), headers=headers)
+    body = await run_in_threadpool(encode_access_list, building_id, result, bloom)
+    return Response(body, media_type=MEDIA_TYPE, headers=headers)
+
+
+async def get_locations(request):
+    """Get the session user's locations, ordered by id; paginated like ``get_cards``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    return await stream_table(request, 'locations', LOCATION_COLUMNS, 'locations', user_scope(user_id))
+
+
+async def get_user_locations(request):
+    """Get the session user's locations; see ``web_server.get_user_locations``."""
+    return await stream_user_table(request, 'locations', LOCATION_COLUMNS, 'user locations')
+
+
+async def add_location(request):
+    """Add a location for the session user; see ``web_server.add_location``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        params = location_params(user_id, await json_body(request))
+    except BodyError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        async with connection() as conn, conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(INSERT_LOCATION_SQL, params)
+        await invalidate_lists('locations', [user_id])
+        return JSONResponse({'message': 'Location added successfully'}, 201)
+    except PoolTimeout as e:
+        logger.warning(f"Error adding location: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error adding location: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+def record_tap(decision, card_uid, access_point_id, when):
+    """Queue the access log row and sighting of one decision; blocks briefly when the log queue is full."""
+    get_writer().submit(decision.card_id, access_point_id, decision.granted, when)
+    get_tracker().record(decision.user_id, card_uid, when)
+
+
+async def check_access(request):
+    """Decide whether a card may open an access point; see ``web_server.check_access``."""
+    try:
+        card_uid, access_point_id, when = parse_check(await json_body(request))
+    except BodyError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        index = await run_in_threadpool(get_index)
+    except (PoolTimeout, SyncPoolTimeout) as e:
+        logger.warning(f"Error loading access index: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error loading access index: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    decision = index.check(card_uid, access_point_id, when)
+    if decision.card_id and decision.reason != 'unknown_access_point':
+        await run_in_threadpool(record_tap, decision, card_uid, access_point_id, when)
+    return JSONResponse(decision.to_dict())
+
+
+
+async def sync_changes(request):
+    """Changes since a watermark for the session's user; see ``web_server.sync_changes``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        since, limit, reset = parse_sync_args(request.query_params)
+        query, params = build_sync_query(user_id, since, limit)
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+        return JSONResponse(shape_changes(rows, limit, since, reset))
+    except SyncArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting changes: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting changes: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def get_dashboard(request):
+    """The session user's dashboard in one statement; see ``web_server.get_dashboard``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        query, params = build_dashboard_query(user_id, *parse_dashboard_args(request.query_params))
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                row = await cur.fetchone()
+        return Response(row[0], media_type='application/json')
+    except DashboardArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting dashboard: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting dashboard: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def event_stream(request):
+    """Live access and card status events; see ``web_server.event_stream``.
+
+    Streams wait on an asyncio.Event rather than a thread, so one worker
+    can hold thousands of them.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        building_ids, access_point_ids = parse_event_filters(request.query_params)
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(ADMIN_BUILDINGS_SQL, {'user_id': user_id})
+                allowed = shape_admin_buildings(await cur.fetchone())
+    except EventArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error opening event stream: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error opening event stream: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+    building_ids = scope_event_filters(building_ids, access_point_ids, allowed)
+    if building_ids is None:
+        return JSONResponse({'error': 'Access denied'}, 403)
+    hub = await run_in_threadpool(get_hub)
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # loop closed while the stream was being torn down
+
+    async def body():
+        # Subscribed once the body is iterated, as in ``web_server.event_stream``
+        subscriber = hub.subscribe(Subscriber(building_ids, access_point_ids, wake=wake, allowed_buildings=allowed))
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                ready.clear()
+                events, dropped = subscriber.drain()
+                if dropped:
+                    yield format_dropped(dropped)
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(body(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def get_access_logs(request):
+    """Get access log entries, newest first; see ``web_server.get_access_logs``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        args = parse_history_args(request.query_params)
+        query, params = build_logs_query(user_id, **args)
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+        items, next_cursor = shape_logs(rows, args['limit'])
+        return JSONResponse({'items': items, 'next': next_cursor})
+    except HistoryArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting access logs: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting access logs: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def get_access_log_stats(request):
+    """Get granted/denied counts per access point; see ``web_server.get_access_log_stats``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    try:
+        args = parse_history_args(request.query_params)
+        query, params = build_stats_query(
+            user_id,
+            granularity=request.query_params.get('granularity', 'hour'),
+            **stats_filters(args)
+        )
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+        items, next_cursor = shape_stats(rows, args['limit'])
+        return JSONResponse({'items': items, 'next': next_cursor})
+    except HistoryArgsError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except PoolTimeout as e:
+        logger.warning(f"Error getting access log stats: {str(e)}")
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        logger.error(f"Error getting access log stats: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def api_login(request):
+    """Verify a password and issue a session token; see ``web_server.api_login``."""
+    try:
+        email, password = parse_login(await json_body(request))
+    except BodyError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    try:
+        login_limiter.hit(email.lower())
+    except RateLimited as e:
+        return JSONResponse({'error': str(e)}, 429, {'Retry-After': str(math.ceil(e.retry_after))})
+    try:
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(LOGIN_SQL, (email,))
+                result = await cur.fetchone()
+        user_id, stored_hash = result if result else (None, None)
+        if isinstance(stored_hash, str):
+            stored_hash = stored_hash.encode('utf-8')
+        # Normally started by ``lifespan``; starting it spawns processes, so never on the loop
+        verifier = await run_in_threadpool(get_verifier)
+        if not await verifier.check_async(password.encode('utf-8'), stored_hash):
+            return JSONResponse({'error': 'Invalid credentials'}, 401)
+        login_limiter.reset(email.lower())
+        if hash_rounds(stored_hash) != BCRYPT_ROUNDS:
+            await rehash_password(verifier, user_id, password, stored_hash)
+        return JSONResponse(login_body(session_tokens, user_id, email))
+    except VerifierTimeout:
+        return JSONResponse({'error': 'Password check timed out, retry shortly'}, 503, {'Retry-After': '1'})
+    except VerifierBusy:
+        return JSONResponse({'error': 'Too many logins in progress, retry shortly'}, 503, {'Retry-After': '1'})
+    except PoolTimeout:
+        return JSONResponse(BUSY, 503)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def rehash_password(verifier, user_id, password, old_hash):
+    """Store the password again at the configured bcrypt cost."""
+    try:
+        new_hash = await verifier.hash_async(password.encode('utf-8'), BCRYPT_ROUNDS)
+        async with connection() as conn, conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(REHASH_SQL, (new_hash.decode('utf-8'), user_id, old_hash.decode('utf-8')))
+    except Exception as e:
+        logger.warning(f"Could not rehash password for user {user_id}: {str(e)}")
+
+
+async def refresh_session(request):
+    """Exchange a valid session token for a fresh one."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    if claims is None:
+        return JSONResponse({'error': 'Invalid or expired session'}, 401)
+    return JSONResponse({
+        'token': session_tokens.issue(claims['sub'], claims['email']),
+        'expires_in': session_tokens.ttl
+    })
+
+
+class RequestMetricsMiddleware:
+    """Record the same request series and log records as the WSGI app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timings = begin_request()
+        status = {'code': 500}
+        header = dict(scope['headers']).get(b'x-request-id', b'').decode('latin-1')
+        request_id = request_id_from(header)
+        request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = ROUTE_TEMPLATES.get(scope.get('endpoint'))
+            elapsed = end_request(timings, scope['method'], route, status['code'])
+            log_request(scope['method'], scope['path'], route, status['code'], elapsed)
+
+
+class CompressionMiddleware:
+    """Negotiated compression, as ``compress_response`` does for the WSGI app.
+
+    A body sent in one message is compressed whole (and cached by ETag);
+    a streamed body is compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope['headers']).get(b'accept-encoding', b'').decode('latin-1')
+        state = {'start': None, 'encoding': None, 'compressor': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                if not should_compress(message['status'], headers.get('content-type'),
+                                       headers.get('content-encoding')):
+                    await send(message)
+                    return
+                headers.add_vary_header('Accept-Encoding')
+                encoding = negotiate(accept)
+                if encoding is None:
+                    await send(message)
+                    return
+                # Held back until the first body message shows whether it streams
+                state['start'] = message
+                state['encoding'] = encoding
+                return
+            compressor = state['compressor']
+            if message['type'] != 'http.response.body' or (compressor is None and state['start'] is None):
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                start, state['start'] = state['start'], None
+                headers = MutableHeaders(scope=start)
+                if not more_body and len(body) < COMPRESS_MIN_BYTES:
+                    await send(start)
+                    await send(message)
+                    return
+                encoding = state['encoding']
+                etag = headers.get('etag')
+                headers['Content-Encoding'] = encoding
+                if etag:
+                    headers['ETag'] = weak_etag(etag)
+                if not more_body:
+                    body = compress(body, encoding, etag)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                del headers['Content-Length']
+                compressor = state['compressor'] = StreamCompressor(encoding)
+                await send(start)
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await pool.open()
+    try:
+        await run_in_threadpool(get_index)
+    except Exception as e:
+        logger.error(f"Could not preload access index: {str(e)}")
+    # Started here so the first access check does not replay the journal on the event loop
+    await run_in_threadpool(get_writer)
+    await run_in_threadpool(get_tracker)
+    try:
+        await run_in_threadpool(lambda: get_verifier().start())
+    except Exception as e:
+        logger.error(f"Could not start password verifier: {str(e)}")
+    logger.info('Application startup (asgi)')
+    yield
+    await pool.close()
+
+
+routes = [
+    Route('/metrics', metrics),
+    Route('/health', health_check),
+    Route('/', index),
+    Route('/api/cards', get_cards, methods=['GET']),
+    Route('/api/cards', add_card, methods=['POST']),
+    Route('/api/cards/bulk', add_cards_bulk, methods=['POST']),
+    Route('/api/users/{user_id}/cards', get_user_cards, methods=['GET']),
+    Route('/api/users/{user_id}/locations', get_user_locations, methods=['GET']),
+    Route('/api/buildings/{building_id}/cards', get_building_cards, methods=['GET']),
+    Route('/api/cards/{card_id}/status', set_card_status, methods=['PUT']),
+    Route('/api/buildings/{building_id}/cards/{card_id}/status', set_building_card_status, methods=['PUT']),
+    Route('/api/cards/{card_id}/effective-access', get_effective_access, methods=['GET']),
+    Route('/api/buildings/{building_id}/access-list', get_access_list, methods=['GET']),
+    Route('/api/locations', get_locations, methods=['GET']),
+    Route('/api/locations', add_location, methods=['POST']),
+    Route('/api/sync', sync_changes, methods=['GET']),
+    Route('/api/dashboard', get_dashboard, methods=['GET']),
+    Route('/api/events/stream', event_stream, methods=['GET']),
+    Route('/api/access/check', check_access, methods=['POST']),
+    Route('/api/access-logs', get_access_logs, methods=['GET']),
+    Route('/api/access-logs/stats', get_access_log_stats, methods=['GET']),
+    Route('/api/login', api_login, methods=['POST']),
+    Route('/api/session/refresh', refresh_session, methods=['POST']),
+]
+
+# Endpoint -> path template, for bounded metric labels
+ROUTE_TEMPLATES = {route.endpoint: route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(CompressionMiddleware),
+    ],
+    lifespan=lifespan,
+)
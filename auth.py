@@ -0,0 +1,305 @@
+import os
+import time
+import asyncio
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from prometheus_client import Counter, Histogram
+from instrumentation import timed
+from cache import shared_client_from_env
+
+# Prometheus metrics
+BCRYPT_QUEUE_TIME = Histogram(
+    'bcrypt_queue_seconds',
+    'Time a password hash job waited for a free verifier process',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+BCRYPT_HASH_TIME = Histogram(
+    'bcrypt_hash_seconds',
+    'Time spent inside bcrypt per job',
+    ['operation'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+)
+
+LOGIN_REJECTED = Counter(
+    'login_rejected_total',
+    'Login attempts turned away before password verification',
+    ['reason']
+)
+
+
+class VerifierBusy(Exception):
+    """Raised when too many password checks are already queued."""
+
+
+class VerifierTimeout(VerifierBusy):
+    """Raised when a password job did not finish within the verifier's timeout."""
+
+
+class RateLimited(Exception):
+    """Raised when an account has used up its login attempts."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Too many login attempts, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+# Unknown accounts are checked against this, at the configured cost, so they
+# take as long as a wrong password; its password is not one anybody has
+_DUMMY_HASH_TAIL = b'O3bhzAZPs2WCy98PzNQiuuSojrJIk61w76hcpJypj5Pv9ue6QN2wa'
+
+
+def dummy_hash(rounds):
+    return b'$2b$%02d$' % rounds + _DUMMY_HASH_TAIL
+
+
+def hash_rounds(stored_hash):
+    """Return the bcrypt cost factor encoded in ``stored_hash``."""
+    try:
+        return int(stored_hash.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _checkpw(password, stored_hash, submitted_at):
+    started = time.time()
+    ok = bcrypt.checkpw(password, stored_hash)
+    return ok, started - submitted_at, time.time() - started
+
+
+def _hashpw(password, rounds, submitted_at):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, started - submitted_at, time.time() - started
+
+
+class PasswordVerifier:
+    """Run bcrypt in a small process pool with a bounded backlog.
+
+    At most ``max_pending`` jobs may be queued or running per web worker;
+    beyond that callers get ``VerifierBusy`` immediately instead of
+    piling up behind a login burst.
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=10.0, rounds=12):
+        self.pid = os.getpid()
+        self.workers = workers
+        self.timeout = timeout
+        self.rounds = rounds
+        self._dummy_hash = dummy_hash(rounds)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # spawn, not fork: the web worker is multi-threaded
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def start(self):
+        """Spawn every worker process now instead of on the first logins."""
+        futures = [self._executor.submit(time.time) for _ in range(self.workers)]
+        for future in futures:
+            future.result(self.timeout)
+        return self
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            LOGIN_REJECTED.labels(reason='verifier_busy').inc()
+            raise VerifierBusy('Password verification queue is full')
+        try:
+            future = self._executor.submit(fn, *args, time.time())
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _record(operation, outcome):
+        result, queued, spent = outcome
+        BCRYPT_QUEUE_TIME.observe(max(queued, 0.0))
+        BCRYPT_HASH_TIME.labels(operation=operation).observe(spent)
+        return result
+
+    def _run(self, fn, operation, *args):
+        with timed('bcrypt'):
+            try:
+                outcome = self._submit(fn, *args).result(self.timeout)
+            except TimeoutError:
+                LOGIN_REJECTED.labels(reason='verifier_timeout').inc()
+                raise VerifierTimeout(f'Password {operation} took longer than {self.timeout:g}s')
+            return self._record(operation, outcome)
+
+    async def _run_async(self, fn, operation, *args):
+        with timed('bcrypt'):
+            future = asyncio.wrap_future(self._submit(fn, *args))
+            try:
+                outcome = await asyncio.wait_for(future, self.timeout)
+            except TimeoutError:
+                LOGIN_REJECTED.labels(reason='verifier_timeout').inc()
+                raise VerifierTimeout(f'Password {operation} took longer than {self.timeout:g}s')
+            return self._record(operation, outcome)
+
+    def check(self, password, stored_hash):
+        """Verify ``password``; a None hash still costs one full bcrypt check."""
+        if stored_hash is None:
+            # Unknown accounts take as long as known ones, so timing leaks nothing
+            self._run(_checkpw, 'check', password, self._dummy_hash)
+            return False
+        return self._run(_checkpw, 'check', password, stored_hash)
+
+    def hash(self, password, rounds):
+        return self._run(_hashpw, 'hash', password, rounds)
+
+    async def check_async(self, password, stored_hash):
+        """Awaitable ``check`` for the ASGI server; shares the same pool and backlog."""
+        if stored_hash is None:
+            await self._run_async(_checkpw, 'check', password, self._dummy_hash)
+            return False
+        return await self._run_async(_checkpw, 'check', password, stored_hash)
+
+    async def hash_async(self, password, rounds):
+        return await self._run_async(_hashpw, 'hash', password, rounds)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class LoginRateLimiter:
+    """Per-account token bucket kept in process memory.
+
+    Only the ``max_accounts`` most recently seen accounts are tracked, so
+    a spray across many addresses cannot grow memory without bound.
+    """
+
+    def __init__(self, attempts=5, per_seconds=60.0, max_accounts=10000):
+        self.capacity = float(attempts)
+        self.rate = attempts / per_seconds
+        self.max_accounts = max_accounts
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, account):
+        """Spend one attempt for ``account`` or raise ``RateLimited``."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(account, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens < 1.0:
+                self._buckets[account] = (tokens, now)
+                LOGIN_REJECTED.labels(reason='rate_limited').inc()
+                raise RateLimited((1.0 - tokens) / self.rate)
+            self._buckets[account] = (tokens - 1.0, now)
+            while len(self._buckets) > self.max_accounts:
+                self._buckets.popitem(last=False)
+
+    def reset(self, account):
+        with self._lock:
+            self._buckets.pop(account, None)
+
+
+class SharedLoginRateLimiter:
+    """Login attempts counted in Redis, so the limit holds across workers and hosts.
+
+    Each account gets a fixed window: the first attempt opens it for
+    ``per_seconds`` and at most ``attempts`` fit in it. While Redis cannot
+    be reached, the per-process ``fallback`` limiter is used instead.
+    """
+
+    def __init__(self, client, attempts=5, per_seconds=60.0, fallback=None, prefix='nfc-one:login'):
+        self.client = client
+        self.attempts = attempts
+        self.window_ms = max(1, int(per_seconds * 1000))
+        self.fallback = fallback or LoginRateLimiter(attempts, per_seconds)
+        self.prefix = prefix
+
+    def _key(self, account):
+        return f'{self.prefix}:{account}'
+
+    def hit(self, account):
+        """Spend one attempt for ``account`` or raise ``RateLimited``."""
+        key = self._key(account)
+        try:
+            pipe = self.client.pipeline()
+            # Created with its expiry, so a counter can never outlive its window
+            pipe.set(key, 0, nx=True, px=self.window_ms)
+            pipe.incr(key)
+            pipe.pttl(key)
+            _, count, ttl_ms = pipe.execute()
+        except Exception:
+            self.fallback.hit(account)
+            return
+        if count > self.attempts:
+            LOGIN_REJECTED.labels(reason='rate_limited').inc()
+            raise RateLimited(max(ttl_ms, 0) / 1000)
+
+    def reset(self, account):
+        try:
+            self.client.delete(self._key(account))
+        except Exception:
+            pass
+        self.fallback.reset(account)
+
+
+class SessionTokens:
+    """Short-lived signed session tokens so clients stop resending passwords."""
+
+    def __init__(self, secret_key, ttl=900):
+        self.ttl = ttl
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='one-session')
+
+    def issue(self, user_id, email):
+        return self._serializer.dumps({'sub': str(user_id), 'email': email})
+
+    def verify(self, token):
+        """Return the token's claims, or None if it is invalid or expired."""
+        try:
+            return self._serializer.loads(token, max_age=self.ttl)
+        except (BadSignature, SignatureExpired):
+            return None
+
+
+def login_limiter_from_env():
+    """Shared through ``CACHE_REDIS_URL`` when it is set, else per process."""
+    attempts = int(os.getenv('LOGIN_MAX_ATTEMPTS', '5'))
+    per_seconds = float(os.getenv('LOGIN_WINDOW_SECONDS', '60'))
+    local = LoginRateLimiter(attempts=attempts, per_seconds=per_seconds)
+    client = shared_client_from_env()
+    if client is None:
+        return local
+    return SharedLoginRateLimiter(client, attempts=attempts, per_seconds=per_seconds, fallback=local)
+
+
+def session_tokens_from_env(secret_key):
+    return SessionTokens(secret_key, ttl=int(os.getenv('SESSION_TOKEN_TTL', '900')))
+
+
+def bearer_token(request):
+    header = request.headers.get('Authorization', '')
+    if header.lower().startswith('bearer '):
+        return header[7:].strip()
+    return None
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """Return this process's password verifier, starting it on first use."""
+    global _verifier
+    pid = os.getpid()
+    if _verifier is not None and _verifier.pid == pid:
+        return _verifier
+    with _verifier_lock:
+        if _verifier is None or _verifier.pid != pid:
+            _verifier = PasswordVerifier(
+                workers=int(os.getenv('BCRYPT_WORKERS', '2')),
+                max_pending=int(os.getenv('BCRYPT_MAX_PENDING', '16')),
+                timeout=float(os.getenv('BCRYPT_TIMEOUT', '10')),
+                rounds=int(os.getenv('BCRYPT_ROUNDS', '12')),
+            )
+        return _verifier
@@ -0,0 +1,330 @@
+"""End-to-end API benchmark against a seeded local Postgres.
+
+    python benchmarks/api_suite.py --dsn postgresql://postgres@127.0.0.1/nfc_bench \\
+        --seed-db --scale medium --mix default --mix door --output bench/HEAD.json
+
+Starts the server from this checkout (``--mode wsgi`` runs web_server.py
+under gunicorn, as in production), drives each traffic mix for
+``--duration`` seconds and writes one JSON document: the commit, the data
+set, the server settings and, per mix, throughput, p50/p95/p99 latency
+overall and per request type, and the RSS of every worker.
+
+Rows written by the run (enrolled cards, access log entries) are removed
+afterwards, so repeated runs see the same database. Compare two commits
+with ``--baseline``; the exit status is 1 when any mix got slower than
+``--max-regression`` allows.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import secrets
+import platform
+import subprocess
+import tempfile
+import zlib
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import (  # noqa: E402
+    REPO_ROOT, MemorySampler, Request, run_load, start_server, wait_healthy, stop_server
+)
+from seed import add_scale_arguments, scale_from_args, seed  # noqa: E402
+from auth import SessionTokens  # noqa: E402
+
+# Relative weights of each request type
+MIXES = {
+    'default': {'login': 5, 'list_cards': 20, 'list_locations': 10, 'enroll': 5, 'access_check': 60},
+    'read': {'login': 2, 'list_cards': 55, 'list_locations': 35, 'access_check': 8},
+    'door': {'access_check': 95, 'list_cards': 5},
+    'login': {'login': 60, 'list_cards': 20, 'access_check': 20},
+    'enroll': {'enroll': 50, 'list_cards': 50},
+}
+
+# Cards the run enrolls are tagged so they can be removed afterwards
+ENROLL_CARD_TYPE = 'bench-enroll'
+SAMPLE_SIZE = 2000
+PAGE_SIZE = 100
+TOKEN_TTL = 86400
+
+SAMPLE_QUERIES = {
+    'emails': "SELECT email FROM users WHERE username LIKE 'bench%%' ORDER BY md5(id::text) LIMIT %s",
+    'user_ids': "SELECT id::text FROM users WHERE username LIKE 'bench%%' ORDER BY md5(id::text) LIMIT %s",
+    'card_ids': 'SELECT id::text FROM cards ORDER BY md5(id::text) LIMIT %s',
+    'grants': '''
+        SELECT uid_hex(c.card_uid), ca.access_point_id::text
+        FROM card_access ca JOIN cards c ON c.id = ca.card_id
+        ORDER BY md5(ca.id::text) LIMIT %s
+    ''',
+    'access_points': 'SELECT id::text FROM access_points ORDER BY md5(id::text) LIMIT %s',
+}
+
+RESTORE_SQL = [
+    f"DELETE FROM cards WHERE card_type = '{ENROLL_CARD_TYPE}'",
+    'DELETE FROM access_logs WHERE timestamp >= %(since)s',
+    'DELETE FROM sync_tombstones WHERE deleted_at >= %(since)s',
+    'DELETE FROM access_list_log WHERE changed_at >= %(since)s',
+]
+
+# Rebuild only the rollup buckets the run touched
+RESTORE_ROLLUP_SQL = '''
+    DELETE FROM {rollup} WHERE bucket >= date_trunc('{unit}', %(since)s);
+    INSERT INTO {rollup} (access_point_id, bucket, granted_count, denied_count)
+    SELECT access_point_id, date_trunc('{unit}', timestamp),
+           count(*) FILTER (WHERE access_granted),
+           count(*) FILTER (WHERE NOT access_granted)
+    FROM access_logs
+    WHERE timestamp >= date_trunc('{unit}', %(since)s)
+    GROUP BY 1, 2
+'''
+
+
+def load_samples(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        samples = {}
+        for name, query in SAMPLE_QUERIES.items():
+            cur.execute(query, (SAMPLE_SIZE,))
+            rows = cur.fetchall()
+            samples[name] = [row if len(row) > 1 else row[0] for row in rows]
+        cur.execute('SELECT LOCALTIMESTAMP')
+        samples['now'] = cur.fetchone()[0]
+    finally:
+        conn.close()
+    if not samples['emails'] or not samples['grants']:
+        raise SystemExit('no seeded data found; run with --seed-db or benchmarks/seed.py first')
+    return samples
+
+
+def restore_database(dsn, since):
+    """Remove what a run wrote, so the next run starts from the seeded state."""
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        params = {'since': since}
+        cur.execute(f'''
+            DELETE FROM card_access WHERE card_id IN (
+                SELECT id FROM cards WHERE card_type = '{ENROLL_CARD_TYPE}')
+        ''')
+        for statement in RESTORE_SQL:
+            cur.execute(statement, params)
+        for rollup, unit in (('access_log_hourly', 'hour'), ('access_log_daily', 'day')):
+            cur.execute(RESTORE_ROLLUP_SQL.format(rollup=rollup, unit=unit), params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def parse_mix(value):
+    """A preset name from MIXES, or ``name=weight,...`` pairs."""
+    if value in MIXES:
+        return value, MIXES[value]
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in MIXES['default'] or not weight.isdigit():
+            raise argparse.ArgumentTypeError(
+                f"expected one of {', '.join(MIXES)} or name=weight pairs over {', '.join(MIXES['default'])}")
+        weights[name] = int(weight)
+    return value, weights
+
+
+def build_mix(weights, samples, password, tokens):
+    emails = samples['emails']
+    user_ids = samples['user_ids']
+    card_ids = samples['card_ids']
+    grants = samples['grants']
+    access_points = samples['access_points']
+
+    def access_check(rng):
+        # Mostly granted cards at their doors, some at a random door
+        card_uid, access_point_id = rng.choice(grants)
+        if rng.random() < 0.2:
+            access_point_id = rng.choice(access_points)
+        return {'card_uid': card_uid, 'access_point_id': access_point_id}
+
+    # Lists and enrollment are for the session user; both samples are ordered by md5(id), so they line up
+    sessions = [{'Authorization': f'Bearer {tokens.issue(user_id, email)}'} for user_id, email in zip(user_ids, emails)]
+
+    def user_auth(path):
+        # A stable but spread choice of tenant per path
+        return sessions[zlib.crc32(path.encode()) % len(sessions)]
+    requests = {
+        'login': Request(
+            'login', 'POST', '/api/login',
+            body=lambda rng: {'email': rng.choice(emails), 'password': password}
+        ),
+        'list_cards': Request(
+            'list_cards', 'GET', lambda rng: f'/api/cards?limit={PAGE_SIZE}&after={rng.choice(card_ids)}',
+            headers=user_auth
+        ),
+        'list_locations': Request(
+            'list_locations', 'GET', lambda rng: f'/api/locations?limit={PAGE_SIZE}&after={rng.choice(card_ids)}',
+            headers=user_auth
+        ),
+        'enroll': Request(
+            'enroll', 'POST', '/api/cards/bulk',
+            # user_id defaults to the session user
+            body=lambda rng: [{
+                'card_uid': f'{rng.getrandbits(80):020X}',
+                'card_type': ENROLL_CARD_TYPE,
+            }],
+            headers=sessions[0]
+        ),
+        'access_check': Request('access_check', 'POST', '/api/access/check', body=access_check),
+    }
+    mix = []
+    for name, weight in weights.items():
+        if weight:
+            requests[name].weight = weight
+            mix.append(requests[name])
+    return mix
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def compare(results, baseline, max_regression):
+    """Relative change of throughput and latency percentiles against ``baseline``.
+
+    Returns ``(report, regressed)``; a mix regressed when its overall
+    throughput dropped, or its overall p99 rose, by more than ``max_regression``.
+    """
+    report = {}
+    regressed = False
+    for mix, current in results['mixes'].items():
+        previous = baseline.get('mixes', {}).get(mix)
+        if previous is None:
+            continue
+        report[mix] = {}
+        now_by_name = dict(current['load']['by_request'], overall=current['load']['overall'])
+        before_by_name = dict(previous['load']['by_request'], overall=previous['load']['overall'])
+        for name, now in now_by_name.items():
+            before = before_by_name.get(name)
+            if before is None:
+                continue
+            entry = {}
+            if before['throughput_rps']:
+                entry['throughput'] = round(now['throughput_rps'] / before['throughput_rps'] - 1, 3)
+            for p in ('p50', 'p95', 'p99'):
+                if before['latency_ms'][p] and now['latency_ms'][p] is not None:
+                    entry[p] = round(now['latency_ms'][p] / before['latency_ms'][p] - 1, 3)
+            if name == 'overall':
+                regressed |= entry.get('throughput', 0) < -max_regression
+                regressed |= entry.get('p99', 0) > max_regression
+            report[mix][name] = entry
+    return report, regressed
+
+
+def run_mix(args, weights, server_env):
+    """Run one mix; starts a fresh server for it unless ``--url`` was given."""
+    process = None
+    url = args.url
+    server_pid = args.server_pid
+    if url is None:
+        process = start_server(args.mode, args.port, server_env)
+        url = f'http://127.0.0.1:{args.port}'
+        server_pid = process.pid
+    samples = load_samples(args.dsn)
+    tokens = SessionTokens(server_env['SECRET_KEY'], ttl=TOKEN_TTL)
+    sampler = None
+    try:
+        wait_healthy(url)
+        if server_pid:
+            sampler = MemorySampler(server_pid)
+            sampler.start()
+        load = asyncio.run(run_load(
+            url, build_mix(weights, samples, args.password, tokens),
+            concurrency=args.concurrency, duration=args.duration, warmup=args.warmup, seed=args.seed
+        ))
+    finally:
+        if sampler:
+            sampler.stop()
+        # Stopping first lets the server flush buffered access logs before they are removed
+        if process is not None:
+            stop_server(process)
+        restore_database(args.dsn, samples['now'])
+    return {
+        'weights': weights,
+        'load': load,
+        'memory': sampler.summary() if sampler else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DATABASE_URL'), help='defaults to BENCH_DATABASE_URL')
+    parser.add_argument('--seed-db', action='store_true', help='recreate and seed the database first')
+    add_scale_arguments(parser)
+    parser.add_argument('--mix', action='append', type=parse_mix,
+                        help=f"{', '.join(MIXES)} or name=weight,... (repeatable; default: default)")
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5010)
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='gunicorn master pid of --url, for memory figures')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='allowed throughput drop / p99 rise, as a fraction (default 0.10)')
+    parser.add_argument('--output', help='write JSON results here as well as to stdout')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('pass --dsn or set BENCH_DATABASE_URL')
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+        },
+        'seed': None,
+        'server': {'mode': args.mode, 'workers': args.workers, 'threads': args.threads, 'url': args.url},
+        'load': {'concurrency': args.concurrency, 'duration_s': args.duration, 'warmup_s': args.warmup},
+        'mixes': {},
+    }
+    if args.seed_db:
+        results['seed'] = seed(args.dsn, scale_from_args(args), args.seed, args.password, reset=True)
+
+    server_env = {
+        'DATABASE_URL': args.dsn,
+        'ACCESS_LISTEN_DATABASE_URL': args.dsn,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'LOG_DIR': tempfile.mkdtemp(prefix='nfc-bench-logs-'),
+        # With --url, export the running server's SECRET_KEY so enroll sessions verify
+        'SECRET_KEY': os.getenv('SECRET_KEY') or secrets.token_hex(32),
+        'SESSION_TOKEN_TTL': str(TOKEN_TTL),
+    }
+    for name, weights in args.mix or [parse_mix('default')]:
+        results['mixes'][name] = run_mix(args, weights, server_env)
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['comparison'], regressed = compare(results, json.load(f), args.max_regression)
+        results['comparison_baseline'] = args.baseline
+        results['regressed'] = regressed
+
+    output = json.dumps(results, indent=2, default=str)
+    print(output)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
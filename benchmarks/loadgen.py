@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import resource
+import subprocess
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Request:
+    """One weighted entry in a traffic mix.
+
+    ``body`` may be a dict or a callable taking a ``random.Random`` and
+    returning one, so each request can vary (different cards, doors...).
+    ``headers`` may be a callable taking the built path, for requests whose
+    credentials depend on the tenant in the path.
+    """
+
+    def __init__(self, name, method, path, weight=1, body=None, headers=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.weight = weight
+        self.body = body
+        self.headers = headers or {}
+
+    def build(self, rng):
+        body = self.body(rng) if callable(self.body) else self.body
+        path = self.path(rng) if callable(self.path) else self.path
+        headers = self.headers(path) if callable(self.headers) else self.headers
+        return path, body, headers
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+    ok = sum(count for status, count in statuses.items() if 200 <= status < 400)
+    return {
+        'requests': total,
+        'ok': ok,
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p95': _ms(percentile(latencies, 0.95)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+async def run_load(base_url, mix, concurrency=100, duration=30.0, warmup=2.0, timeout=30.0, seed=1):
+    """Drive ``mix`` against ``base_url`` from ``concurrency`` connections.
+
+    Requests completed during the first ``warmup`` seconds are not
+    counted. Returns overall and per-request-name summaries.
+    """
+    raise_fd_limit(concurrency * 2 + 256)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    weights = [entry.weight for entry in mix]
+    per_name = {entry.name: ([], {}, [0]) for entry in mix}
+    overall = ([], {}, [0])
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def worker(worker_id, client):
+        rng = random.Random(seed * 100003 + worker_id)
+        while time.perf_counter() < stop_at:
+            entry = rng.choices(mix, weights)[0]
+            path, body, headers = entry.build(rng)
+            sent = time.perf_counter()
+            status = None
+            try:
+                response = await client.request(entry.method, path, json=body, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                pass
+            done = time.perf_counter()
+            if sent < measure_from:
+                continue
+            for latencies, statuses, errors in (overall, per_name[entry.name]):
+                if status is None:
+                    errors[0] += 1
+                else:
+                    latencies.append(done - sent)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    return {
+        'overall': summarize(overall[0], overall[1], overall[2][0], elapsed),
+        'by_request': {name: summarize(lat, st, err[0], elapsed) for name, (lat, st, err) in per_name.items()},
+        'concurrency': concurrency,
+        'duration_s': duration,
+    }
+
+
+def start_server(mode, port, extra_env=None):
+    """Start ``serve.py`` in ``mode`` on ``port``; returns the process."""
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    env['SERVER_MODE'] = mode
+    env['GUNICORN_BIND'] = f'127.0.0.1:{port}'
+    return subprocess.Popen([sys.executable, 'serve.py'], cwd=REPO_ROOT, env=env)
+
+
+def wait_healthy(base_url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(base_url + '/health', timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{base_url} did not become healthy within {timeout:.0f}s')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def child_pids(pid):
+    """Direct children of ``pid``, read from /proc (Linux only)."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields resume after its ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def memory_kb(pid):
+    """``(rss, peak rss)`` of ``pid`` in KiB, or None once it has exited."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        return None
+    return values.get('VmRSS', 0), values.get('VmHWM', 0)
+
+
+class MemorySampler(threading.Thread):
+    """Sample the RSS of a server's worker processes while a load runs.
+
+    Workers are the direct children of ``pid`` (the gunicorn master);
+    their own children, such as the bcrypt pool, are counted as helpers
+    of the worker that started them.
+    """
+
+    def __init__(self, pid, interval=1.0):
+        super().__init__(name='memory-sampler', daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = {}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def sample(self):
+        for worker in child_pids(self.pid):
+            usage = memory_kb(worker)
+            if usage is None:
+                continue
+            helpers = [memory_kb(child) for child in child_pids(worker)]
+            helper_rss = sum(h[0] for h in helpers if h is not None)
+            entry = self.samples.setdefault(worker, {'rss_kb': [], 'peak_kb': 0, 'helpers_rss_kb': []})
+            entry['rss_kb'].append(usage[0])
+            entry['peak_kb'] = max(entry['peak_kb'], usage[1])
+            entry['helpers_rss_kb'].append(helper_rss)
+
+    def summary(self):
+        workers = []
+        for pid, entry in sorted(self.samples.items()):
+            rss = entry['rss_kb']
+            workers.append({
+                'pid': pid,
+                'rss_mb_end': _mb(rss[-1]),
+                'rss_mb_max': _mb(max(rss)),
+                'rss_mb_peak': _mb(entry['peak_kb']),
+                'helpers_rss_mb_max': _mb(max(entry['helpers_rss_kb'])),
+            })
+        return {
+            'workers': workers,
+            'total_rss_mb_end': round(sum(w['rss_mb_end'] for w in workers), 1),
+            'max_worker_rss_mb': max((w['rss_mb_max'] for w in workers), default=None),
+        }
+
+
+def _mb(kb):
+    return round(kb / 1024, 1)
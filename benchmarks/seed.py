@@ -0,0 +1,262 @@
+"""Seed a local Postgres with a reproducible benchmark data set.
+
+    python benchmarks/seed.py --dsn postgresql://postgres@127.0.0.1/nfc_bench --scale medium
+
+Creates the schema (``init_corporate_db``) and fills users, locations,
+buildings (one admin each), access points, cards, ``card_access`` grants
+and ``access_logs``. The same
+``--scale`` and ``--seed`` always produce the same ids and UIDs, so runs
+against different commits see the same data. Refuses to touch a database
+that already holds users unless ``--reset`` is given, which drops and
+recreates the public schema.
+
+Every seeded user's password is ``--password`` (default ``bench-password``).
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import random
+import argparse
+from datetime import timedelta
+import bcrypt
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import init_corporate_db  # noqa: E402
+
+SCALES = {
+    'small': {'users': 1000, 'buildings': 10, 'access_points': 20, 'cards': 2, 'locations': 2, 'grants': 5,
+              'access_logs': 100000, 'days': 30},
+    'medium': {'users': 10000, 'buildings': 50, 'access_points': 20, 'cards': 2, 'locations': 2, 'grants': 10,
+               'access_logs': 2000000, 'days': 90},
+    'large': {'users': 100000, 'buildings': 200, 'access_points': 25, 'cards': 2, 'locations': 2, 'grants': 10,
+              'access_logs': 20000000, 'days': 365},
+}
+
+# What init_db.py would create, minus its legacy access_points table,
+# which would shadow the building-based one init_corporate_db expects
+BASE_SCHEMA = '''
+    CREATE EXTENSION IF NOT EXISTS pgcrypto;
+    CREATE TABLE IF NOT EXISTS users (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS locations (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id UUID NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        UNIQUE(user_id, name)
+    );
+'''
+
+# Spread generated log rows over the grants and the time range without a
+# per-row random(), so the same seed gives the same table
+ACCESS_LOGS_SQL = '''
+    INSERT INTO access_logs (card_id, access_point_id, access_granted, timestamp)
+    SELECT g.card_id, g.access_point_id, n %% 10 <> 0,
+           %(end)s - ((n * 7919) %% %(span)s) * interval '1 second'
+    FROM generate_series(%(first)s::bigint, %(last)s::bigint) AS n
+    JOIN bench_grants g ON g.idx = (n * 2654435761) %% %(grants)s
+'''
+
+LOG_BATCH = 1000000
+UID_MASK = (1 << 56) - 1
+UID_STRIDE = 0x9E3779B97F4A7C15  # odd, so i -> i * stride is a bijection mod 2**56
+# Seeded rows end before the run starts, so rows the benchmark writes can be told apart
+LOGS_END_OFFSET = timedelta(minutes=5)
+
+
+def card_uid(n):
+    """The n-th seeded card's 7-byte UID; unique for every n below 2**56 - 1."""
+    return f'{((n + 1) * UID_STRIDE) & UID_MASK:014X}'
+
+
+def bench_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def copy_rows(cur, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def generate(scale, seed, password_hash):
+    """Build the seeded rows in memory as ``{table: (columns, rows)}``."""
+    rng = random.Random(seed)
+    users = []
+    for i in range(scale['users']):
+        users.append((bench_uuid(rng), f'bench{i}', password_hash, f'bench{i}@example.com', 'individual'))
+
+    buildings = []
+    access_points = []
+    for b in range(scale['buildings']):
+        building_id = bench_uuid(rng)
+        buildings.append((building_id, f'Bench building {b}', f'{b} Bench Street'))
+        for a in range(scale['access_points']):
+            access_points.append((bench_uuid(rng), building_id, f'Door {a}', rng.choice((1, 1, 1, 2, 3))))
+
+    cards = []
+    grants = []
+    n = 0
+    for user in users:
+        for _ in range(scale['cards']):
+            card_id = bench_uuid(rng)
+            status = 'revoked' if rng.random() < 0.05 else 'active'
+            # bytea text input
+            cards.append((card_id, user[0], '\\x' + card_uid(n), 'MIFARE Classic', f'Card {n}', status))
+            n += 1
+            for ap in rng.sample(access_points, min(scale['grants'], len(access_points))):
+                if rng.random() < 0.2:
+                    schedule = ('08:00', '18:00', '{1,2,3,4,5}')
+                else:
+                    schedule = (None, None, None)
+                grants.append((bench_uuid(rng), card_id, ap[0], rng.choice((1, 2, 3))) + schedule)
+
+    # Drawn after the cards so adding them left every earlier id unchanged
+    locations = []
+    for user in users:
+        for i in range(scale['locations']):
+            locations.append((bench_uuid(rng), user[0], f'Bench location {i}', None))
+    building_admins = [
+        (bench_uuid(rng), building[0], users[(b * 7919) % len(users)][0]) for b, building in enumerate(buildings)
+    ] if users else []
+    return {
+        'users': (('id', 'username', 'password_hash', 'email', 'user_type'), users),
+        'locations': (('id', 'user_id', 'name', 'description'), locations),
+        'buildings': (('id', 'name', 'address'), buildings),
+        'building_admins': (('id', 'building_id', 'user_id'), building_admins),
+        'access_points': (('id', 'building_id', 'name', 'access_level'), access_points),
+        'cards': (('id', 'user_id', 'card_uid', 'card_type', 'name', 'status'), cards),
+        'card_access': (('id', 'card_id', 'access_point_id', 'access_level',
+                         'schedule_start', 'schedule_end', 'days_of_week'), grants),
+    }
+
+
+def reset_schema(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute('DROP SCHEMA public CASCADE')
+        cur.execute('CREATE SCHEMA public')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def seed(dsn, scale, seed_value=1, password='bench-password', rounds=None, reset=False):
+    """Create and fill the benchmark database; returns a summary dict."""
+    started = time.perf_counter()
+    if reset:
+        reset_schema(dsn)
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(BASE_SCHEMA)
+        cur.execute('SELECT count(*) FROM users')
+        if cur.fetchone()[0]:
+            raise SystemExit('database already has users; pass --reset to recreate it')
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.environ['DATABASE_URL'] = dsn
+    init_corporate_db.init_corporate_database()
+
+    rounds = rounds or int(os.getenv('BCRYPT_ROUNDS', '12'))
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+    tables = generate(scale, seed_value, password_hash)
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        # Database time, as the server's CURRENT_TIMESTAMP defaults use it
+        cur.execute('SELECT LOCALTIMESTAMP(0)')
+        logs_end = cur.fetchone()[0] - LOGS_END_OFFSET
+        for table in ('users', 'locations', 'buildings', 'building_admins', 'access_points', 'cards', 'card_access'):
+            columns, rows = tables[table]
+            copy_rows(cur, table, columns, rows)
+        conn.commit()
+
+        grant_count = len(tables['card_access'][1])
+        if scale['access_logs'] and grant_count:
+            init_corporate_db.ensure_access_log_partitions(cur, start=logs_end - timedelta(days=scale['days']))
+            cur.execute('''
+                CREATE TEMP TABLE bench_grants AS
+                SELECT row_number() OVER (ORDER BY id) - 1 AS idx, card_id, access_point_id
+                FROM card_access
+            ''')
+            cur.execute('CREATE INDEX ON bench_grants (idx)')
+            for first in range(1, scale['access_logs'] + 1, LOG_BATCH):
+                cur.execute(ACCESS_LOGS_SQL, {
+                    'first': first, 'last': min(first + LOG_BATCH - 1, scale['access_logs']),
+                    'grants': grant_count, 'span': scale['days'] * 86400, 'end': logs_end
+                })
+                conn.commit()
+            init_corporate_db.rebuild_access_log_rollups(cur)
+            conn.commit()
+        conn.autocommit = True
+        cur.execute('VACUUM ANALYZE')
+    finally:
+        conn.close()
+
+    return {
+        'scale': scale,
+        'seed': seed_value,
+        'rows': {table: len(rows) for table, (_, rows) in tables.items()},
+        'access_logs': scale['access_logs'],
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def scale_from_args(args):
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        value = getattr(args, key)
+        if value is not None:
+            scale[key] = value
+    return scale
+
+
+def add_scale_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--users', type=int, help='override the preset user count')
+    parser.add_argument('--buildings', type=int)
+    parser.add_argument('--access-points', type=int, help='access points per building')
+    parser.add_argument('--cards', type=int, help='cards per user')
+    parser.add_argument('--locations', type=int, help='locations per user')
+    parser.add_argument('--grants', type=int, help='card_access rows per card')
+    parser.add_argument('--access-logs', type=int, help='total access_logs rows')
+    parser.add_argument('--days', type=int, help='days of history the access logs span')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--password', default='bench-password')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DATABASE_URL'), help='defaults to BENCH_DATABASE_URL')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate the public schema first')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('pass --dsn or set BENCH_DATABASE_URL')
+    summary = seed(args.dsn, scale_from_args(args), args.seed, args.password, reset=args.reset)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
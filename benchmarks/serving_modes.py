@@ -0,0 +1,91 @@
+"""Compare the WSGI (gunicorn gthread) and ASGI (uvicorn) serving modes.
+
+Either point it at two running servers:
+
+    python benchmarks/serving_modes.py --wsgi-url http://127.0.0.1:5001 --asgi-url http://127.0.0.1:5002
+
+or let it start both from this checkout (same DATABASE_URL, same worker count):
+
+    python benchmarks/serving_modes.py --start --workers 4
+
+Results are printed as JSON, one entry per mode.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import Request, run_load, start_server, wait_healthy, stop_server  # noqa: E402
+
+
+def build_mix(args):
+    mix = [
+        Request('health', 'GET', '/health', weight=20),
+        Request('list_cards', 'GET', f'/api/cards?limit={args.page_size}', weight=30),
+        Request('list_locations', 'GET', f'/api/locations?limit={args.page_size}', weight=20),
+    ]
+    if args.access_point_id:
+        card_uids = args.card_uid or ['00000000']
+        mix.append(Request(
+            'access_check', 'POST', '/api/access/check', weight=30,
+            body=lambda rng: {'card_uid': rng.choice(card_uids), 'access_point_id': args.access_point_id}
+        ))
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wsgi-url')
+    parser.add_argument('--asgi-url')
+    parser.add_argument('--start', action='store_true', help='start both servers locally')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--access-point-id', help='include access checks against this access point')
+    parser.add_argument('--card-uid', action='append', help='card UID for access checks (repeatable)')
+    parser.add_argument('--output', help='write JSON results here as well as to stdout')
+    args = parser.parse_args()
+
+    targets = {}
+    processes = []
+    if args.start:
+        env = {'GUNICORN_WORKERS': str(args.workers)}
+        for mode, port in (('wsgi', 5001), ('asgi', 5002)):
+            processes.append(start_server(mode, port, env))
+            targets[mode] = f'http://127.0.0.1:{port}'
+    else:
+        if args.wsgi_url:
+            targets['wsgi'] = args.wsgi_url
+        if args.asgi_url:
+            targets['asgi'] = args.asgi_url
+    if not targets:
+        parser.error('pass --start or at least one of --wsgi-url/--asgi-url')
+
+    results = {}
+    try:
+        for mode, url in targets.items():
+            wait_healthy(url)
+            results[mode] = asyncio.run(run_load(
+                url, build_mix(args),
+                concurrency=args.concurrency,
+                duration=args.duration,
+                warmup=args.warmup
+            ))
+            results[mode]['url'] = url
+    finally:
+        for process in processes:
+            stop_server(process)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
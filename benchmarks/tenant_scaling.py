@@ -0,0 +1,191 @@
+"""Show that tenant-scoped list latency stays flat as the tenant count grows.
+
+    python benchmarks/tenant_scaling.py --dsn postgresql://postgres@127.0.0.1/nfc_bench \\
+        --tenants 1000,10000,100000 --output bench/tenants.json
+
+For each tenant count the database is recreated and seeded with that many
+users. Buildings grow in step, so each building has as many users as in
+``--scale``, and per-user counts are unchanged. A fresh server is started
+and ``/api/users/<id>/cards``, ``/api/users/<id>/locations`` and
+``/api/buildings/<id>/cards`` are driven with session tokens of random
+tenants. The JSON document lists p50/p95/p99 per step and route; the exit
+status is 1 when the p99 at the largest step exceeds the smallest step's
+by more than ``--max-growth``.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import secrets
+import argparse
+import platform
+import tempfile
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import MemorySampler, Request, run_load, start_server, wait_healthy, stop_server  # noqa: E402
+from seed import add_scale_arguments, scale_from_args, seed  # noqa: E402
+from api_suite import SAMPLE_SIZE, PAGE_SIZE, git_revision  # noqa: E402
+from auth import SessionTokens  # noqa: E402
+
+MIX = {'user_cards': 40, 'user_locations': 30, 'building_cards': 30}
+TOKEN_TTL = 86400
+
+SAMPLE_QUERIES = {
+    'users': "SELECT id::text, email FROM users WHERE username LIKE 'bench%%' ORDER BY md5(id::text) LIMIT %s",
+    'admins': 'SELECT building_id::text, user_id::text, u.email FROM building_admins ba '
+              'JOIN users u ON u.id = ba.user_id ORDER BY md5(ba.id::text) LIMIT %s',
+}
+
+
+def parse_tenants(value):
+    try:
+        counts = sorted({int(part) for part in value.split(',')})
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected comma-separated user counts')
+    if len(counts) < 2 or counts[0] < 1:
+        raise argparse.ArgumentTypeError('give at least two positive user counts')
+    return counts
+
+
+def load_tenants(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        samples = {}
+        for name, query in SAMPLE_QUERIES.items():
+            cur.execute(query, (SAMPLE_SIZE,))
+            samples[name] = cur.fetchall()
+    finally:
+        conn.close()
+    if not samples['users'] or not samples['admins']:
+        raise SystemExit('seeding produced no users or building admins')
+    return samples
+
+
+def build_mix(samples, tokens):
+    """Requests as random tenants; the token is looked up from the path's id."""
+    user_tokens = {user_id: tokens.issue(user_id, email) for user_id, email in samples['users']}
+    admin_tokens = {building_id: tokens.issue(user_id, email) for building_id, user_id, email in samples['admins']}
+    user_ids = list(user_tokens)
+    building_ids = list(admin_tokens)
+
+    def user_auth(path):
+        return {'Authorization': f"Bearer {user_tokens[path.split('/')[3]]}"}
+
+    def admin_auth(path):
+        return {'Authorization': f"Bearer {admin_tokens[path.split('/')[3]]}"}
+
+    requests = [
+        Request('user_cards', 'GET', lambda rng: f'/api/users/{rng.choice(user_ids)}/cards?limit={PAGE_SIZE}',
+                headers=user_auth),
+        Request('user_locations', 'GET',
+                lambda rng: f'/api/users/{rng.choice(user_ids)}/locations?limit={PAGE_SIZE}', headers=user_auth),
+        Request('building_cards', 'GET',
+                lambda rng: f'/api/buildings/{rng.choice(building_ids)}/cards?limit={PAGE_SIZE}', headers=admin_auth),
+    ]
+    for request in requests:
+        request.weight = MIX[request.name]
+    return requests
+
+
+def run_step(args, users, server_env):
+    """Seed ``users`` tenants, then load the scoped routes of a fresh server."""
+    base = scale_from_args(args)
+    scale = dict(base, users=users, buildings=max(1, round(users * base['buildings'] / base['users'])))
+    seeded = seed(args.dsn, scale, args.seed, args.password, reset=True)
+    samples = load_tenants(args.dsn)
+    tokens = SessionTokens(server_env['SECRET_KEY'], ttl=TOKEN_TTL)
+    process = start_server(args.mode, args.port, server_env)
+    url = f'http://127.0.0.1:{args.port}'
+    sampler = None
+    try:
+        wait_healthy(url)
+        sampler = MemorySampler(process.pid)
+        sampler.start()
+        load = asyncio.run(run_load(
+            url, build_mix(samples, tokens),
+            concurrency=args.concurrency, duration=args.duration, warmup=args.warmup, seed=args.seed
+        ))
+    finally:
+        if sampler:
+            sampler.stop()
+        stop_server(process)
+    return {
+        'users': users,
+        'rows': seeded['rows'],
+        'seed_seconds': seeded['seconds'],
+        'load': load,
+        'memory': sampler.summary() if sampler else None,
+    }
+
+
+def growth(steps):
+    """p99 change from the smallest to the largest step, overall and per route."""
+    first, last = steps[0]['load'], steps[-1]['load']
+    report = {}
+    for name in ['overall'] + sorted(last['by_request']):
+        before = first['overall'] if name == 'overall' else first['by_request'].get(name)
+        now = last['overall'] if name == 'overall' else last['by_request'].get(name)
+        if before and now and before['latency_ms']['p99'] and now['latency_ms']['p99'] is not None:
+            report[name] = round(now['latency_ms']['p99'] / before['latency_ms']['p99'] - 1, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DATABASE_URL'), help='defaults to BENCH_DATABASE_URL')
+    parser.add_argument('--tenants', type=parse_tenants, default=parse_tenants('1000,10000,100000'),
+                        help='comma-separated user counts to seed, smallest first (default 1000,10000,100000)')
+    add_scale_arguments(parser)
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5010)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--max-growth', type=float, default=0.25,
+                        help='allowed p99 rise from the smallest to the largest step (default 0.25)')
+    parser.add_argument('--output', help='write JSON results here as well as to stdout')
+    parser.set_defaults(access_logs=0)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error('pass --dsn or set BENCH_DATABASE_URL')
+
+    server_env = {
+        'DATABASE_URL': args.dsn,
+        'ACCESS_LISTEN_DATABASE_URL': args.dsn,
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'LOG_DIR': tempfile.mkdtemp(prefix='nfc-bench-logs-'),
+        'SECRET_KEY': secrets.token_hex(32),
+        'SESSION_TOKEN_TTL': str(TOKEN_TTL),
+    }
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+        },
+        'server': {'mode': args.mode, 'workers': args.workers, 'threads': args.threads},
+        'load': {'concurrency': args.concurrency, 'duration_s': args.duration, 'warmup_s': args.warmup},
+        'steps': [run_step(args, users, server_env) for users in args.tenants],
+    }
+    results['p99_growth'] = growth(results['steps'])
+    results['flat'] = results['p99_growth'].get('overall', 0) <= args.max_growth
+
+    output = json.dumps(results, indent=2, default=str)
+    print(output)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    sys.exit(0 if results['flat'] else 1)
+
+
+if __name__ == '__main__':
+    main()
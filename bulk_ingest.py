@@ -0,0 +1,174 @@
+import io
+import csv
+import json
+import uuid
+from uids import UIDError, canonical_uid
+from access_lists import CARD_STATUSES
+
+
+class BulkParseError(ValueError):
+    """Raised when an upload cannot be decoded at all."""
+
+
+def parse_upload(body, content_type):
+    """Decode a JSON array, NDJSON or CSV body into a list of dicts."""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    text = body.decode('utf-8-sig') if isinstance(body, bytes) else body
+    if content_type in ('text/csv', 'application/csv'):
+        return list(csv.DictReader(io.StringIO(text)))
+    if content_type in ('application/x-ndjson', 'application/jsonl'):
+        records = []
+        for line_no, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                raise BulkParseError(f'line {line_no}: {e}')
+        return records
+    try:
+        records = json.loads(text)
+    except ValueError as e:
+        raise BulkParseError(str(e))
+    if not isinstance(records, list):
+        raise BulkParseError('expected a JSON array of cards')
+    return records
+
+
+def validate_rows(records, default_user_id=None):
+    """Split records into clean rows and per-row errors.
+
+    Each clean row is ``(row_no, user_id, card_uid, card_type, name, status)``
+    with ``row_no`` counted from 1; a row without ``user_id`` gets
+    ``default_user_id``. Duplicate ``card_uid`` values inside the upload are
+    reported against every occurrence after the first.
+    """
+    rows = []
+    errors = []
+    seen = {}
+    for row_no, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            errors.append({'row': row_no, 'error': 'row must be an object'})
+            continue
+        # JSON rows can carry numbers, lists or objects where text belongs
+        wrong = [field for field in ('user_id', 'card_uid', 'card_type', 'name', 'status')
+                 if record.get(field) is not None and not isinstance(record[field], str)]
+        if wrong:
+            card_uid = record.get('card_uid')
+            errors.append({'row': row_no, 'card_uid': card_uid if isinstance(card_uid, str) else None,
+                           'error': f'{wrong[0]} must be a string'})
+            continue
+        card_uid = (record.get('card_uid') or '').strip().upper()
+        card_type = (record.get('card_type') or '').strip()
+        status = (record.get('status') or 'active').strip()
+        name = record.get('name') or None
+        user_id = record.get('user_id') or default_user_id
+        if not card_uid or not card_type or not user_id:
+            errors.append({'row': row_no, 'card_uid': card_uid or None,
+                           'error': 'user_id, card_uid and card_type are required'})
+            continue
+        try:
+            user_id = str(uuid.UUID(user_id))
+        except ValueError:
+            errors.append({'row': row_no, 'card_uid': card_uid, 'error': 'user_id is not a valid id'})
+            continue
+        try:
+            card_uid = canonical_uid(card_uid)
+        except UIDError as e:
+            errors.append({'row': row_no, 'card_uid': card_uid, 'error': str(e)})
+            continue
+        if status not in CARD_STATUSES:
+            errors.append({'row': row_no, 'card_uid': card_uid,
+                           'error': f"status must be one of {', '.join(CARD_STATUSES)}"})
+            continue
+        if card_uid in seen:
+            errors.append({'row': row_no, 'card_uid': card_uid,
+                           'error': f'duplicate card_uid in upload (first at row {seen[card_uid]})'})
+            continue
+        seen[card_uid] = row_no
+        rows.append((row_no, user_id, card_uid, card_type, name, status))
+    return rows, errors
+
+
+def keep_own_rows(rows, errors, user_id):
+    """Rows enrolling cards for ``user_id``; the others are added to ``errors``.
+
+    Only building and corporate admins may enroll cards for other users.
+    """
+    own = []
+    for row in rows:
+        if row[1] == str(user_id):
+            own.append(row)
+        else:
+            errors.append({'row': row[0], 'card_uid': row[2], 'error': 'only admins may enroll cards for other users'})
+    return own
+
+
+STAGE_SQL = '''
+    CREATE TEMP TABLE cards_stage (
+        row_no INTEGER NOT NULL,
+        user_id UUID NOT NULL,
+        card_uid TEXT NOT NULL,
+        card_type TEXT NOT NULL,
+        name TEXT,
+        status TEXT NOT NULL
+    ) ON COMMIT DROP
+'''
+
+COPY_SQL = 'COPY cards_stage (row_no, user_id, card_uid, card_type, name, status) FROM STDIN WITH (FORMAT csv)'
+
+DROP_UNKNOWN_USERS_SQL = '''
+    DELETE FROM cards_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)
+    RETURNING row_no, card_uid
+'''
+
+MOVE_SQL = '''
+    WITH inserted AS (
+        INSERT INTO cards (user_id, card_uid, card_type, name, status)
+        SELECT user_id, uid_from_hex(card_uid), card_type, name, status FROM cards_stage ORDER BY row_no
+        ON CONFLICT (card_uid) DO NOTHING
+        RETURNING uid_hex(card_uid) AS card_uid
+    )
+    SELECT s.row_no, s.card_uid, i.card_uid IS NOT NULL
+    FROM cards_stage s LEFT JOIN inserted i ON i.card_uid = s.card_uid
+'''
+
+
+def rows_to_csv(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    return buf
+
+
+def collect_results(unknown_users, moved):
+    """Turn the staging queries' results into ``(inserted, errors)``."""
+    errors = [{'row': row_no, 'card_uid': card_uid, 'error': 'user_id does not exist'}
+              for row_no, card_uid in unknown_users]
+    inserted = 0
+    for row_no, card_uid, ok in moved:
+        if ok:
+            inserted += 1
+        else:
+            errors.append({'row': row_no, 'card_uid': card_uid, 'error': 'card_uid already exists'})
+    return inserted, errors
+
+
+def copy_cards(conn, rows):
+    """Load validated rows into ``cards`` in one transaction.
+
+    Rows are streamed into a temporary staging table with ``COPY`` and then
+    moved with a single ``INSERT ... ON CONFLICT (card_uid) DO NOTHING``.
+    Returns ``(inserted, errors)`` where errors cover unknown users and
+    card_uids that already exist. The caller commits.
+    """
+    cur = conn.cursor()
+    cur.execute(STAGE_SQL)
+    cur.copy_expert(COPY_SQL, rows_to_csv(rows))
+    cur.execute(DROP_UNKNOWN_USERS_SQL)
+    unknown_users = cur.fetchall()
+    cur.execute(MOVE_SQL)
+    moved = cur.fetchall()
+    cur.close()
+    return collect_results(unknown_users, moved)
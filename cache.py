@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS, CACHE_EVICTIONS, CACHE_COALESCED, CACHE_ERRORS
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe per-process LRU with a TTL on every entry.
+
+    Entries live in namespaces (one per table) so a write can drop
+    everything derived from that table at once.
+    """
+
+    def __init__(self, name, maxsize=256, ttl=5.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= now:
+                del self._entries[(namespace, key)]
+                return _MISSING
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._entries[(namespace, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(self.name).inc()
+
+    def invalidate(self, namespace):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+
+
+class SharedCache:
+    """Shared tier on any redis-py compatible client (Redis, fakeredis...).
+
+    Every entry is its own key with its own TTL, named after the version
+    of its namespace. Invalidation bumps that version with one INCR, so
+    every worker stops seeing the old entries at once and a value loaded
+    before the bump is written under a version nobody reads any more.
+    Errors are counted and treated as misses: the shared tier is an
+    optimisation, never a dependency.
+    """
+
+    def __init__(self, name, client, ttl=30.0, prefix='nfc-one:cache'):
+        self.name = name
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _version_key(self, namespace):
+        return f'{self.prefix}:{self.name}:{namespace}'
+
+    def _key(self, namespace, version, key):
+        return f'{self.prefix}:{self.name}:{namespace}:{version}:{key}'
+
+    def version(self, namespace):
+        """The namespace's current version, or None if Redis is unreachable."""
+        try:
+            raw = self.client.get(self._version_key(namespace))
+        except Exception:
+            CACHE_ERRORS.labels(self.name).inc()
+            return None
+        return int(raw) if raw is not None else 0
+
+    def get(self, namespace, version, key):
+        try:
+            raw = self.client.get(self._key(namespace, version, key))
+        except Exception:
+            CACHE_ERRORS.labels(self.name).inc()
+            return _MISSING
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, namespace, version, key, value):
+        try:
+            self.client.setex(self._key(namespace, version, key), max(1, int(self.ttl)),
+                              json.dumps(value, separators=(',', ':')))
+        except Exception:
+            CACHE_ERRORS.labels(self.name).inc()
+
+    def invalidate(self, namespace):
+        try:
+            self.client.incr(self._version_key(namespace))
+        except Exception:
+            CACHE_ERRORS.labels(self.name).inc()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TwoTierCache:
+    """Local LRU in front of an optional shared tier, with miss coalescing.
+
+    Concurrent misses on the same key in one process wait for a single
+    ``loader`` call. Values must be JSON-serialisable when a shared tier is
+    configured.
+    """
+
+    def __init__(self, local, shared=None):
+        self.name = local.name
+        self.local = local
+        self.shared = shared
+        self._flights = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, namespace, key, loader):
+        value = self.local.get(namespace, key)
+        if value is not _MISSING:
+            CACHE_REQUESTS.labels(self.name, 'local', 'hit').inc()
+            return value
+        CACHE_REQUESTS.labels(self.name, 'local', 'miss').inc()
+
+        with self._lock:
+            flight = self._flights.get((namespace, key))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(namespace, key)] = _Flight()
+                generation = self._generations.get(namespace, 0)
+        if not leader:
+            CACHE_COALESCED.labels(self.name).inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = self._load(namespace, key, loader, generation)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[(namespace, key)]
+            flight.done.set()
+
+    def _load(self, namespace, key, loader, generation):
+        version = None
+        if self.shared is not None:
+            # Read before loading: an invalidation by any worker from here on
+            # moves the namespace past this version and strands our value
+            version = self.shared.version(namespace)
+        if version is not None:
+            value = self.shared.get(namespace, version, key)
+            if value is not _MISSING:
+                CACHE_REQUESTS.labels(self.name, 'shared', 'hit').inc()
+                self._store(namespace, key, value, generation)
+                return value
+            CACHE_REQUESTS.labels(self.name, 'shared', 'miss').inc()
+        value = loader()
+        self._store(namespace, key, value, generation, version)
+        return value
+
+    def _store(self, namespace, key, value, generation, version=None):
+        # A write that landed while we were loading makes this value stale
+        with self._lock:
+            if self._generations.get(namespace, 0) != generation:
+                return
+        self.local.set(namespace, key, value)
+        if version is not None:
+            self.shared.set(namespace, version, key, value)
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self.local.invalidate(namespace)
+        if self.shared is not None:
+            self.shared.invalidate(namespace)
+
+
+def shared_client_from_env():
+    """Redis client for ``CACHE_REDIS_URL``, or None when it is unset."""
+    url = os.getenv('CACHE_REDIS_URL')
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+
+def cache_from_env(name):
+    local = LocalCache(
+        name,
+        maxsize=int(os.getenv('CACHE_LOCAL_MAXSIZE', '256')),
+        ttl=float(os.getenv('CACHE_LOCAL_TTL', '5'))
+    )
+    client = shared_client_from_env()
+    shared = SharedCache(name, client, ttl=float(os.getenv('CACHE_SHARED_TTL', '30'))) if client else None
+    return TwoTierCache(local, shared)
@@ -0,0 +1,162 @@
+"""``GET /api/dashboard``: everything the dashboard shows, in one statement.
+
+Each section is a ``json_agg`` subquery of one ``json_build_object``, so the
+response is built by Postgres on a single pooled connection in a single
+round trip and handed to the client as the text the database returned.
+"""
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# section -> (FROM/WHERE clause, ORDER BY, {field: expression})
+SECTIONS = {
+    'cards': (
+        'FROM cards c WHERE c.user_id = %(user_id)s',
+        'c.id',
+        {
+            'id': 'c.id',
+            'card_uid': 'uid_hex(c.card_uid)',
+            'card_type': 'c.card_type',
+            'name': 'c.name',
+            'status': 'c.status',
+            'created_at': 'c.created_at',
+            'updated_at': 'c.updated_at',
+        },
+    ),
+    'locations': (
+        'FROM locations l WHERE l.user_id = %(user_id)s',
+        'l.name',
+        {
+            'id': 'l.id',
+            'name': 'l.name',
+            'description': 'l.description',
+            'created_at': 'l.created_at',
+            'updated_at': 'l.updated_at',
+        },
+    ),
+    'assignments': (
+        '''FROM card_access ca
+           JOIN cards c ON c.id = ca.card_id
+           JOIN access_points ap ON ap.id = ca.access_point_id
+           JOIN buildings b ON b.id = ap.building_id
+           WHERE c.user_id = %(user_id)s''',
+        'ca.id',
+        {
+            'id': 'ca.id',
+            'card_id': 'ca.card_id',
+            'access_point_id': 'ca.access_point_id',
+            'access_point_name': 'ap.name',
+            'building_id': 'ap.building_id',
+            'building_name': 'b.name',
+            'access_level': 'ca.access_level',
+            'schedule_start': 'ca.schedule_start',
+            'schedule_end': 'ca.schedule_end',
+            'days_of_week': 'ca.days_of_week',
+        },
+    ),
+    'history': (
+        'FROM card_history h WHERE h.user_id = %(user_id)s',
+        'h.last_seen DESC',
+        {
+            'id': 'h.id',
+            'card_uid': 'uid_hex(h.card_id)',
+            'card_type': 'h.card_type',
+            'custom_name': 'h.custom_name',
+            'first_seen': 'h.first_seen',
+            'last_seen': 'h.last_seen',
+            'tap_count': 'h.tap_count',
+        },
+    ),
+}
+
+
+class DashboardArgsError(ValueError):
+    """Raised for malformed ``/api/dashboard`` query parameters."""
+
+
+def _limit(value, name):
+    try:
+        limit = int(value)
+    except ValueError:
+        raise DashboardArgsError(f'{name} must be an integer')
+    if limit < 0 or limit > MAX_LIMIT:
+        raise DashboardArgsError(f'{name} must be between 0 and {MAX_LIMIT}')
+    return limit
+
+
+def parse_dashboard_args(args):
+    """Read ``sections``, ``fields``, ``limit`` and ``<section>_limit``.
+
+    ``sections`` is a comma-separated subset of ``SECTIONS`` (default all).
+    ``fields`` lists ``section.field`` names; a section named there only
+    gets those fields, the others get all of theirs. ``limit`` caps every
+    section (default ``DEFAULT_LIMIT``) and ``<section>_limit`` one of them.
+    Returns ``(sections, fields, limits)``.
+    """
+    sections = args.get('sections')
+    if sections:
+        sections = [name.strip() for name in sections.split(',') if name.strip()]
+        unknown = [name for name in sections if name not in SECTIONS]
+        if unknown:
+            raise DashboardArgsError(f"unknown section {unknown[0]}; use {', '.join(SECTIONS)}")
+        sections = list(dict.fromkeys(sections))
+    else:
+        sections = list(SECTIONS)
+
+    fields = {}
+    for item in (args.get('fields') or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        section, _, field = item.partition('.')
+        if section not in SECTIONS or field not in SECTIONS[section][2]:
+            raise DashboardArgsError(f'unknown field {item}')
+        fields.setdefault(section, [])
+        if field not in fields[section]:
+            fields[section].append(field)
+    fields = {name: fields.get(name) or list(SECTIONS[name][2]) for name in sections}
+
+    default = _limit(args.get('limit', DEFAULT_LIMIT), 'limit')
+    limits = {}
+    for name in sections:
+        value = args.get(f'{name}_limit')
+        limits[name] = default if value is None else _limit(value, f'{name}_limit')
+    return sections, fields, limits
+
+
+def build_dashboard_query(user_id, sections, fields, limits):
+    """One statement returning the whole payload as JSON text.
+
+    ``has_more`` reports, per section, whether rows were left out by its
+    limit. Field names and SQL only ever come from ``SECTIONS``.
+    """
+    params = {'user_id': user_id}
+    items = []
+    has_more = []
+    for name in sections:
+        source, order, columns = SECTIONS[name]
+        select = ', '.join(f'{columns[field]} AS {field}' for field in fields[name])
+        params[f'{name}_limit'] = limits[name]
+        # json_agg keeps the order of its sorted subquery
+        items.append(f'''
+            '{name}', (SELECT coalesce(json_agg(t), '[]'::json) FROM (
+                SELECT {select} {source} ORDER BY {order} LIMIT %({name}_limit)s
+            ) t)
+        ''')
+        has_more.append(f"'{name}', EXISTS (SELECT 1 {source} ORDER BY {order} OFFSET %({name}_limit)s LIMIT 1)")
+    query = f'''
+        SELECT json_build_object(
+            {', '.join(items)},
+            'has_more', json_build_object({', '.join(has_more)})
+        )::text
+    '''
+    return query, params
+
+
+def query_dashboard(conn, user_id, sections, fields, limits):
+    query, params = build_dashboard_query(user_id, sections, fields, limits)
+    cur = conn.cursor()
+    cur.execute(query, params)
+    body = cur.fetchone()[0]
+    cur.close()
+    return body
@@ -0,0 +1,425 @@
+import os
+import time
+import select
+import logging
+import threading
+import collections
+import psycopg2
+import psycopg2.extensions
+from prometheus_client import Counter, Gauge, Histogram
+from instrumentation import observe, timed
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics
+POOL_WAIT = Histogram(
+    'db_pool_wait_seconds',
+    'Time spent waiting to check out a pooled connection',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use',
+    'Pooled connections currently checked out',
+    multiprocess_mode='livesum'
+)
+
+POOL_OPEN = Gauge(
+    'db_pool_connections_open',
+    'Pooled connections currently open (idle and in use)',
+    multiprocess_mode='livesum'
+)
+
+# Set from the asgi_server pool's stats; POOL_OPEN counts this module's pool
+ASYNC_POOL_OPEN = Gauge(
+    'db_async_pool_connections_open',
+    'Async pooled connections currently open (idle and in use)',
+    multiprocess_mode='livesum'
+)
+
+POOL_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total',
+    'Checkouts that gave up because the pool was exhausted'
+)
+
+POOL_DISCARDED = Counter(
+    'db_pool_connections_discarded_total',
+    'Connections closed by the pool',
+    ['reason']
+)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that adds statement time to the current request's ``db`` phase."""
+
+    def execute(self, query, vars=None):
+        with timed('db'):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with timed('db'):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with timed('db'):
+            return super().copy_expert(sql, file, size)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections owned by a single process.
+
+    Idle connections are reused LIFO so the warmest socket goes out first.
+    Connections older than ``max_age`` are recycled, and connections that
+    sat idle longer than ``health_check_after`` are pinged before checkout.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, max_age=1800.0,
+                 health_check_after=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError('Invalid pool size: min=%s max=%s' % (minconn, maxconn))
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.health_check_after = health_check_after
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = collections.deque()  # (conn, created_at, last_used)
+        self._created = {}  # id(conn) -> created_at, for every open connection
+        self._opening = 0  # connects in progress outside the lock
+        self._in_use = 0
+        self._closed = False
+        for _ in range(minconn):
+            conn = self._connect()
+            now = time.monotonic()
+            self._idle.append((conn, self._created[id(conn)], now))
+
+    @property
+    def size(self):
+        return len(self._created) + self._opening
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=TimedCursor)
+        self._created[id(conn)] = time.monotonic()
+        POOL_OPEN.inc()
+        return conn
+
+    def _discard(self, conn, reason):
+        if self._created.pop(id(conn), None) is not None:
+            POOL_OPEN.dec()
+        POOL_DISCARDED.labels(reason=reason).inc()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _waited(start):
+        waited = time.monotonic() - start
+        POOL_WAIT.observe(waited)
+        observe('pool_wait', waited)
+
+    def getconn(self):
+        """Check out a connection, waiting up to ``timeout`` seconds."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout('Connection pool is closed')
+                entry = None
+                while self._idle:
+                    conn, created, last_used = self._idle.pop()
+                    if time.monotonic() - created > self.max_age:
+                        self._discard(conn, 'max_age')
+                        continue
+                    entry = (conn, last_used)
+                    break
+                if entry is None and self.size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        POOL_TIMEOUTS.inc()
+                        self._waited(start)
+                        raise PoolTimeout(
+                            'No database connection available after %.1fs' % self.timeout
+                        )
+                    self._cond.wait(remaining)
+                    continue
+                self._in_use += 1
+                POOL_IN_USE.inc()
+                if entry is None:
+                    self._opening += 1
+
+            if entry is not None:
+                conn, last_used = entry
+                if self._is_healthy(conn, last_used):
+                    self._waited(start)
+                    return conn
+                with self._cond:
+                    self._in_use -= 1
+                    POOL_IN_USE.dec()
+                    self._discard(conn, 'unhealthy')
+                    self._cond.notify()
+                continue
+
+            try:
+                conn = psycopg2.connect(self.dsn, cursor_factory=TimedCursor)
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use -= 1
+                    POOL_IN_USE.dec()
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._created[id(conn)] = time.monotonic()
+                POOL_OPEN.inc()
+            self._waited(start)
+            return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, resetting any open transaction."""
+        reason = None
+        if conn.closed:
+            reason = 'closed'
+        elif conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reason = 'broken'
+        with self._cond:
+            self._in_use -= 1
+            POOL_IN_USE.dec()
+            created = self._created.get(id(conn))
+            if reason is None and (self._closed or created is None):
+                reason = 'closed'
+            elif reason is None and time.monotonic() - created > self.max_age:
+                reason = 'max_age'
+            if reason is None:
+                self._idle.append((conn, created, time.monotonic()))
+            else:
+                self._discard(conn, reason)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn, 'shutdown')
+            self._cond.notify_all()
+
+
+class PooledConnection:
+    """Proxy for a checked-out connection.
+
+    ``close()`` hands the connection back to the pool instead of closing
+    the socket. Used as a context manager it also rolls back on error.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError('connection already returned to the pool')
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._conn is not None and not self._conn.closed:
+            try:
+                self._conn.rollback()
+            except psycopg2.Error:
+                pass
+        self.close()
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Connections inherited across fork(). Closing them in the child would send a
+# Terminate message on the parent's socket, so they are kept referenced instead.
+_inherited = []
+
+
+def get_pool():
+    """Return this process's pool, creating it lazily after fork."""
+    global _pool
+    pid = os.getpid()
+    if _pool is not None and _pool.pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid != pid:
+            _inherited.append(_pool)
+            _pool = None
+        if _pool is None:
+            _pool = ConnectionPool(
+                os.getenv('DATABASE_URL'),
+                minconn=int(os.getenv('DB_POOL_MIN', '1')),
+                maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                max_age=float(os.getenv('DB_POOL_MAX_AGE', '1800')),
+                health_check_after=float(os.getenv('DB_POOL_HEALTHCHECK_IDLE', '30')),
+            )
+        return _pool
+
+
+def reset_pool():
+    """Drop the current pool reference; called from gunicorn's post_fork hook."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            if _pool.pid == os.getpid():
+                _pool.closeall()
+            else:
+                _inherited.append(_pool)
+        _pool = None
+
+
+def get_db_connection():
+    """Check out a pooled database connection."""
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+
+class NotifyListener(threading.Thread):
+    """The process's one LISTEN session, shared by every notification consumer.
+
+    LISTEN needs a session, so this uses its own connection from
+    ``ACCESS_LISTEN_DATABASE_URL`` (a direct or session-mode URL; the
+    transaction pooler drops notifications). ``subscribe`` adds a channel
+    at any time; its handler is called with each batch of notifications
+    received on that channel, and ``on_listen`` after every LISTEN,
+    reconnects included, for consumers that must reload what they may
+    have missed. A handler error reconnects the session.
+    """
+
+    def __init__(self, dsn=None, poll_interval=5.0, batch_window=0.05):
+        super().__init__(name='notify-listener', daemon=True)
+        self.dsn = dsn or os.getenv('ACCESS_LISTEN_DATABASE_URL') or os.getenv('DATABASE_URL')
+        self.poll_interval = poll_interval
+        self.batch_window = batch_window
+        self.pid = os.getpid()
+        self._subscriptions = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Written to when a subscription or stop() needs the loop's attention
+        self._wake_r, self._wake_w = os.pipe()
+
+    def subscribe(self, channel, handler, on_listen=None):
+        subscription = (channel, handler, on_listen)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            self._pending.append(subscription)
+        os.write(self._wake_w, b'\0')
+
+    def stop(self):
+        self._stop_event.set()
+        os.write(self._wake_w, b'\0')
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                logger.error(f"Notify listener error: {str(e)}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with self._lock:
+                self._pending = list(self._subscriptions)
+            listening = set()
+            while not self._stop_event.is_set():
+                self._add_pending(conn, listening)
+                ready = select.select([conn, self._wake_r], [], [], self.poll_interval)[0]
+                if self._wake_r in ready:
+                    os.read(self._wake_r, 512)
+                if conn not in ready:
+                    continue
+                # Give a burst of changes a moment to arrive so it is handled once
+                time.sleep(self.batch_window)
+                conn.poll()
+                notifies = list(conn.notifies)
+                del conn.notifies[:]
+                self._dispatch(notifies)
+        finally:
+            conn.close()
+
+    def _add_pending(self, conn, listening):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        cur = conn.cursor()
+        for channel, _, _ in pending:
+            if channel not in listening:
+                cur.execute(f'LISTEN {channel}')
+                listening.add(channel)
+        cur.close()
+        # After LISTEN, so nothing changed in between is lost
+        for _, _, on_listen in pending:
+            if on_listen is not None:
+                on_listen()
+
+    def _dispatch(self, notifies):
+        by_channel = {}
+        for notify in notifies:
+            by_channel.setdefault(notify.channel, []).append(notify)
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for channel, handler, _ in subscriptions:
+            if channel in by_channel:
+                handler(by_channel[channel])
+
+
+_notify_listener = None
+_notify_lock = threading.Lock()
+
+
+def get_notify_listener():
+    """Return this process's shared LISTEN session, starting it after fork."""
+    global _notify_listener
+    with _notify_lock:
+        if _notify_listener is None or _notify_listener.pid != os.getpid():
+            _notify_listener = NotifyListener()
+            _notify_listener.start()
+        return _notify_listener
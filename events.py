@@ -0,0 +1,274 @@
+import os
+import json
+import uuid
+import threading
+import itertools
+from collections import deque
+from prometheus_client import Counter, Gauge
+from db import get_db_connection, get_notify_listener
+from access_engine import NOTIFY_CHANNEL
+from access_log_writer import EVENTS_CHANNEL
+
+BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER', '256'))
+KEEPALIVE_SECONDS = float(os.getenv('EVENTS_KEEPALIVE', '15'))
+MAX_FILTER_IDS = 50
+
+# Prometheus metrics
+EVENT_SUBSCRIBERS = Gauge(
+    'event_stream_subscribers',
+    'Open /api/events/stream connections',
+    multiprocess_mode='livesum'
+)
+
+EVENTS_PUBLISHED = Counter(
+    'event_stream_events_total',
+    'Events received from Postgres and fanned out',
+    ['type']
+)
+
+EVENTS_DROPPED = Counter(
+    'event_stream_dropped_total',
+    'Events dropped from full subscriber buffers'
+)
+
+CARD_ROUTES_QUERY = '''
+    SELECT ca.card_id, ap.id, ap.building_id
+    FROM card_access ca JOIN access_points ap ON ap.id = ca.access_point_id
+    WHERE ca.card_id = ANY(%s::uuid[])
+'''
+
+
+class EventArgsError(ValueError):
+    """Raised for malformed ``/api/events/stream`` query parameters."""
+
+
+def _parse_ids(value, name):
+    if not value:
+        return frozenset()
+    ids = [part.strip() for part in value.split(',') if part.strip()]
+    if len(ids) > MAX_FILTER_IDS:
+        raise EventArgsError(f'at most {MAX_FILTER_IDS} values for {name}')
+    try:
+        return frozenset(str(uuid.UUID(i)) for i in ids)
+    except ValueError:
+        raise EventArgsError(f'{name} must be a comma-separated list of UUIDs')
+
+
+def scope_event_filters(building_ids, access_point_ids, allowed_buildings):
+    """``building_ids`` for a caller who may only see ``allowed_buildings`` (None: all).
+
+    Without any filter the caller gets every building they may see;
+    access point filters are checked against them as events arrive.
+    Returns None when the caller asks for, or may see, no building.
+    """
+    if allowed_buildings is None:
+        return building_ids
+    if not allowed_buildings or not building_ids <= allowed_buildings:
+        return None
+    if not building_ids and not access_point_ids:
+        return allowed_buildings
+    return building_ids
+
+
+def parse_event_filters(args):
+    """Read ``building_id`` and ``access_point_id`` (comma-separated UUIDs).
+
+    An event is delivered when it matches any of the given buildings or
+    access points; with neither, every event is delivered.
+    """
+    return (_parse_ids(args.get('building_id'), 'building_id'),
+            _parse_ids(args.get('access_point_id'), 'access_point_id'))
+
+
+def format_sse(event):
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def format_dropped(count):
+    return f"event: dropped\ndata: {json.dumps({'count': count})}\n\n"
+
+
+class Subscriber:
+    """One stream's bounded buffer; the oldest events go first when it is full.
+
+    ``wake`` is called after every push from the listener thread, so the
+    consumer can block on whatever primitive suits it (a threading.Event
+    under WSGI, an asyncio.Event via call_soon_threadsafe under ASGI).
+    ``allowed_buildings`` caps what the filters can match: events of other
+    buildings are never delivered (None allows every building).
+    """
+
+    def __init__(self, building_ids=frozenset(), access_point_ids=frozenset(), maxsize=BUFFER_SIZE, wake=None,
+                 allowed_buildings=None):
+        self.building_ids = building_ids
+        self.access_point_ids = access_point_ids
+        self.allowed_buildings = allowed_buildings
+        self.ready = threading.Event()
+        self._wake = wake or self.ready.set
+        self._events = deque(maxlen=maxsize)
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def allows(self, building_ids):
+        return self.allowed_buildings is None or not self.allowed_buildings.isdisjoint(building_ids)
+
+    def push(self, event):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._dropped += 1
+                EVENTS_DROPPED.inc()
+            self._events.append(event)
+        self._wake()
+
+    def drain(self):
+        """Return ``(events, dropped)`` accumulated since the last drain."""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            dropped, self._dropped = self._dropped, 0
+        return events, dropped
+
+    def wait(self, timeout):
+        """Block until something was pushed (threaded consumers only)."""
+        fired = self.ready.wait(timeout)
+        self.ready.clear()
+        return fired
+
+
+class EventHub:
+    """Fan events out to subscribers indexed by building and access point.
+
+    Publishing touches only the subscribers an event can match, so
+    thousands of filtered streams cost little per event. Subscribers are
+    never blocked on: a slow one loses its oldest events instead.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._all = set()
+        self._by_building = {}
+        self._by_access_point = {}
+        self._count = 0
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _indexes(self, subscriber):
+        if not subscriber.building_ids and not subscriber.access_point_ids:
+            return [(None, self._all)]
+        return ([(i, self._by_building) for i in subscriber.building_ids] +
+                [(i, self._by_access_point) for i in subscriber.access_point_ids])
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            for key, index in self._indexes(subscriber):
+                if key is None:
+                    index.add(subscriber)
+                else:
+                    index.setdefault(key, set()).add(subscriber)
+            self._count += 1
+        EVENT_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for key, index in self._indexes(subscriber):
+                if key is None:
+                    index.discard(subscriber)
+                    continue
+                subs = index.get(key)
+                if subs is not None:
+                    subs.discard(subscriber)
+                    if not subs:
+                        del index[key]
+            self._count -= 1
+        EVENT_SUBSCRIBERS.dec()
+
+    def publish(self, event, building_ids=(), access_point_ids=()):
+        """Deliver ``event`` to unfiltered subscribers and those matching its ids."""
+        with self._lock:
+            event['seq'] = next(self._seq)
+            targets = set(self._all)
+            for i in building_ids:
+                targets.update(self._by_building.get(i, ()))
+            for i in access_point_ids:
+                targets.update(self._by_access_point.get(i, ()))
+        EVENTS_PUBLISHED.labels(event['type']).inc()
+        for subscriber in targets:
+            if subscriber.allows(building_ids):
+                subscriber.push(event)
+
+
+class EventListener:
+    """Feed an EventHub from ``NOTIFY access_events`` and card status changes.
+
+    Both channels come through the process's shared ``NotifyListener``,
+    whatever the number of subscribers. Events raised while it is
+    disconnected are lost; streams are live views, the history endpoints
+    are the record.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def dispatch(self, notifies):
+        status_changes = []
+        for notify in notifies:
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if notify.channel == EVENTS_CHANNEL:
+                self.hub.publish(dict(payload), [payload.get('building_id')], [payload.get('access_point_id')])
+            elif payload.get('table') == 'cards' and payload.get('status') != payload.get('old_status'):
+                status_changes.append(payload)
+        if status_changes:
+            self._publish_status_changes(status_changes)
+
+    def _publish_status_changes(self, changes):
+        # Route card events to the buildings and doors the card is granted on
+        routes = {}
+        if len(self.hub):
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(CARD_ROUTES_QUERY, ([c['card_id'] for c in changes],))
+                for card_id, access_point_id, building_id in cur.fetchall():
+                    aps, buildings = routes.setdefault(str(card_id), (set(), set()))
+                    aps.add(str(access_point_id))
+                    buildings.add(str(building_id))
+                cur.close()
+        for change in changes:
+            aps, buildings = routes.get(change['card_id'], ((), ()))
+            event = {
+                'type': 'card_status',
+                'card_id': change['card_id'],
+                'user_id': change.get('user_id'),
+                'status': change.get('status'),
+                'old_status': change.get('old_status'),
+                'op': change.get('op'),
+                'timestamp': change.get('changed_at'),
+            }
+            self.hub.publish(event, sorted(buildings), sorted(aps))
+
+
+_hub = None
+_listener = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """Return this process's event hub, starting its listener on first use."""
+    global _hub, _listener
+    pid = os.getpid()
+    if _hub is not None and _hub.pid == pid:
+        return _hub
+    with _hub_lock:
+        if _hub is None or _hub.pid != pid:
+            _hub = EventHub()
+            _listener = EventListener(_hub)
+            notify_listener = get_notify_listener()
+            notify_listener.subscribe(EVENTS_CHANNEL, _listener.dispatch)
+            notify_listener.subscribe(NOTIFY_CHANNEL, _listener.dispatch)
+        return _hub
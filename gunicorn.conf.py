@@ -0,0 +1,49 @@
+import os
+import shutil
+import secrets
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+# More than one thread selects the gthread worker, so a request waiting on
+# the bcrypt pool or the database does not hold the whole process
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Every worker must sign session tokens with the same key
+os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+
+# Workers write their metrics to files in this directory and /metrics merges
+# them, so a scrape sees every worker and not just the one that answered.
+# Must be set before any worker imports prometheus_client.
+if os.getenv('METRICS_MULTIPROCESS', '1') == '1':
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'nfc-one-metrics'))
+
+
+def on_starting(server):
+    """Start from an empty metrics directory; old files would be summed in."""
+    path = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the merged metrics."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Give every worker its own connection pool instead of the master's sockets."""
+    from db import reset_pool
+    reset_pool()
+
+
+def post_worker_init(worker):
+    """Load the access permission index before the worker takes traffic."""
+    from access_engine import get_index
+    try:
+        get_index()
+    except Exception as e:
+        worker.log.error(f"Could not preload access index: {str(e)}")
@@ -0,0 +1,97 @@
+"""Request bodies, statements and responses shared by both apps.
+
+``web_server`` and ``asgi_server`` serve the same API; everything here is
+free of I/O so each app only adds its own connection handling around it.
+"""
+from datetime import datetime
+from uids import UIDError, canonical_uid, parse_uid
+from tenants import user_scope
+from access_engine import access_point_key
+
+INSERT_CARD_SQL = 'INSERT INTO cards (user_id, card_uid, card_type, name) VALUES (%s, uid_from_hex(%s), %s, %s)'
+INSERT_LOCATION_SQL = 'INSERT INTO locations (user_id, name, description) VALUES (%s, %s, %s)'
+LOGIN_SQL = 'SELECT id, password_hash FROM users WHERE lower(email) = lower(%s)'
+# Only replace the hash we verified, in case it changed meanwhile
+REHASH_SQL = '''
+    UPDATE users SET password_hash = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND password_hash = %s
+'''
+
+
+class BodyError(ValueError):
+    """Raised for a request body that is malformed or missing fields; the message is the 400 error."""
+
+
+def _text(data, field):
+    value = data.get(field)
+    return value.strip() if isinstance(value, str) else ''
+
+
+def card_params(user_id, data):
+    """``INSERT_CARD_SQL`` parameters from a ``POST /api/cards`` body."""
+    if not isinstance(data, dict) or not data.get('card_uid') or not _text(data, 'card_type'):
+        raise BodyError('Missing card_uid or card_type')
+    try:
+        card_uid = canonical_uid(data['card_uid'])
+    except UIDError as e:
+        raise BodyError(str(e))
+    return user_id, card_uid, _text(data, 'card_type'), data.get('name') or None
+
+
+def location_params(user_id, data):
+    """``INSERT_LOCATION_SQL`` parameters from a ``POST /api/locations`` body."""
+    if not isinstance(data, dict) or not _text(data, 'name'):
+        raise BodyError('Missing name')
+    return user_id, _text(data, 'name'), data.get('description')
+
+
+def parse_login(data):
+    """``(email, password)`` from a ``POST /api/login`` body."""
+    if not isinstance(data, dict):
+        data = {}
+    email, password = data.get('email'), data.get('password')
+    if not isinstance(email, str) or not isinstance(password, str) or not email or not password:
+        raise BodyError('Missing email or password')
+    return email, password
+
+
+def login_body(session_tokens, user_id, email):
+    return {
+        'message': 'Login successful',
+        'user_id': str(user_id),
+        'token': session_tokens.issue(user_id, email),
+        'expires_in': session_tokens.ttl
+    }
+
+
+def parse_check(data):
+    """``(card_uid, access_point_id, when)`` from a ``POST /api/access/check`` body."""
+    if not isinstance(data, dict):
+        data = {}
+    if not data.get('card_uid') or not data.get('access_point_id'):
+        raise BodyError('Missing card_uid or access_point_id')
+    try:
+        card_uid = parse_uid(data['card_uid'])
+    except UIDError as e:
+        raise BodyError(str(e))
+    access_point_id = access_point_key(data['access_point_id'])
+    if access_point_id is None:
+        raise BodyError('access_point_id must be a UUID')
+    when = None
+    if data.get('timestamp'):
+        try:
+            when = datetime.fromisoformat(data['timestamp'])
+        except (TypeError, ValueError):
+            raise BodyError('timestamp must be ISO-8601')
+    return card_uid, access_point_id, when
+
+
+def list_namespace(table, scope):
+    """List-cache namespace of ``table`` pages within ``scope``, one per tenant."""
+    return f'{table}:{scope.key}'
+
+
+def invalidate_user_lists(cache, table, user_ids):
+    """Drop the cached pages of ``table`` listed for each of ``user_ids``."""
+    for user_id in set(user_ids):
+        cache.invalidate(list_namespace(table, user_scope(user_id)))
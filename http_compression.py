@@ -0,0 +1,208 @@
+"""Negotiated response compression shared by the WSGI and ASGI servers.
+
+The encoding is the first of ``COMPRESS_ENCODINGS`` (server preference,
+default ``zstd,br,gzip``) that the client's ``Accept-Encoding`` allows.
+Whole bodies under ``COMPRESS_MIN_BYTES`` go out as they are; streamed
+bodies are compressed chunk by chunk, each chunk flushed so the client
+can decode rows as they arrive. Bodies that carry an ETag are compressed
+once per ETag and encoding and then served from a per-process LRU of
+at most ``COMPRESS_CACHE_BYTES``.
+"""
+import os
+import gzip
+import zlib
+import time
+import functools
+import threading
+from collections import OrderedDict
+import brotli
+import zstandard
+from instrumentation import timed
+from metrics import COMPRESSION_INPUT, COMPRESSION_SAVED, COMPRESSION_TIME, COMPRESSION_CACHE
+
+KNOWN_ENCODINGS = ('zstd', 'br', 'gzip')
+ENCODINGS = tuple(
+    name for name in (part.strip().lower() for part in os.getenv('COMPRESS_ENCODINGS', 'zstd,br,gzip').split(','))
+    if name in KNOWN_ENCODINGS
+)
+MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+LEVELS = {
+    'gzip': int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    'br': int(os.getenv('COMPRESS_BROTLI_QUALITY', '5')),
+    'zstd': int(os.getenv('COMPRESS_ZSTD_LEVEL', '3')),
+}
+
+# Never text/event-stream: an SSE stream must reach the client unbuffered
+COMPRESSIBLE_TYPES = frozenset(('application/json', 'application/x-ndjson', 'text/csv', 'text/plain'))
+
+
+@functools.lru_cache(maxsize=256)
+def negotiate(accept_encoding):
+    """Return the preferred encoding ``accept_encoding`` allows, or None."""
+    if not accept_encoding or not ENCODINGS:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def should_compress(status, content_type, content_encoding=None):
+    """Whether a response of this status and type is worth negotiating."""
+    if status < 200 or status in (204, 206, 304) or content_encoding:
+        return False
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def weak_etag(etag):
+    """The encoded body differs byte for byte, so a strong ETag must weaken."""
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+def _compress(body, encoding):
+    level = LEVELS[encoding]
+    if encoding == 'gzip':
+        return gzip.compress(body, level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+def _observe(encoding, before, after, seconds):
+    COMPRESSION_INPUT.labels(encoding).inc(before)
+    COMPRESSION_SAVED.labels(encoding).inc(max(before - after, 0))
+    COMPRESSION_TIME.labels(encoding).observe(seconds)
+
+
+class CompressedBodies:
+    """Thread-safe LRU of compressed bodies keyed by ``(etag, encoding)``.
+
+    An ETag already changes with the table version, so entries never need
+    invalidating; stale ones just age out.
+    """
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag, encoding):
+        with self._lock:
+            body = self._entries.get((etag, encoding))
+            if body is not None:
+                self._entries.move_to_end((etag, encoding))
+            return body
+
+    def set(self, etag, encoding, body):
+        if len(body) > self.maxbytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((etag, encoding), None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[(etag, encoding)] = body
+            self.size += len(body)
+            while self.size > self.maxbytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+compressed_bodies = CompressedBodies(int(os.getenv('COMPRESS_CACHE_BYTES', str(32 * 1024 * 1024))))
+
+
+def compress(body, encoding, etag=None):
+    """Compress a whole body; with ``etag`` the result is cached."""
+    if etag:
+        cached = compressed_bodies.get(etag, encoding)
+        if cached is not None:
+            COMPRESSION_CACHE.labels('hit').inc()
+            COMPRESSION_INPUT.labels(encoding).inc(len(body))
+            COMPRESSION_SAVED.labels(encoding).inc(max(len(body) - len(cached), 0))
+            return cached
+        COMPRESSION_CACHE.labels('miss').inc()
+    started = time.perf_counter()
+    with timed('compress'):
+        data = _compress(body, encoding)
+    _observe(encoding, len(body), len(data), time.perf_counter() - started)
+    if etag:
+        compressed_bodies.set(etag, encoding, data)
+    return data
+
+
+class StreamCompressor:
+    """Incremental compressor; every ``compress`` output is decodable on its own."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        level = LEVELS[encoding]
+        if encoding == 'gzip':
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            return b''
+        started = time.perf_counter()
+        with timed('compress'):
+            if self.encoding == 'gzip':
+                data = self._obj.compress(chunk) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+            elif self.encoding == 'br':
+                data = self._obj.process(chunk) + self._obj.flush()
+            else:
+                data = self._obj.compress(chunk) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        _observe(self.encoding, len(chunk), len(data), time.perf_counter() - started)
+        return data
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class CompressedStream:
+    """Compresses a response iterable chunk by chunk.
+
+    ``close()`` closes the wrapped iterable even if iteration never
+    started, so a body that owns a connection (``streaming.RowStream``)
+    is released when the server answers HEAD without reading it.
+    """
+
+    def __init__(self, chunks, encoding):
+        self.chunks = chunks
+        self.encoding = encoding
+
+    def __iter__(self):
+        compressor = StreamCompressor(self.encoding)
+        try:
+            for chunk in self.chunks:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            self.close()
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
@@ -1,16 +1,212 @@
+import os
 import psycopg2
 import bcrypt
+import sys
 from datetime import datetime
+from access_lists import CARD_STATUSES
 
-def init_corporate_database():
-    # Connect to database
-    conn = psycopg2.connect(
+PARTITION_MONTHS_AHEAD = 3
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', '30'))
+ACCESS_LIST_LOG_DAYS = int(os.getenv('ACCESS_LIST_LOG_DAYS', '7'))
+CARD_STATUSES_SQL = '(' + ', '.join(f"'{status}'" for status in CARD_STATUSES) + ')'
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def ensure_access_log_partitions(cursor, start=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create monthly access_logs partitions from ``start`` until ``months_ahead`` past now.
+
+    A default partition catches anything outside the covered range so
+    inserts never fail; run this monthly so it stays empty.
+    """
+    month = _month_start(start or datetime.utcnow())
+    end = _month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        end = _next_month(end)
+    while month < end:
+        following = _next_month(month)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS access_logs_y{month:%Y}m{month:%m}
+            PARTITION OF access_logs
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')
+        ''')
+        month = following
+    cursor.execute('CREATE TABLE IF NOT EXISTS access_logs_default PARTITION OF access_logs DEFAULT')
+
+
+def rebuild_access_log_rollups(cursor):
+    """Recompute the hourly and daily rollups from access_logs."""
+    for rollup, unit in (('access_log_hourly', 'hour'), ('access_log_daily', 'day')):
+        cursor.execute(f'TRUNCATE {rollup}')
+        cursor.execute(f'''
+            INSERT INTO {rollup} (access_point_id, bucket, granted_count, denied_count)
+            SELECT access_point_id, date_trunc('{unit}', timestamp),
+                   count(*) FILTER (WHERE access_granted),
+                   count(*) FILTER (WHERE NOT access_granted)
+            FROM access_logs
+            GROUP BY 1, 2
+        ''')
+
+
+def ensure_uid_type(cursor):
+    """Create the ``card_uid`` domain and its hex helpers (see uids.py)."""
+    cursor.execute('''
+        DO $$ BEGIN
+            CREATE DOMAIN card_uid AS BYTEA CHECK (octet_length(VALUE) BETWEEN 4 AND 10);
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION uid_hex(uid BYTEA) RETURNS TEXT AS $$
+            SELECT upper(encode(uid, 'hex'))
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION uid_from_hex(uid TEXT) RETURNS BYTEA AS $$
+            SELECT decode(regexp_replace(uid, '[^0-9A-Fa-f]', '', 'g'), 'hex')
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    ''')
+
+
+def migrate_uid_column(cursor, table, column, triggers=()):
+    """Convert a hex TEXT UID column to ``card_uid``; its indexes are rebuilt on the bytes.
+
+    ``triggers`` that name the column must be dropped first; the caller
+    recreates them.
+    """
+    cursor.execute('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    ''', (table, column))
+    row = cursor.fetchone()
+    if row is None or row[0] != 'text':
+        return
+    for trigger in triggers:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {table}')
+    cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE card_uid USING uid_from_hex({column})')
+
+
+def migrate_card_statuses(cursor):
+    """Widen the status check of databases created before some of ``CARD_STATUSES`` existed."""
+    cursor.execute('''
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'cards'::regclass AND conname = 'cards_status_check'
+    ''')
+    row = cursor.fetchone()
+    if row is not None and all(f"'{status}'" in row[0] for status in CARD_STATUSES):
+        return
+    cursor.execute('ALTER TABLE cards DROP CONSTRAINT IF EXISTS cards_status_check')
+    cursor.execute(f'ALTER TABLE cards ADD CONSTRAINT cards_status_check CHECK (status IN {CARD_STATUSES_SQL})')
+
+
+def ensure_test_user(cursor, username, password, email, user_type):
+    """Id of a test user, created on the first run and reused after."""
+    password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    cursor.execute('''
+        INSERT INTO users (username, password_hash, email, user_type)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (username) DO NOTHING
+        RETURNING id
+    ''', (username, password_hash.decode('utf-8'), email, user_type))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute('SELECT id FROM users WHERE username = %s', (username,))
+        row = cursor.fetchone()
+    return row[0]
+
+
+def connect():
+    if os.getenv('DATABASE_URL'):
+        return psycopg2.connect(os.getenv('DATABASE_URL'))
+    return psycopg2.connect(
         dbname="postgres",
         user="postgres.xqyhrcznzkwkvgfcuebp",
         password="Y@rze2002",
         host="aws-0-eu-west-3.pooler.supabase.com",
         port="6543"
     )
+
+
+def maintain_access_log_partitions():
+    """Create upcoming access_logs partitions; run monthly from cron."""
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        ensure_access_log_partitions(cursor)
+        conn.commit()
+        print("Access log partitions are up to date.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating access log partitions: {str(e)}")
+    finally:
+        conn.close()
+
+
+def purge_sync_tombstones(days=SYNC_TOMBSTONE_DAYS):
+    """Drop tombstones older than ``days``; clients further behind resync in full.
+
+    Also trims the sync version log, keeping each table's newest entry,
+    which is all a version needs.
+    """
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM sync_tombstones WHERE deleted_at < LOCALTIMESTAMP - make_interval(days => %s)",
+            (days,)
+        )
+        purged = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM sync_version_log l
+            WHERE changed_at < LOCALTIMESTAMP - interval '1 day'
+              AND seq < (SELECT max(seq) FROM sync_version_log m WHERE m.table_name = l.table_name)
+        ''')
+        conn.commit()
+        print(f"Purged {purged} sync tombstones.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error purging sync tombstones: {str(e)}")
+    finally:
+        conn.close()
+
+
+def purge_access_list_log(days=ACCESS_LIST_LOG_DAYS):
+    """Drop access list changes older than ``days``.
+
+    Controllers whose version predates the purge download the full list
+    on their next fetch.
+    """
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            WITH purged AS (
+                DELETE FROM access_list_log
+                WHERE changed_at < LOCALTIMESTAMP - make_interval(days => %s)
+                RETURNING seq
+            )
+            UPDATE access_list_purges
+            SET purged_through = GREATEST(purged_through, (SELECT max(seq) FROM purged))
+            WHERE EXISTS (SELECT 1 FROM purged)
+        ''', (days,))
+        conn.commit()
+        print("Purged old access list changes.")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error purging access list changes: {str(e)}")
+    finally:
+        conn.close()
+
+
+def init_corporate_database():
+    # Connect to database
+    conn = connect()
     cursor = conn.cursor()
 
     try:
@@ -47,21 +243,26 @@ def init_corporate_database():
             )
         ''')
 
+        # Card UIDs are stored as raw bytes, half the size of hex text in every index
+        ensure_uid_type(cursor)
+
         # Create cards table
-        cursor.execute('''
+        cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS cards (
                 id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 user_id UUID NOT NULL,
-                card_uid TEXT NOT NULL,
+                card_uid card_uid NOT NULL,
                 card_type TEXT NOT NULL,
                 name TEXT,
-                status TEXT DEFAULT 'active' CHECK (status IN ('active', 'revoked', 'pending')),
+                status TEXT DEFAULT 'active' CHECK (status IN {CARD_STATUSES_SQL}),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (id),
                 UNIQUE(card_uid)
             )
         ''')
+        migrate_uid_column(cursor, 'cards', 'card_uid', triggers=('cards_access_list',))
+        migrate_card_statuses(cursor)
 
         # Create card_access table for mapping cards to access points with specific permissions
         cursor.execute('''
@@ -81,19 +282,73 @@ def init_corporate_database():
             )
         ''')
 
-        # Create access_logs table
+        # Create access_logs table, range-partitioned by month
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('access_logs')")
+        existing = cursor.fetchone()
+        migrate_legacy = existing is not None and existing[0] == 'r'
+        if migrate_legacy:
+            cursor.execute('ALTER TABLE access_logs RENAME TO access_logs_unpartitioned')
+            cursor.execute('''
+                ALTER TABLE access_logs_unpartitioned
+                RENAME CONSTRAINT access_logs_pkey TO access_logs_unpartitioned_pkey
+            ''')
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS access_logs (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                id UUID NOT NULL DEFAULT gen_random_uuid(),
                 card_id UUID NOT NULL,
                 access_point_id UUID NOT NULL,
                 access_granted BOOLEAN NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, timestamp),
                 FOREIGN KEY (card_id) REFERENCES cards (id),
                 FOREIGN KEY (access_point_id) REFERENCES access_points (id)
-            )
+            ) PARTITION BY RANGE (timestamp)
+        ''')
+
+        # Indexes on the parent cascade to every partition
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_access_logs_point_time
+            ON access_logs (access_point_id, timestamp DESC, id DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_access_logs_card_time
+            ON access_logs (card_id, timestamp DESC, id DESC)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_access_logs_time
+            ON access_logs (timestamp DESC, id DESC)
         ''')
 
+        # Per-access-point rollups, maintained by the access log writer
+        for rollup in ('access_log_hourly', 'access_log_daily'):
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {rollup} (
+                    access_point_id UUID NOT NULL,
+                    bucket TIMESTAMP NOT NULL,
+                    granted_count BIGINT NOT NULL DEFAULT 0,
+                    denied_count BIGINT NOT NULL DEFAULT 0,
+                    FOREIGN KEY (access_point_id) REFERENCES access_points (id),
+                    PRIMARY KEY (access_point_id, bucket)
+                )
+            ''')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{rollup}_bucket ON {rollup} (bucket, access_point_id)')
+
+        legacy_start = None
+        if migrate_legacy:
+            cursor.execute('SELECT min(timestamp) FROM access_logs_unpartitioned')
+            legacy_start = cursor.fetchone()[0]
+        ensure_access_log_partitions(cursor, start=legacy_start)
+
+        if migrate_legacy:
+            cursor.execute('''
+                INSERT INTO access_logs (id, card_id, access_point_id, access_granted, timestamp)
+                SELECT id, card_id, access_point_id, access_granted, COALESCE(timestamp, CURRENT_TIMESTAMP)
+                FROM access_logs_unpartitioned
+            ''')
+            cursor.execute('DROP TABLE access_logs_unpartitioned')
+            rebuild_access_log_rollups(cursor)
+
         # Create building_admins table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS building_admins (
@@ -119,14 +374,322 @@ def init_corporate_database():
             )
         ''')
 
-        # Create test building
+        # Tenant-scoped lists (tenants.py): keyset pages per user, cards per building
+        for table in ('cards', 'locations'):
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_id ON {table} (user_id, id)')
         cursor.execute('''
-            INSERT INTO buildings (name, address, description)
-            VALUES ('Test Building', '123 Corporate Ave', 'Test corporate building')
-            ON CONFLICT DO NOTHING
-            RETURNING id
+            CREATE INDEX IF NOT EXISTS idx_card_access_point_card
+            ON card_access (access_point_id, card_id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_building_admins_user
+            ON building_admins (user_id, building_id)
+        ''')
+
+        # Card sightings: one row per (user, card), upserted in batches by sightings.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS card_history (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID NOT NULL,
+                card_id card_uid NOT NULL,
+                card_type TEXT NOT NULL,
+                custom_name TEXT,
+                frequency TEXT,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        migrate_uid_column(cursor, 'card_history', 'card_id')
+        cursor.execute('ALTER TABLE card_history ADD COLUMN IF NOT EXISTS tap_count BIGINT NOT NULL DEFAULT 1')
+        # Fold duplicate rows into the oldest id before adding the unique index
+        cursor.execute('''
+            WITH merged AS (
+                SELECT user_id, card_id, min(id::text)::uuid AS keep, min(first_seen) AS first_seen,
+                       max(last_seen) AS last_seen, sum(tap_count) AS tap_count
+                FROM card_history GROUP BY user_id, card_id HAVING count(*) > 1
+            ), kept AS (
+                UPDATE card_history h
+                SET first_seen = m.first_seen, last_seen = m.last_seen, tap_count = m.tap_count
+                FROM merged m WHERE h.id = m.keep
+            )
+            DELETE FROM card_history h USING merged m
+            WHERE h.user_id = m.user_id AND h.card_id = m.card_id AND h.id <> m.keep
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_card_history_user_card
+            ON card_history (user_id, card_id)
+        ''')
+        # Newest sightings first, for the dashboard's history section
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_card_history_user_last_seen
+            ON card_history (user_id, last_seen DESC)
+        ''')
+
+        # Notify access decision engines of permission changes
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION notify_access_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_TABLE_NAME = 'access_points' THEN
+                    PERFORM pg_notify('access_changes', json_build_object(
+                        'table', TG_TABLE_NAME, 'id', COALESCE(NEW.id, OLD.id))::text);
+                ELSIF TG_TABLE_NAME = 'cards' THEN
+                    -- Status fields also feed the live event stream (events.py)
+                    PERFORM pg_notify('access_changes', json_build_object(
+                        'table', TG_TABLE_NAME, 'card_id', COALESCE(NEW.id, OLD.id),
+                        'user_id', COALESCE(NEW.user_id, OLD.user_id), 'op', lower(TG_OP),
+                        'status', CASE WHEN TG_OP <> 'DELETE' THEN NEW.status END,
+                        'old_status', CASE WHEN TG_OP <> 'INSERT' THEN OLD.status END,
+                        'changed_at', clock_timestamp()::timestamp)::text);
+                ELSE
+                    -- Both ids, so the index recompiles just this grant
+                    IF TG_OP <> 'INSERT' THEN
+                        PERFORM pg_notify('access_changes', json_build_object(
+                            'table', TG_TABLE_NAME, 'card_id', OLD.card_id,
+                            'access_point_id', OLD.access_point_id)::text);
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        PERFORM pg_notify('access_changes', json_build_object(
+                            'table', TG_TABLE_NAME, 'card_id', NEW.card_id,
+                            'access_point_id', NEW.access_point_id)::text);
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+
+        for table in ('cards', 'card_access', 'access_points'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_notify_access ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_notify_access
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION notify_access_change()
+            ''')
+
+        # Incremental sync: updated_at on every write, tombstones for deletes
+        # and a change log per table for list ETags
+        cursor.execute('''
+            ALTER TABLE locations
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_tombstones (
+                table_name TEXT NOT NULL,
+                row_id UUID NOT NULL,
+                user_id UUID NOT NULL,
+                deleted_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+                PRIMARY KEY (table_name, row_id)
+            )
+        ''')
+        # Writers only append here, so unlike one counter row per table they
+        # never wait on each other; a version is the newest settled seq
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_version_log (
+                seq BIGSERIAL PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                changed_at TIMESTAMP NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sync_version_log_table_seq
+            ON sync_version_log (table_name, seq)
         ''')
-        building_id = cursor.fetchone()[0]
+        cursor.execute("SELECT to_regclass('sync_versions') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            # Start past the old counters so no earlier ETag comes back
+            cursor.execute('''
+                SELECT setval(pg_get_serial_sequence('sync_version_log', 'seq'),
+                              GREATEST((SELECT max(version) FROM sync_versions), 1))
+            ''')
+            cursor.execute('DROP TABLE sync_versions')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at := clock_timestamp()::timestamp;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION record_sync_tombstone() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO sync_tombstones (table_name, row_id, user_id, deleted_at)
+                VALUES (TG_TABLE_NAME, OLD.id, OLD.user_id, clock_timestamp()::timestamp)
+                ON CONFLICT (table_name, row_id) DO UPDATE SET deleted_at = excluded.deleted_at;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION bump_sync_version() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO sync_version_log (table_name, changed_at)
+                VALUES (TG_TABLE_NAME, clock_timestamp()::timestamp);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table in ('cards', 'locations'):
+            cursor.execute('''
+                INSERT INTO sync_version_log (table_name, changed_at)
+                SELECT %s, LOCALTIMESTAMP
+                WHERE NOT EXISTS (SELECT 1 FROM sync_version_log WHERE table_name = %s)
+            ''', (table, table))
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_touch_updated_at ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_touch_updated_at
+                BEFORE UPDATE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+            ''')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_sync_tombstone ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_sync_tombstone
+                AFTER DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone()
+            ''')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_sync_version ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_sync_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_sync_version()
+            ''')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{table}_user_updated
+                ON {table} (user_id, updated_at, id)
+            ''')
+        # Grants decide which cards a building lists, so they version its pages too
+        for table in ('card_access', 'access_points'):
+            cursor.execute('''
+                INSERT INTO sync_version_log (table_name, changed_at)
+                SELECT %s, LOCALTIMESTAMP
+                WHERE NOT EXISTS (SELECT 1 FROM sync_version_log WHERE table_name = %s)
+            ''', (table, table))
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_sync_version ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_sync_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_sync_version()
+            ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_deleted
+            ON sync_tombstones (user_id, deleted_at, row_id)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted ON sync_tombstones (deleted_at)')
+
+        # Door controller access lists: every change to a card's standing in a
+        # building is appended here so controllers can fetch diffs by seq
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS access_list_log (
+                seq BIGSERIAL PRIMARY KEY,
+                building_id UUID NOT NULL,
+                card_uid card_uid NOT NULL,
+                state CHAR(1) NOT NULL CHECK (state IN ('a', 'r', 'n')),
+                changed_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+            )
+        ''')
+        migrate_uid_column(cursor, 'access_list_log', 'card_uid')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_access_list_log_building
+            ON access_list_log (building_id, seq)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_access_list_log_changed ON access_list_log (changed_at)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS access_list_purges (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                purged_through BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT INTO access_list_purges DEFAULT VALUES ON CONFLICT DO NOTHING')
+        # 'a': allowed, 'r': revoked, lost or suspended but still granted, 'n': no access in the building
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION log_access_list_state(p_card_id UUID, p_building_id UUID)
+            RETURNS void AS $$
+                INSERT INTO access_list_log (building_id, card_uid, state, changed_at)
+                SELECT p_building_id, c.card_uid,
+                       CASE WHEN NOT EXISTS (
+                                SELECT 1 FROM card_access ca
+                                JOIN access_points ap ON ap.id = ca.access_point_id
+                                WHERE ca.card_id = c.id AND ap.building_id = p_building_id) THEN 'n'
+                            WHEN c.status = 'active' THEN 'a'
+                            WHEN c.status IN ('revoked', 'lost', 'suspended') THEN 'r'
+                            ELSE 'n' END,
+                       clock_timestamp()::timestamp
+                FROM cards c WHERE c.id = p_card_id
+            $$ LANGUAGE sql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION card_buildings(p_card_id UUID) RETURNS SETOF UUID AS $$
+                SELECT DISTINCT ap.building_id FROM card_access ca
+                JOIN access_points ap ON ap.id = ca.access_point_id
+                WHERE ca.card_id = p_card_id
+            $$ LANGUAGE sql STABLE
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION log_access_list_change() RETURNS trigger AS $$
+            DECLARE
+                b UUID;
+            BEGIN
+                IF TG_TABLE_NAME = 'cards' THEN
+                    FOR b IN SELECT card_buildings(NEW.id) LOOP
+                        IF OLD.card_uid IS DISTINCT FROM NEW.card_uid THEN
+                            INSERT INTO access_list_log (building_id, card_uid, state, changed_at)
+                            VALUES (b, OLD.card_uid, 'n', clock_timestamp()::timestamp);
+                        END IF;
+                        PERFORM log_access_list_state(NEW.id, b);
+                    END LOOP;
+                ELSIF TG_TABLE_NAME = 'card_access' THEN
+                    IF TG_OP <> 'INSERT' THEN
+                        PERFORM log_access_list_state(OLD.card_id, building_id)
+                        FROM access_points WHERE id = OLD.access_point_id;
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        PERFORM log_access_list_state(NEW.card_id, building_id)
+                        FROM access_points WHERE id = NEW.access_point_id;
+                    END IF;
+                ELSE
+                    PERFORM log_access_list_state(ca.card_id, OLD.building_id)
+                    FROM card_access ca WHERE ca.access_point_id = NEW.id;
+                    PERFORM log_access_list_state(ca.card_id, NEW.building_id)
+                    FROM card_access ca WHERE ca.access_point_id = NEW.id;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS cards_access_list ON cards')
+        cursor.execute('''
+            CREATE TRIGGER cards_access_list
+            AFTER UPDATE OF status, card_uid ON cards
+            FOR EACH ROW
+            WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.card_uid IS DISTINCT FROM NEW.card_uid)
+            EXECUTE FUNCTION log_access_list_change()
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS card_access_access_list ON card_access')
+        cursor.execute('''
+            CREATE TRIGGER card_access_access_list
+            AFTER INSERT OR DELETE OR UPDATE OF card_id, access_point_id ON card_access
+            FOR EACH ROW EXECUTE FUNCTION log_access_list_change()
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS access_points_access_list ON access_points')
+        cursor.execute('''
+            CREATE TRIGGER access_points_access_list
+            AFTER UPDATE OF building_id ON access_points
+            FOR EACH ROW WHEN (OLD.building_id IS DISTINCT FROM NEW.building_id)
+            EXECUTE FUNCTION log_access_list_change()
+        ''')
+
+        # Create test building; buildings have no unique key, so look for an earlier run's first
+        cursor.execute("SELECT id FROM buildings WHERE name = 'Test Building' ORDER BY created_at LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('''
+                INSERT INTO buildings (name, address, description)
+                VALUES ('Test Building', '123 Corporate Ave', 'Test corporate building')
+                RETURNING id
+            ''')
+            row = cursor.fetchone()
+        building_id = row[0]
 
         # Create test access points
         test_access_points = [
@@ -144,14 +707,7 @@ def init_corporate_database():
             ''', (building_id, name, description, level))
 
         # Create test corporate admin
-        password_hash = bcrypt.hashpw('admin123'.encode(), bcrypt.gensalt())
-        cursor.execute('''
-            INSERT INTO users (username, password_hash, email, user_type)
-            VALUES ('corporate_admin', %s, 'corporate@example.com', 'corporate_admin')
-            ON CONFLICT (username) DO NOTHING
-            RETURNING id
-        ''', (password_hash.decode('utf-8'),))
-        admin_id = cursor.fetchone()[0]
+        admin_id = ensure_test_user(cursor, 'corporate_admin', 'admin123', 'corporate@example.com', 'corporate_admin')
 
         cursor.execute('''
             INSERT INTO corporate_admins (user_id, company_name)
@@ -160,14 +716,9 @@ def init_corporate_database():
         ''', (admin_id,))
 
         # Create test building admin
-        password_hash = bcrypt.hashpw('building123'.encode(), bcrypt.gensalt())
-        cursor.execute('''
-            INSERT INTO users (username, password_hash, email, user_type)
-            VALUES ('building_admin', %s, 'building@example.com', 'building_admin')
-            ON CONFLICT (username) DO NOTHING
-            RETURNING id
-        ''', (password_hash.decode('utf-8'),))
-        building_admin_id = cursor.fetchone()[0]
+        building_admin_id = ensure_test_user(
+            cursor, 'building_admin', 'building123', 'building@example.com', 'building_admin'
+        )
 
         cursor.execute('''
             INSERT INTO building_admins (building_id, user_id)
@@ -185,4 +736,10 @@ def init_corporate_database():
         conn.close()
 
 if __name__ == '__main__':
-    init_corporate_database() 
\ No newline at end of file
+    if '--partitions' in sys.argv:
+        maintain_access_log_partitions()
+    elif '--purge-tombstones' in sys.argv:
+        purge_sync_tombstones()
+        purge_access_list_log()
+    else:
+        init_corporate_database() 
\ No newline at end of file
@@ -0,0 +1,80 @@
+import os
+import time
+import contextlib
+import contextvars
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess
+from metrics import REQUEST_COUNT, REQUEST_LATENCY, REQUEST_PHASE_TIME
+
+UNMATCHED_ROUTE = '<unmatched>'
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+PHASES = ('db', 'pool_wait', 'bcrypt', 'serialize', 'compress')
+
+_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+class RequestTimings:
+    """Per-request phase totals, observed once the route is known.
+
+    Lives in a context variable, so time recorded from a thread pool
+    (``run_in_threadpool``) or deep inside ``db`` lands on the right request.
+    """
+
+    __slots__ = ('started', 'phases', 'token')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.token = None
+
+
+def begin_request():
+    timings = RequestTimings()
+    timings.token = _request.set(timings)
+    return timings
+
+
+def end_request(timings, method, route, status):
+    """Record the request's latency, count and phase breakdown; returns the latency."""
+    elapsed = time.perf_counter() - timings.started
+    route = route or UNMATCHED_ROUTE
+    method = method if method in METHODS else 'OTHER'
+    REQUEST_LATENCY.labels(method=method, route=route).observe(elapsed)
+    REQUEST_COUNT.labels(method=method, route=route, status=status).inc()
+    for phase, spent in timings.phases.items():
+        if spent:
+            REQUEST_PHASE_TIME.labels(route=route, phase=phase).observe(spent)
+    try:
+        _request.reset(timings.token)
+    except ValueError:
+        # Ended from another context (a streamed body); nothing to restore
+        pass
+    return elapsed
+
+
+def observe(phase, seconds):
+    """Add ``seconds`` of ``phase`` to the current request, if there is one."""
+    timings = _request.get()
+    if timings is not None:
+        timings.phases[phase] += seconds
+
+
+@contextlib.contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - started)
+
+
+def multiprocess_dir():
+    return os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir')
+
+
+def metrics_payload():
+    """Exposition for ``/metrics``: every worker's series under gunicorn."""
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import queue
+import uuid
+import atexit
+import logging
+import datetime
+import contextvars
+import re
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Identical records at or above this level are collapsed within the window
+LOG_DEDUP_WINDOW = float(os.getenv('LOG_DEDUP_WINDOW', '10'))
+LOG_DEDUP_LEVEL = logging.getLevelName(os.getenv('LOG_DEDUP_LEVEL', 'WARNING'))
+
+# One INFO record per HTTP request on the 'access' logger
+LOG_REQUESTS = os.getenv('LOG_REQUESTS', '1') == '1'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+access_logger = logging.getLogger('access')
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def request_id_from(header):
+    """Reuse a sane ``X-Request-ID`` from the proxy, else mint one."""
+    if header and _REQUEST_ID.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def log_request(method, path, route, status, elapsed):
+    if LOG_REQUESTS:
+        access_logger.info('request', extra={
+            'method': method, 'path': path, 'route': route, 'status': status,
+            'duration_ms': round(elapsed * 1000, 3)
+        })
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra`` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'request_id', None):
+            text += f' [request_id={record.request_id}]'
+        if getattr(record, 'repeated', None):
+            text += f' [repeated {record.repeated}x]'
+        return text
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hand records to the listener thread without blocking the caller.
+
+    The message is rendered and the request id captured here, in the
+    calling thread; formatting and I/O happen on the listener. When the
+    queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, 'request_id', None) is None:
+            request_id = request_id_var.get()
+            if request_id is not None:
+                record.request_id = request_id
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Deduplicator:
+    """Collapse identical records within ``window`` seconds into one plus a count.
+
+    The first record of a run goes out immediately; repeats are held back
+    and summarised as one record with ``repeated`` set when the window
+    closes. A run that is still repeating stays open, so a message logged
+    every second costs one line per window. Used only from the listener
+    thread.
+    """
+
+    def __init__(self, window=LOG_DEDUP_WINDOW, level=LOG_DEDUP_LEVEL):
+        self.window = window
+        self.level = level
+        self._runs = {}
+
+    def process(self, record, now):
+        if self.window <= 0 or record.levelno < self.level:
+            return record
+        key = (record.name, record.levelno, record.msg)
+        run = self._runs.get(key)
+        if run is None:
+            self._runs[key] = [now, 0, None]
+            return record
+        run[1] += 1
+        run[2] = record
+        return None
+
+    def expired(self, now):
+        """Summaries of runs whose window has closed."""
+        summaries = []
+        for key, run in list(self._runs.items()):
+            started, repeats, last = run
+            if now - started < self.window:
+                continue
+            if not repeats:
+                del self._runs[key]
+                continue
+            last.repeated = repeats
+            summaries.append(last)
+            run[:] = [now, 0, None]
+        return summaries
+
+
+class DedupQueueListener(QueueListener):
+    """QueueListener that deduplicates and wakes up to flush closed runs."""
+
+    def __init__(self, log_queue, queue_handler, *handlers, dedup=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.dedup = dedup or Deduplicator()
+        self._next_flush = 0.0
+
+    def dequeue(self, block):
+        while True:
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._flush(now)
+                self._next_flush = now + 1.0
+            try:
+                return self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+    def handle(self, record):
+        now = time.monotonic()
+        record = self.dedup.process(record, now)
+        if record is not None:
+            super().handle(record)
+
+    def _flush(self, now):
+        for summary in self.dedup.expired(now):
+            super().handle(summary)
+        dropped, self.queue_handler.dropped = self.queue_handler.dropped, 0
+        if dropped:
+            super().handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'Log queue full, records dropped', 'dropped': dropped
+            }))
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        # Runs still open at shutdown are reported rather than lost
+        for summary in self.dedup.expired(float('inf')):
+            super().handle(summary)
+        self.dedup.window = 0
+
+
+_listener = None
+
+
+def configure_logging(log_file=None, level=LOG_LEVEL, console=True):
+    """Route the root logger through a queue to JSON (or text) handlers.
+
+    Safe to call more than once; later calls are ignored in the same
+    process. Returns the listener so callers can stop it early.
+    """
+    global _listener
+    if _listener is not None and _listener.pid == os.getpid():
+        return _listener
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter()
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        handlers.append(RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT))
+    if console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = AsyncQueueHandler(log_queue)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = DedupQueueListener(log_queue, queue_handler, *handlers)
+    _listener.pid = os.getpid()
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -2,14 +2,16 @@ import sys
 import os
 from PySide6.QtWidgets import QApplication, QDialog
 from dotenv import load_dotenv
+from logging_config import configure_logging
 from ui.login import LoginWindow
 from ui.dashboard import DashboardWindow
 
 if __name__ == "__main__":
     load_dotenv()
+    configure_logging(os.getenv('NFC_LOG_FILE', 'nfc_card_manager.log'))
     app = QApplication(sys.argv)
     login = LoginWindow()
     if login.exec() == QDialog.Accepted:
-        dashboard = DashboardWindow(login.email_input.text())
+        dashboard = DashboardWindow(login.email_input.text(), login.session_token, login.user_id)
         dashboard.show()
         sys.exit(app.exec()) 
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+from prometheus_client import Counter, Histogram
+
+# Latency buckets are dense around the SLO target (default 10 ms) so
+# ``le="<target>"`` is an exact bucket for good/total SLO ratios
+SLO_LATENCY_SECONDS = float(os.getenv('SLO_LATENCY_SECONDS', '0.01'))
+LATENCY_BUCKETS = tuple(sorted({
+    0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    SLO_LATENCY_SECONDS
+}))
+PHASE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# HTTP metrics shared by the WSGI and ASGI servers. ``route`` is the route
+# template (``/api/cards/<card_id>/status``), never the raw path, and
+# unmatched requests share one label, so the series count stays bounded.
+REQUEST_COUNT = Counter(
+    'http_requests_total',
+    'Total HTTP requests',
+    ['method', 'route', 'status']
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+
+REQUEST_PHASE_TIME = Histogram(
+    'http_request_phase_seconds',
+    'Time one request spent in a phase: db, pool_wait, bcrypt, serialize or compress',
+    ['route', 'phase'],
+    buckets=PHASE_BUCKETS
+)
+
+# Response cache (cache.py)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by tier and result',
+    ['cache', 'tier', 'result']
+)
+
+CACHE_EVICTIONS = Counter(
+    'cache_evictions_total',
+    'Entries evicted from the local LRU to make room',
+    ['cache']
+)
+
+CACHE_COALESCED = Counter(
+    'cache_coalesced_total',
+    'Misses that waited for a concurrent load instead of querying',
+    ['cache']
+)
+
+CACHE_ERRORS = Counter(
+    'cache_shared_errors_total',
+    'Shared cache tier errors (treated as misses)',
+    ['cache']
+)
+
+# Response compression (http_compression.py)
+COMPRESSION_INPUT = Counter(
+    'http_response_compression_input_bytes_total',
+    'Response body bytes handed to the compressor',
+    ['encoding']
+)
+
+COMPRESSION_SAVED = Counter(
+    'http_response_compression_saved_bytes_total',
+    'Response body bytes saved by compression',
+    ['encoding']
+)
+
+COMPRESSION_TIME = Histogram(
+    'http_response_compression_seconds',
+    'Time to compress one response body or streamed chunk',
+    ['encoding'],
+    buckets=PHASE_BUCKETS
+)
+
+COMPRESSION_CACHE = Counter(
+    'http_response_compression_cache_total',
+    'Lookups of compressed bodies by ETag',
+    ['result']
+)
@@ -1,29 +1,288 @@
-from flask import Flask, jsonify
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from smartcard.System import readers
+from pcsc_backend import GET_UID_APDU, get_backend
+from logging_config import configure_logging
+from uids import UIDError, format_uid, parse_uid
 
 app = Flask(__name__)
 CORS(app)
 
+configure_logging(os.getenv('NFC_BRIDGE_LOG_FILE'))
+logger = logging.getLogger('nfc_bridge')
+
+# Each SSE client gets a bounded buffer; a stalled client loses its oldest events
+SUBSCRIBER_BUFFER = int(os.getenv('NFC_EVENT_BUFFER', '100'))
+KEEPALIVE_SECONDS = float(os.getenv('NFC_EVENT_KEEPALIVE', '15'))
+MAX_WAIT_SECONDS = 30.0
+
+
+class _ReaderObserver:
+    def __init__(self, service):
+        self.service = service
+
+    def update(self, observable, actions):
+        added, removed = actions
+        for reader in added:
+            self.service.reader_added(str(reader))
+        for reader in removed:
+            self.service.reader_removed(str(reader))
+
+
+class _CardObserver:
+    def __init__(self, service):
+        self.service = service
+
+    def update(self, observable, actions):
+        added, removed = actions
+        for card in added:
+            self.service.card_inserted(card)
+        for card in removed:
+            self.service.card_removed(str(card.reader))
+
+
+class ReaderService:
+    """Long-running reader daemon driven by PC/SC insert/remove events.
+
+    Keeps the state of every attached reader, including the UID of the card
+    currently on it and the last one seen, and fans tap events out to
+    subscribers so clients never have to poll.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._readers = {}
+        self._subscribers = set()
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.backend.add_reader_observer(_ReaderObserver(self))
+        self.backend.add_card_observer(_CardObserver(self))
+        logger.info(f"NFC reader service started ({self.backend.name} backend)")
+
+    def stop(self):
+        self.backend.remove_observers()
+        self._started = False
+
+    # Observer callbacks; run on the monitor threads
+
+    def reader_added(self, name):
+        with self._changed:
+            if name in self._readers:
+                return
+            self._readers[name] = {'name': name, 'present': False, 'uid': None, 'last_uid': None, 'seen_at': None}
+        logger.info(f"Reader attached: {name}")
+        self.publish('reader_added', {'reader': name})
+
+    def reader_removed(self, name):
+        with self._changed:
+            self._readers.pop(name, None)
+            self._changed.notify_all()
+        logger.info(f"Reader detached: {name}")
+        self.publish('reader_removed', {'reader': name})
+
+    def card_inserted(self, card):
+        name = str(card.reader)
+        try:
+            uid = self._read_uid(card)
+        except Exception as e:
+            logger.warning(f"Could not read card on {name}: {str(e)}")
+            self.publish('read_error', {'reader': name, 'error': str(e)})
+            return
+        seen_at = time.time()
+        with self._changed:
+            state = self._readers.setdefault(name, {'name': name})
+            state.update(present=True, uid=uid, last_uid=uid, seen_at=seen_at)
+            self._changed.notify_all()
+        logger.info(f"Card {uid} on {name}")
+        self.publish('tap', {'reader': name, 'uid': uid, 'seen_at': seen_at})
+
+    def card_removed(self, name):
+        with self._changed:
+            state = self._readers.get(name)
+            if state is None or not state['present']:
+                return
+            uid = state['uid']
+            state.update(present=False, uid=None)
+        self.publish('card_removed', {'reader': name, 'uid': uid})
+
+    def _read_uid(self, card):
+        connection = card.createConnection()
+        connection.connect()
+        try:
+            response, sw1, sw2 = connection.transmit(GET_UID_APDU)
+        finally:
+            connection.disconnect()
+        if sw1 != 0x90:
+            raise RuntimeError(f"Card not supported (SW={sw1:02X}{sw2:02X})")
+        return format_uid(response)
+
+    # Queries
+
+    def readers(self):
+        with self._lock:
+            return [dict(state) for state in self._readers.values()]
+
+    def _pick_reader(self, name):
+        if name is not None:
+            return self._readers.get(name)
+        return next(iter(self._readers.values()), None)
+
+    def current(self, name=None, wait=0.0):
+        """Return the state of ``name`` (default: the first reader).
+
+        With ``wait`` > 0, block up to that many seconds for a card to be
+        presented if none is on the reader yet. Returns None when there is
+        no such reader.
+        """
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                state = self._pick_reader(name)
+                remaining = deadline - time.monotonic()
+                if state is None or state['present'] or remaining <= 0:
+                    return dict(state) if state is not None else None
+                self._changed.wait(remaining)
+
+    # Event fan-out
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait((event, data))
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ReaderService(get_backend())
+            _service.start()
+        return _service
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.route('/read_card')
 def read_card():
-    rlist = readers()
-    if not rlist:
+    service = get_service()
+    if not service.readers():
         return jsonify({"error": "No NFC reader found"}), 404
-    reader = rlist[0]
-    connection = reader.createConnection()
     try:
-        connection.connect()
-        get_uid_cmd = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-        response, sw1, sw2 = connection.transmit(get_uid_cmd)
-        card_uid = ''.join('{:02X}'.format(x) for x in response)
-        return jsonify({"uid": card_uid})
-    except Exception as e:
-        import traceback
-        print("Error in /read_card:", traceback.format_exc())
-        if "No card on reader" in str(e) or "no smart card inserted" in str(e).lower():
-            return jsonify({"error": "No card detected. Please place a card on the reader."}), 400
-        return jsonify({"error": f"Reader error: {str(e)}"}), 500
+        wait = min(float(request.args.get('wait', 0)), MAX_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    state = service.current(request.args.get('reader'), wait)
+    if state is None:
+        return jsonify({"error": "Unknown NFC reader"}), 404
+    if not state['present']:
+        return jsonify({"error": "No card detected. Please place a card on the reader."}), 400
+    return jsonify({"uid": state['uid'], "reader": state['name'], "seen_at": state['seen_at']})
+
+
+@app.route('/readers')
+def list_readers():
+    return jsonify(get_service().readers())
+
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of reader and tap events."""
+    service = get_service()
+    subscriber = service.subscribe()
+
+    def generate():
+        try:
+            for state in service.readers():
+                yield _sse('reader', state)
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse(event, data)
+        finally:
+            service.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/mock/tap', methods=['POST'])
+def mock_tap():
+    """Simulate a tap on the mock backend (NFC_BACKEND=mock only)."""
+    service = get_service()
+    if service.backend.name != 'mock':
+        return jsonify({"error": "Not available with a hardware backend"}), 404
+    data = request.get_json(silent=True) or {}
+    if not data.get('uid'):
+        return jsonify({"error": "uid is required"}), 400
+    try:
+        uid = parse_uid(data['uid'])
+    except UIDError as e:
+        return jsonify({"error": str(e)}), 400
+    readers = service.backend.readers()
+    name = data.get('reader') or (readers[0].name if readers else None)
+    try:
+        service.backend.tap(name, uid)
+    except KeyError:
+        return jsonify({"error": "Unknown NFC reader"}), 404
+    return jsonify({"reader": name, "uid": format_uid(uid)})
+
+
+@app.route('/mock/remove', methods=['POST'])
+def mock_remove():
+    service = get_service()
+    if service.backend.name != 'mock':
+        return jsonify({"error": "Not available with a hardware backend"}), 404
+    data = request.get_json(silent=True) or {}
+    readers = service.backend.readers()
+    name = data.get('reader') or (readers[0].name if readers else None)
+    try:
+        service.backend.remove_card(name)
+    except KeyError:
+        return jsonify({"error": "Unknown NFC reader"}), 404
+    return jsonify({"reader": name})
+
 
 if __name__ == '__main__':
-    app.run(port=5000) 
\ No newline at end of file
+    get_service()
+    app.run(port=5000, threaded=True)
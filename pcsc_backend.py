@@ -0,0 +1,219 @@
+import os
+import time
+import threading
+
+# PC/SC pseudo-APDU that asks the reader for the card's UID
+GET_UID_APDU = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+
+
+class NoCardError(Exception):
+    """Raised by mock connections when no card is on the reader."""
+
+
+class MockCard:
+    def __init__(self, reader, uid):
+        self.reader = reader
+        self.uid = list(uid)
+        self.atr = [0x3B, 0x8F, 0x80, 0x01]
+
+    def createConnection(self):
+        return MockConnection(self)
+
+
+class MockConnection:
+    """Stand-in for a pyscard CardConnection."""
+
+    def __init__(self, source, timeout=None):
+        self._source = source
+        self.connected = False
+
+    def _card(self):
+        return self._source if isinstance(self._source, MockCard) else self._source.card
+
+    def connect(self, *args, **kwargs):
+        if self._card() is None:
+            raise NoCardError('No smart card inserted')
+        self.connected = True
+
+    def transmit(self, apdu):
+        card = self._card()
+        if not self.connected or card is None:
+            raise NoCardError('Card was removed')
+        reader_latency = getattr(self._source, 'latency', 0)
+        if reader_latency:
+            time.sleep(reader_latency)
+        if list(apdu) == GET_UID_APDU:
+            return list(card.uid), 0x90, 0x00
+        return [], 0x6D, 0x00  # instruction not supported
+
+    def disconnect(self):
+        self.connected = False
+
+
+class MockReader:
+    """A simulated reader; ``latency`` delays every APDU by that many seconds."""
+
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.card = None
+        self.latency = latency
+
+    def createConnection(self):
+        return MockConnection(self)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f'MockReader({self.name!r})'
+
+
+class MockBackend:
+    """In-memory PC/SC backend for development and tests without hardware.
+
+    ``add_reader``/``remove_reader`` and ``tap``/``remove_card`` drive the
+    same observer callbacks pyscard's ReaderMonitor and CardMonitor would.
+    """
+
+    name = 'mock'
+
+    def __init__(self, reader_names=('Mock Reader 0',)):
+        self._lock = threading.Lock()
+        self._readers = [MockReader(name) for name in reader_names]
+        self._reader_observers = []
+        self._card_observers = []
+
+    def readers(self):
+        with self._lock:
+            return list(self._readers)
+
+    def get_reader(self, name):
+        for reader in self.readers():
+            if reader.name == name:
+                return reader
+        raise KeyError(name)
+
+    def add_reader(self, name):
+        reader = MockReader(name)
+        with self._lock:
+            self._readers.append(reader)
+            observers = list(self._reader_observers)
+        for observer in observers:
+            observer.update(self, ([reader], []))
+        return reader
+
+    def remove_reader(self, name):
+        reader = self.get_reader(name)
+        if reader.card is not None:
+            self.remove_card(name)
+        with self._lock:
+            self._readers.remove(reader)
+            observers = list(self._reader_observers)
+        for observer in observers:
+            observer.update(self, ([], [reader]))
+
+    def tap(self, reader_name, uid):
+        """Place a card with ``uid`` (bytes or a list of ints) on a reader."""
+        reader = self.get_reader(reader_name)
+        if reader.card is not None:
+            self.remove_card(reader_name)
+        card = MockCard(reader.name, uid)
+        reader.card = card
+        for observer in list(self._card_observers):
+            observer.update(self, ([card], []))
+        return card
+
+    def remove_card(self, reader_name):
+        reader = self.get_reader(reader_name)
+        card, reader.card = reader.card, None
+        if card is not None:
+            for observer in list(self._card_observers):
+                observer.update(self, ([], [card]))
+
+    def add_reader_observer(self, observer):
+        with self._lock:
+            self._reader_observers.append(observer)
+            current = list(self._readers)
+        observer.update(self, (current, []))
+
+    def add_card_observer(self, observer):
+        with self._lock:
+            self._card_observers.append(observer)
+            current = [reader.card for reader in self._readers if reader.card is not None]
+        if current:
+            observer.update(self, (current, []))
+
+    def remove_observer(self, observer):
+        with self._lock:
+            for observers in (self._reader_observers, self._card_observers):
+                if observer in observers:
+                    observers.remove(observer)
+
+    def remove_observers(self):
+        with self._lock:
+            self._reader_observers.clear()
+            self._card_observers.clear()
+
+
+class PyscardBackend:
+    """Real PC/SC readers through pyscard's monitors."""
+
+    name = 'pcsc'
+
+    def __init__(self):
+        from smartcard.System import readers
+        from smartcard.ReaderMonitoring import ReaderMonitor
+        from smartcard.CardMonitoring import CardMonitor
+        self._readers = readers
+        self._reader_monitor = ReaderMonitor()
+        self._card_monitor = CardMonitor()
+        self._observers = []
+
+    def readers(self):
+        return self._readers()
+
+    def get_reader(self, name):
+        for reader in self.readers():
+            if str(reader) == name:
+                return reader
+        raise KeyError(name)
+
+    def add_reader_observer(self, observer):
+        self._observers.append((self._reader_monitor, observer))
+        self._reader_monitor.addObserver(observer)
+
+    def add_card_observer(self, observer):
+        self._observers.append((self._card_monitor, observer))
+        self._card_monitor.addObserver(observer)
+
+    def remove_observer(self, observer):
+        for monitor, registered in list(self._observers):
+            if registered is observer:
+                monitor.deleteObserver(observer)
+                self._observers.remove((monitor, registered))
+
+    def remove_observers(self):
+        for monitor, observer in self._observers:
+            monitor.deleteObserver(observer)
+        self._observers = []
+
+
+_mock_backend = None
+
+
+def get_backend(name=None):
+    """Return the backend named by ``name`` or ``NFC_BACKEND`` (``pcsc`` or ``mock``).
+
+    The mock backend is a process-wide singleton so tests and the bridge's
+    simulation endpoints drive the same readers.
+    """
+    global _mock_backend
+    name = (name or os.getenv('NFC_BACKEND', 'pcsc')).lower()
+    if name == 'mock':
+        if _mock_backend is None:
+            names = os.getenv('NFC_MOCK_READERS', 'Mock Reader 0').split(',')
+            _mock_backend = MockBackend([n.strip() for n in names if n.strip()])
+        return _mock_backend
+    if name == 'pcsc':
+        return PyscardBackend()
+    raise ValueError(f"Unknown NFC backend {name!r}; expected 'pcsc' or 'mock'")
@@ -0,0 +1,94 @@
+import os
+import datetime
+import functools
+from zoneinfo import ZoneInfo
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+WEEK_MASK = (1 << MINUTES_PER_WEEK) - 1
+DAY_NAMES = ('Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat')
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_schedule(schedule_start, schedule_end, days_of_week):
+    """Compile a grant's schedule into a weekly minute bitmap.
+
+    Bit ``day * 1440 + minute`` is set when access is allowed, with day 0
+    being Sunday as in ``card_access.days_of_week``. Windows whose end is
+    before their start run past midnight into the next day (Saturday's
+    into Sunday's). Returns None for an unrestricted grant. Identical
+    schedules share one bitmap.
+    """
+    if schedule_start is None and schedule_end is None and days_of_week is None:
+        return None
+    start = 0 if schedule_start is None else schedule_start.hour * 60 + schedule_start.minute
+    end = MINUTES_PER_DAY if schedule_end is None else schedule_end.hour * 60 + schedule_end.minute
+    length = end - start if end > start else MINUTES_PER_DAY - start + end
+    window = (1 << length) - 1
+    mask = 0
+    for day in set(range(7) if days_of_week is None else days_of_week):
+        if 0 <= day <= 6:
+            mask |= window << (day * MINUTES_PER_DAY + start)
+    # Fold what ran past the end of Saturday back onto Sunday
+    mask = (mask & WEEK_MASK) | (mask >> MINUTES_PER_WEEK)
+    return mask.to_bytes(MINUTES_PER_WEEK // 8, 'little')
+
+
+def minute_of_week(when):
+    """Index of ``when`` in a Sunday-based weekly minute bitmap."""
+    return ((when.isoweekday() % 7) * MINUTES_PER_DAY) + when.hour * 60 + when.minute
+
+
+def naive_utc(when, timezone=None):
+    """``when`` as naive UTC, the form access_logs and card_history store.
+
+    Naive values are read in ``timezone`` (default ``ACCESS_TIMEZONE``), as
+    the access engine reads them; None means now.
+    """
+    if when is None:
+        return datetime.datetime.utcnow()
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=ZoneInfo(timezone or os.getenv('ACCESS_TIMEZONE', 'UTC')))
+    return when.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def bitmap_allows(bitmap, minute):
+    return bitmap is None or bool(bitmap[minute >> 3] & (1 << (minute & 7)))
+
+
+def _label(minute):
+    day, minute = divmod(minute % MINUTES_PER_WEEK, MINUTES_PER_DAY)
+    return f'{DAY_NAMES[day]} {minute // 60:02d}:{minute % 60:02d}'
+
+
+def bitmap_windows(bitmap):
+    """Decode a bitmap into ``{'from', 'to', 'minutes'}`` windows for display.
+
+    ``to`` is exclusive. A window running from Saturday into Sunday is
+    reported once. None (unrestricted) decodes to an empty list.
+    """
+    if bitmap is None:
+        return []
+    mask = int.from_bytes(bitmap, 'little')
+    if mask == WEEK_MASK:
+        return [{'from': _label(0), 'to': _label(0), 'minutes': MINUTES_PER_WEEK}]
+    if not mask:
+        return []
+    # Start scanning at a clear bit so no window is split at the week boundary
+    offset = ((~mask & WEEK_MASK) & -(~mask & WEEK_MASK)).bit_length() - 1
+    rotated = ((mask >> offset) | (mask << (MINUTES_PER_WEEK - offset))) & WEEK_MASK
+    windows = []
+    position = 0
+    while rotated:
+        skip = (rotated & -rotated).bit_length() - 1
+        rotated >>= skip
+        position += skip
+        run = (~rotated & (rotated + 1)).bit_length() - 1
+        windows.append({
+            'from': _label(position + offset),
+            'to': _label(position + offset + run),
+            'minutes': run
+        })
+        rotated >>= run
+        position += run
+    return windows
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Container entry point. SERVER_MODE picks the worker model:
+#   wsgi (default) - Flask app (web_server.py) on gunicorn gthread workers
+#   asgi           - Starlette app (asgi_server.py) on gunicorn + uvicorn workers
+
+
+def main():
+    mode = os.getenv('SERVER_MODE', 'wsgi').lower()
+    args = ['gunicorn', '-c', 'gunicorn.conf.py']
+    if mode == 'wsgi':
+        args.append('web_server:app')
+    elif mode == 'asgi':
+        args += ['-k', 'uvicorn.workers.UvicornWorker', 'asgi_server:app']
+    else:
+        sys.exit(f"Unknown SERVER_MODE {mode!r}; expected 'wsgi' or 'asgi'")
+    os.execvp(args[0], args + sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
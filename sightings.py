@@ -0,0 +1,188 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import psycopg2
+from psycopg2.extras import execute_values
+from prometheus_client import Counter, Gauge, Histogram
+from db import get_db_connection, PoolTimeout
+from schedule import naive_utc
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics
+SIGHTINGS_PENDING = Gauge(
+    'card_sightings_pending',
+    'Distinct (user, card) sightings waiting to be flushed',
+    multiprocess_mode='livesum'
+)
+
+SIGHTINGS_RECORDED = Counter(
+    'card_sightings_recorded_total',
+    'Card taps absorbed by the sighting tracker'
+)
+
+SIGHTINGS_FLUSHED = Counter(
+    'card_sightings_flushed_total',
+    'card_history rows upserted by the sighting tracker'
+)
+
+SIGHTINGS_DROPPED = Counter(
+    'card_sightings_dropped_total',
+    'Card taps lost',
+    ['reason']
+)
+
+SIGHTING_FLUSH_LATENCY = Histogram(
+    'card_sightings_flush_duration_seconds',
+    'Time to upsert one batch of card sightings',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+# One statement per batch; rows are sorted so concurrent workers lock
+# card_history rows in the same order and cannot deadlock
+UPSERT_SQL = '''
+    INSERT INTO card_history (user_id, card_id, card_type, first_seen, last_seen, tap_count)
+    SELECT v.user_id, v.card_uid, coalesce(c.card_type, 'unknown'), v.first_seen, v.last_seen, v.taps
+    FROM (VALUES %s) AS v (user_id, card_uid, first_seen, last_seen, taps)
+    LEFT JOIN cards c ON c.card_uid = v.card_uid
+    ORDER BY v.user_id, v.card_uid
+    ON CONFLICT (user_id, card_id) DO UPDATE SET
+        last_seen = GREATEST(card_history.last_seen, EXCLUDED.last_seen),
+        tap_count = card_history.tap_count + EXCLUDED.tap_count
+'''
+UPSERT_TEMPLATE = '(%s::uuid, %s::bytea, %s::timestamp, %s::timestamp, %s::bigint)'
+
+
+class SightingTracker:
+    """Coalesce card taps in memory and upsert them into ``card_history``.
+
+    ``record`` only updates a dict keyed by ``(user_id, card_uid)`` holding
+    the first and latest timestamps and a tap count, so a card tapped a
+    hundred times between flushes costs one row write. A background thread
+    checks every ``flush_interval`` seconds and flushes once the oldest
+    pending tap has waited ``max_staleness`` seconds, or sooner when
+    ``batch_size`` keys are pending. A failed flush is merged back and
+    retried; new keys beyond ``max_pending`` are dropped meanwhile.
+    """
+
+    def __init__(self, flush_interval=1.0, max_staleness=5.0, batch_size=5000, max_pending=100000):
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pid = os.getpid()
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='card-sightings', daemon=True)
+        self._thread.start()
+
+    def record(self, user_id, card_uid, when=None):
+        """Note one tap of ``card_uid`` (bytes); returns False if it had to be dropped."""
+        if user_id is None:
+            return False
+        when = naive_utc(when)
+        key = (str(user_id), card_uid)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                if len(self._pending) >= self.max_pending:
+                    SIGHTINGS_DROPPED.labels(reason='pending_full').inc()
+                    return False
+                self._pending[key] = [when, when, 1]
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                SIGHTINGS_PENDING.inc()
+            else:
+                entry[1] = max(entry[1], when)
+                entry[2] += 1
+        SIGHTINGS_RECORDED.inc()
+        return True
+
+    def _due(self):
+        with self._lock:
+            if not self._pending:
+                return False
+            return (len(self._pending) >= self.batch_size or
+                    time.monotonic() - self._oldest >= self.max_staleness)
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending, self._oldest = self._pending, {}, None
+        SIGHTINGS_PENDING.dec(len(pending))
+        return pending
+
+    def _merge_back(self, pending):
+        """Return a failed batch, folding in anything recorded meanwhile."""
+        with self._lock:
+            for key, (first, last, taps) in pending.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [first, last, taps]
+                    SIGHTINGS_PENDING.inc()
+                else:
+                    entry[0] = min(entry[0], first)
+                    entry[1] = max(entry[1], last)
+                    entry[2] += taps
+            if self._pending and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            if self._due():
+                self.flush()
+
+    def flush(self):
+        pending = self._take()
+        if not pending:
+            return
+        rows = [(user_id, card_uid, first, last, taps)
+                for (user_id, card_uid), (first, last, taps) in sorted(pending.items())]
+        started = time.perf_counter()
+        try:
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+                execute_values(cur, UPSERT_SQL, rows, template=UPSERT_TEMPLATE, page_size=len(rows))
+                conn.commit()
+                cur.close()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout) as e:
+            logger.warning(f"Card sighting flush failed, retrying {len(rows)} rows: {str(e)}")
+            self._merge_back(pending)
+            return
+        except Exception as e:
+            logger.error(f"Card sighting flush failed, dropping {len(rows)} rows: {str(e)}")
+            SIGHTINGS_DROPPED.labels(reason='write_error').inc(sum(row[4] for row in rows))
+            return
+        SIGHTING_FLUSH_LATENCY.observe(time.perf_counter() - started)
+        SIGHTINGS_FLUSHED.inc(len(rows))
+
+    def close(self, timeout=5.0):
+        """Stop the flusher and write out whatever is still pending."""
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self.flush()
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Return this process's sighting tracker, starting it on first use."""
+    global _tracker
+    pid = os.getpid()
+    if _tracker is not None and _tracker.pid == pid:
+        return _tracker
+    with _tracker_lock:
+        if _tracker is None or _tracker.pid != pid:
+            _tracker = SightingTracker(
+                flush_interval=float(os.getenv('SIGHTING_FLUSH_INTERVAL', '1.0')),
+                max_staleness=float(os.getenv('SIGHTING_MAX_STALENESS', '5.0')),
+                batch_size=int(os.getenv('SIGHTING_BATCH_SIZE', '5000')),
+                max_pending=int(os.getenv('SIGHTING_MAX_PENDING', '100000')),
+            )
+            atexit.register(_tracker.close)
+        return _tracker
@@ -0,0 +1,190 @@
+import uuid
+import datetime
+import decimal
+import itertools
+import orjson
+from instrumentation import timed
+from uids import format_uid
+
+# Explicit projections for the list endpoints; never SELECT *
+CARD_COLUMNS = ('id', 'user_id', 'card_uid', 'card_type', 'name', 'status', 'created_at', 'updated_at')
+LOCATION_COLUMNS = ('id', 'user_id', 'name', 'description', 'created_at')
+
+DEFAULT_ITERSIZE = 500
+MAX_LIMIT = 100000
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+_cursor_ids = itertools.count()
+
+
+class PageArgsError(ValueError):
+    """Raised for malformed ``limit``/``after`` query parameters."""
+
+
+def json_default(value):
+    """Encode the non-JSON types psycopg2 hands back."""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (bytes, memoryview)):
+        # bytea columns are card UIDs
+        return format_uid(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(value, sort_keys=False, indent=False):
+    """Encode ``value`` as UTF-8 JSON bytes.
+
+    orjson writes datetimes and UUIDs itself; ``json_default`` only sees
+    Decimal and bytea values.
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(value, default=json_default, option=option)
+
+
+def parse_page_args(args):
+    """Read ``limit`` and ``after`` from a request's query string.
+
+    ``limit`` is optional; without it the whole table is streamed.
+    ``after`` is the ``id`` of the last row of the previous page.
+    """
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PageArgsError('limit must be an integer')
+        if limit < 1 or limit > MAX_LIMIT:
+            raise PageArgsError(f'limit must be between 1 and {MAX_LIMIT}')
+    after = args.get('after')
+    if after is not None:
+        try:
+            after = str(uuid.UUID(after))
+        except ValueError:
+            raise PageArgsError('after must be a row id')
+    return limit, after
+
+
+def wants_ndjson(request):
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def build_keyset_query(table, columns, after=None, limit=None, where=None, params=()):
+    """Build the keyset query over ``table`` ordered by ``id``.
+
+    ``where`` is an optional extra SQL predicate using ``params``.
+    """
+    clauses = []
+    query_params = list(params)
+    if where:
+        clauses.append(where)
+    if after is not None:
+        clauses.append('id > %s')
+        query_params.append(after)
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    query += ' ORDER BY id'
+    if limit is not None:
+        query += ' LIMIT %s'
+        query_params.append(limit)
+    return query, query_params
+
+
+def open_keyset_cursor(conn, table, columns, after=None, limit=None, where=None, params=(),
+                       itersize=DEFAULT_ITERSIZE):
+    """Open a server-side cursor for ``build_keyset_query``.
+
+    Rows are pulled ``itersize`` at a time, so memory stays flat whatever
+    the table size.
+    """
+    query, query_params = build_keyset_query(table, columns, after, limit, where, params)
+    cur = conn.cursor(name=f'stream_{table}_{next(_cursor_ids)}')
+    cur.itersize = itersize
+    cur.execute(query, query_params)
+    return cur
+
+
+def encode_chunk(rows, columns, ndjson, first):
+    """Encode one batch of rows as bytes; returns them and the updated ``first`` flag."""
+    with timed('serialize'):
+        return _encode_rows(rows, columns, ndjson, first)
+
+
+def _encode_rows(rows, columns, ndjson, first):
+    if not rows:
+        return b'', first
+    if ndjson:
+        return b''.join(
+            orjson.dumps(dict(zip(columns, row)), default=json_default, option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        ), first
+    # One call for the whole batch; the caller writes the enclosing brackets
+    body = orjson.dumps([dict(zip(columns, row)) for row in rows], default=json_default)[1:-1]
+    return body if first else b',' + body, False
+
+
+class RowStream:
+    """The cursor's rows as chunked JSON (an array) or NDJSON.
+
+    Owns ``conn`` and ``cur``: both are released when iteration ends or
+    ``close()`` is called, whichever comes first. The WSGI server closes
+    a response body it never iterates (HEAD, client gone before the first
+    chunk), which a generator's ``finally`` would not see.
+    """
+
+    def __init__(self, conn, cur, columns, ndjson=False, logger=None):
+        self._conn = conn
+        self._cur = cur
+        self.columns = columns
+        self.ndjson = ndjson
+        self.logger = logger
+
+    def __iter__(self):
+        try:
+            cur = self._cur
+            if cur is None:
+                return
+            if not self.ndjson:
+                yield b'['
+            first = True
+            while True:
+                rows = cur.fetchmany(cur.itersize)
+                if not rows:
+                    break
+                chunk, first = encode_chunk(rows, self.columns, self.ndjson, first)
+                yield chunk
+            if not self.ndjson:
+                yield b']'
+        except Exception as e:
+            # Headers are already sent; a truncated body is the only signal left
+            if self.logger is not None:
+                self.logger.error(f"Error streaming rows: {str(e)}")
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        conn, cur = self._conn, self._cur
+        self._conn = self._cur = None
+        if conn is None:
+            return
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+def iter_json(conn, cur, columns, ndjson=False, logger=None):
+    """Stream the cursor's rows; see ``RowStream``."""
+    return RowStream(conn, cur, columns, ndjson, logger)
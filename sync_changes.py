@@ -0,0 +1,173 @@
+import os
+import uuid
+import hashlib
+import datetime
+from streaming import CARD_COLUMNS, LOCATION_COLUMNS
+from access_history import HistoryArgsError, encode_cursor, decode_cursor
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# The watermark never passes the start of a transaction that is still
+# writing (its rows can commit later with an earlier updated_at); this
+# margin covers sessions pg_stat_activity does not show us
+SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', '2'))
+# Must match how long purge_sync_tombstones keeps deletes around
+TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', '30'))
+
+# Latest moment every row stamped at or before it is known to be committed;
+# needs a ``settle`` parameter (seconds)
+HORIZON_CTE = '''
+    horizon AS (
+        SELECT LEAST(
+            LOCALTIMESTAMP - make_interval(secs => %(settle)s),
+            (SELECT min(xact_start)::timestamp FROM pg_stat_activity
+             WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid())
+        ) AS until
+    )
+'''
+
+SYNC_LOCATION_COLUMNS = LOCATION_COLUMNS + ('updated_at',)
+# row_to_json would render bytea as '\\x...'; send the API's hex form
+SYNC_CARD_COLUMNS = tuple('uid_hex(card_uid) AS card_uid' if c == 'card_uid' else c for c in CARD_COLUMNS)
+SYNC_TABLES = ('cards', 'locations')
+
+_START = (datetime.datetime(1970, 1, 1), '00000000-0000-0000-0000-000000000000')
+
+
+class SyncArgsError(ValueError):
+    """Raised for malformed ``/api/sync`` query parameters."""
+
+
+def parse_sync_args(args):
+    """Read ``since`` (an opaque watermark) and ``limit``.
+
+    Returns ``(since, limit, reset)``; ``reset`` is set when the watermark
+    is older than the tombstone retention, in which case the client must
+    drop its copy and the sync restarts from the beginning.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise SyncArgsError('limit must be an integer')
+    if limit < 1 or limit > MAX_LIMIT:
+        raise SyncArgsError(f'limit must be between 1 and {MAX_LIMIT}')
+    since = args.get('since')
+    if not since:
+        return None, limit, False
+    try:
+        since = decode_cursor(since)
+    except HistoryArgsError:
+        raise SyncArgsError('since is not a valid watermark')
+    if since[0] < datetime.datetime.utcnow() - datetime.timedelta(days=TOMBSTONE_DAYS):
+        return None, limit, True
+    return since, limit, False
+
+
+def build_sync_query(user_id, since=None, limit=DEFAULT_LIMIT):
+    """Rows of ``user_id`` changed or deleted after ``since``, oldest first.
+
+    Cards, locations and tombstones are merged on ``(changed_at, id)`` so one
+    watermark covers all three; each branch is its own index range scan.
+    """
+    moment, row_id = since or _START
+    params = {
+        'user_id': user_id,
+        'moment': moment,
+        'row_id': row_id,
+        'settle': SETTLE_SECONDS,
+        'fetch': limit + 1,
+    }
+    branches = []
+    for table, columns in (('cards', SYNC_CARD_COLUMNS), ('locations', SYNC_LOCATION_COLUMNS)):
+        branches.append(f'''
+            (SELECT '{table}' AS kind, t.id, t.updated_at AS changed_at, row_to_json(t) AS data
+             FROM (SELECT {', '.join(columns)} FROM {table}, horizon
+                   WHERE user_id = %(user_id)s AND updated_at <= horizon.until
+                     AND (updated_at, id) > (%(moment)s, %(row_id)s::uuid)
+                   ORDER BY updated_at, id
+                   LIMIT %(fetch)s) t)
+        ''')
+    branches.append('''
+        (SELECT 'deleted:' || table_name, row_id, deleted_at, NULL::json
+         FROM sync_tombstones, horizon
+         WHERE user_id = %(user_id)s AND deleted_at <= horizon.until
+           AND (deleted_at, row_id) > (%(moment)s, %(row_id)s::uuid)
+         ORDER BY deleted_at, row_id
+         LIMIT %(fetch)s)
+    ''')
+    query = f'''
+        WITH {HORIZON_CTE}
+        SELECT kind, id, changed_at, data FROM (
+            {' UNION ALL '.join(branches)}
+        ) changes
+        ORDER BY changed_at, id
+        LIMIT %(fetch)s
+    '''
+    return query, params
+
+
+def shape_changes(rows, limit, since=None, reset=False):
+    """Build the ``/api/sync`` payload from ``build_sync_query`` rows."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    payload = {table: [] for table in SYNC_TABLES}
+    payload['deleted'] = {table: [] for table in SYNC_TABLES}
+    for kind, row_id, changed_at, data in rows:
+        if kind.startswith('deleted:'):
+            payload['deleted'][kind.split(':', 1)[1]].append(str(row_id))
+        else:
+            payload[kind].append(data)
+    if rows:
+        watermark = encode_cursor(rows[-1][2], rows[-1][1])
+    else:
+        watermark = encode_cursor(*since) if since else None
+    payload.update(watermark=watermark, has_more=has_more, reset=reset)
+    return payload
+
+
+def query_changes(conn, user_id, since=None, limit=DEFAULT_LIMIT, reset=False):
+    query, params = build_sync_query(user_id, since, limit)
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    return shape_changes(rows, limit, since, reset)
+
+
+# Newest settled change to any of %(tables)s: a seq stamped after the start
+# of a write still in flight is not counted until that write is done, so
+# the version cannot move past a change that commits later. Lags a commit
+# by up to SETTLE_SECONDS.
+VERSION_SQL = f'''
+    WITH {HORIZON_CTE}
+    SELECT max(latest.seq) FROM unnest(%(tables)s::text[]) AS t(name), horizon,
+    LATERAL (SELECT seq FROM sync_version_log
+             WHERE table_name = t.name AND changed_at <= horizon.until
+             ORDER BY seq DESC LIMIT 1) latest
+'''
+
+
+def version_params(*tables):
+    return {'tables': list(tables), 'settle': SETTLE_SECONDS}
+
+
+def list_etag(table, version, *args):
+    """Strong ETag for a list response: the table's change version plus the query."""
+    key = ':'.join(str(part) for part in (table, version) + args)
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # If-None-Match uses weak comparison
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def user_id_from_claims(claims):
+    try:
+        return str(uuid.UUID(claims['sub']))
+    except (KeyError, ValueError):
+        return None
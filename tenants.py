@@ -0,0 +1,90 @@
+"""Caller-scoped list queries for multi-tenant deployments.
+
+An individual lists only their own cards and locations (keyed by
+``user_id``); a building admin lists the cards granted anywhere in their
+building (keyed by ``building_id``). A ``Scope`` carries the extra
+predicate for ``build_keyset_query`` and the tenant key that goes into
+cache keys and ETags, so one tenant's pages never answer another's.
+"""
+import uuid
+
+# Both served by the composite indexes init_corporate_db creates:
+# (user_id, id) on cards and locations, (access_point_id, card_id) on card_access
+USER_WHERE = 'user_id = %s'
+BUILDING_CARDS_WHERE = '''
+    id IN (SELECT ca.card_id FROM card_access ca
+           JOIN access_points ap ON ap.id = ca.access_point_id
+           WHERE ap.building_id = %s)
+'''
+
+# Corporate admins administer every building
+BUILDING_ADMIN_SQL = '''
+    SELECT EXISTS (SELECT 1 FROM building_admins WHERE building_id = %(building_id)s AND user_id = %(user_id)s)
+        OR EXISTS (SELECT 1 FROM corporate_admins WHERE user_id = %(user_id)s)
+'''
+
+# (corporate admin?, ids of the buildings administered)
+ADMIN_BUILDINGS_SQL = '''
+    SELECT EXISTS (SELECT 1 FROM corporate_admins WHERE user_id = %(user_id)s),
+           ARRAY(SELECT building_id::text FROM building_admins WHERE user_id = %(user_id)s)
+'''
+
+
+class TenantArgsError(ValueError):
+    """Raised for a malformed tenant id in the path."""
+
+
+class Scope:
+    """A tenant filter: SQL predicate, its parameters and a cache key.
+
+    ``tables`` names the other tables the predicate reads; their versions
+    go into the ETag and cache key along with the listed table's.
+    """
+
+    __slots__ = ('key', 'where', 'params', 'tables')
+
+    def __init__(self, key, where=None, params=(), tables=()):
+        self.key = key
+        self.where = where
+        self.params = params
+        self.tables = tables
+
+
+UNSCOPED = Scope('all')
+
+
+def parse_tenant_id(value, name):
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        raise TenantArgsError(f'{name} must be a UUID')
+
+
+def user_scope(user_id):
+    return Scope(f'user:{user_id}', USER_WHERE, (user_id,))
+
+
+def building_cards_scope(building_id):
+    return Scope(f'building:{building_id}', BUILDING_CARDS_WHERE, (building_id,), ('card_access', 'access_points'))
+
+
+def is_building_admin(conn, building_id, user_id):
+    cur = conn.cursor()
+    cur.execute(BUILDING_ADMIN_SQL, {'building_id': building_id, 'user_id': user_id})
+    allowed = cur.fetchone()[0]
+    cur.close()
+    return allowed
+
+
+def shape_admin_buildings(row):
+    """Buildings from an ``ADMIN_BUILDINGS_SQL`` row; None means every building."""
+    corporate, building_ids = row
+    return None if corporate else frozenset(building_ids)
+
+
+def admin_buildings(conn, user_id):
+    cur = conn.cursor()
+    cur.execute(ADMIN_BUILDINGS_SQL, {'user_id': user_id})
+    buildings = shape_admin_buildings(cur.fetchone())
+    cur.close()
+    return buildings
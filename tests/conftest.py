@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='nfc-one-test-logs-'))
+os.environ.setdefault('LOG_REQUESTS', '0')
+
+import pytest  # noqa: E402
+
+
+class FakeCursor:
+    """Enough of a psycopg2 cursor for the list routes."""
+
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = 500
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((query, params))
+        self._rows = list(self.conn.results.pop(0)) if self.conn.results else []
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool, results):
+        self.pool = pool
+        self.results = results
+        self.queries = []
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.pool.checked_out -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class FakePool:
+    """Counts checked-out connections; each gets the next queued results.
+
+    ``results`` holds, per connection, a list of row lists: one per
+    ``execute`` in order.
+    """
+
+    def __init__(self):
+        self.checked_out = 0
+        self.results = []
+        self.connections = []
+
+    def connect(self):
+        self.checked_out += 1
+        self.connections.append(FakeConnection(self, self.results.pop(0) if self.results else []))
+        return self.connections[-1]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    import web_server
+    fake = FakePool()
+    monkeypatch.setattr(web_server, 'get_db_connection', fake.connect)
+    return fake
+
+
+@pytest.fixture
+def client():
+    import web_server
+    web_server.app.testing = True
+    return web_server.app.test_client()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """DSN of ``TEST_DATABASE_URL`` with a fresh ``public`` schema holding the base tables."""
+    dsn = os.getenv('TEST_DATABASE_URL')
+    if not dsn:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    import psycopg2
+    import seed
+    seed.reset_schema(dsn)
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.cursor().execute(seed.BASE_SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+    monkeypatch.setenv('DATABASE_URL', dsn)
+    return dsn
@@ -0,0 +1,54 @@
+import uuid
+import datetime
+
+import pytest
+
+from access_engine import PermissionIndex, access_point_key
+from conftest import FakePool
+
+CARD_ID, USER_ID = str(uuid.uuid4()), str(uuid.uuid4())
+DOOR, GATE = str(uuid.uuid4()), str(uuid.uuid4())
+UID = b'\x04\xa1\xb2\xc3'
+
+
+@pytest.fixture
+def index():
+    # ACCESS_POINT_QUERY, CARD_QUERY, GRANT_QUERY; the gate needs level 2
+    pool = FakePool()
+    pool.results = [[
+        [(uuid.UUID(DOOR), None), (uuid.UUID(GATE), 2)],
+        [(uuid.UUID(CARD_ID), UID, 'active', uuid.UUID(USER_ID))],
+        [(uuid.UUID(CARD_ID), uuid.UUID(DOOR), 1, datetime.time(8), datetime.time(18), [1, 2, 3, 4, 5]),
+         (uuid.UUID(CARD_ID), uuid.UUID(GATE), 1, None, None, None)],
+    ]]
+    index = PermissionIndex('UTC')
+    index.load(pool.connect())
+    return index
+
+
+def test_access_point_ids_are_keyed_as_lower_case_uuids():
+    assert access_point_key(DOOR.upper()) == DOOR
+    assert access_point_key(uuid.UUID(DOOR)) == DOOR
+    assert access_point_key('door') is None
+    assert access_point_key([DOOR]) is None
+
+
+@pytest.mark.parametrize('card_uid, access_point_id, when, reason', [
+    (UID, DOOR, datetime.datetime(2026, 1, 5, 9), 'granted'),
+    (UID, DOOR.upper(), datetime.datetime(2026, 1, 5, 9), 'granted'),
+    (UID, DOOR, datetime.datetime(2026, 1, 4, 9), 'outside_schedule'),
+    (UID, GATE, None, 'insufficient_level'),
+    (UID, str(uuid.uuid4()), None, 'unknown_access_point'),
+    (UID, [DOOR], None, 'unknown_access_point'),
+    (b'\x04\x00\x00\x00', DOOR, None, 'unknown_card'),
+])
+def test_decisions(index, card_uid, access_point_id, when, reason):
+    decision = index.check(card_uid, access_point_id, when)
+    assert (decision.granted, decision.reason) == (reason == 'granted', reason)
+
+
+def test_the_route_rejects_malformed_access_point_ids(client):
+    for access_point_id in (['x'], 'door'):
+        response = client.post('/api/access/check', json={'card_uid': '04A1B2C3', 'access_point_id': access_point_id})
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'access_point_id must be a UUID'}
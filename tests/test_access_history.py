@@ -0,0 +1,49 @@
+import uuid
+import datetime
+
+import pytest
+
+from access_history import VISIBLE_LOGS_WHERE, HistoryArgsError, parse_history_args, build_logs_query
+
+
+def test_offset_since_against_default_until():
+    since = (datetime.datetime.utcnow() - datetime.timedelta(hours=1)).replace(microsecond=0)
+    args = parse_history_args({'since': since.isoformat() + '+02:00'})
+    assert args['since'] == since - datetime.timedelta(hours=2)
+    assert args['since'].tzinfo is None and args['until'].tzinfo is None
+
+
+def test_offsets_are_compared_in_utc():
+    args = parse_history_args({'since': '2026-01-01T10:00:00+02:00', 'until': '2026-01-01T09:00:00+00:00'})
+    assert args['since'] == datetime.datetime(2026, 1, 1, 8)
+    assert args['until'] == datetime.datetime(2026, 1, 1, 9)
+    with pytest.raises(HistoryArgsError):
+        parse_history_args({'since': '2026-01-01T10:00:00+00:00', 'until': '2026-01-01T11:00:00+02:00'})
+
+
+def test_access_logs_require_a_session(client, pool):
+    assert client.get('/api/access-logs').status_code == 401
+    assert client.get('/api/access-logs/stats').status_code == 401
+    assert pool.checked_out == 0
+
+
+def test_access_logs_are_scoped_to_the_caller(client, pool, monkeypatch):
+    import web_server
+    user_id = str(uuid.uuid4())
+    seen = []
+
+    def query_logs(conn, viewer_id, **args):
+        seen.append(viewer_id)
+        return [], None
+
+    monkeypatch.setattr(web_server, 'query_logs', query_logs)
+    token = web_server.session_tokens.issue(user_id, 'user@example.com')
+    response = client.get('/api/access-logs', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert seen == [user_id]
+
+
+def test_logs_query_filters_by_viewer():
+    query, params = build_logs_query('viewer', since=1, until=2)
+    assert VISIBLE_LOGS_WHERE in query
+    assert params.count('viewer') == query.count('user_id = %s')
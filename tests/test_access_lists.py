@@ -0,0 +1,99 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+import access_lists
+import web_server
+
+BUILDING = str(uuid.uuid4())
+USER = str(uuid.uuid4())
+PATH = f'/api/buildings/{BUILDING}/access-list'
+# purged_through, version, full list rows
+FULL = [[(0,)], [(12,)], [('04A1B2C3', 'active'), ('04D4E5F6', 'revoked')]]
+
+
+def session(user_id=USER):
+    return {'Authorization': f"Bearer {web_server.session_tokens.issue(user_id, 'user@example.com')}",
+            'Accept': 'application/json'}
+
+
+@pytest.fixture
+def controller_token(monkeypatch):
+    monkeypatch.setattr(access_lists, 'CONTROLLER_TOKEN', 'door-secret')
+    return {'Authorization': 'Bearer door-secret', 'Accept': 'application/json'}
+
+
+def test_controller_token_gets_full_list(client, pool, controller_token):
+    pool.results.append(list(FULL))
+    response = client.get(PATH, headers=controller_token)
+    assert response.status_code == 200
+    assert response.get_json()['allowed'] == ['04A1B2C3']
+    assert response.get_json()['revoked'] == ['04D4E5F6']
+    assert pool.checked_out == 0
+
+
+def test_building_admin_gets_full_list(client, pool):
+    pool.results.append([[(True,)]] + FULL)
+    response = client.get(PATH, headers=session())
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 12
+
+
+def test_other_session_is_denied(client, pool):
+    pool.results.append([[(False,)]])
+    response = client.get(PATH, headers=session())
+    assert response.status_code == 403
+    assert pool.checked_out == 0
+
+
+def test_missing_token_is_rejected(client, pool):
+    assert client.get(PATH).status_code == 401
+    assert client.get(PATH, headers={'Authorization': 'Bearer nope'}).status_code == 401
+
+
+CARD = str(uuid.uuid4())
+UPDATED = [(CARD, '04A1B2C3', 'lost', datetime(2026, 1, 2, 3, 4, 5), USER)]
+
+
+def test_owner_can_report_card_lost(client, pool):
+    pool.results.append([list(UPDATED)])
+    response = client.put(f'/api/cards/{CARD}/status', json={'status': 'lost'}, headers=session())
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'lost'
+    assert pool.checked_out == 0
+
+
+@pytest.mark.parametrize('status', ['active', 'revoked', 'pending'])
+def test_owner_cannot_reactivate_or_revoke(client, pool, status):
+    response = client.put(f'/api/cards/{CARD}/status', json={'status': status}, headers=session())
+    assert response.status_code == 400
+
+
+def test_owner_cannot_change_revoked_card(client, pool):
+    # SET_STATUS_SQL matches no row once the card is revoked
+    pool.results.append([[]])
+    response = client.put(f'/api/cards/{CARD}/status', json={'status': 'lost'}, headers=session())
+    assert response.status_code == 404
+
+
+def test_malformed_card_id_is_rejected(client, pool):
+    response = client.put('/api/cards/not-a-uuid/status', json={'status': 'lost'}, headers=session())
+    assert response.status_code == 400
+    assert pool.checked_out == 0
+
+
+def test_building_admin_can_reactivate(client, pool):
+    pool.results.append([[(True,)], [(CARD, '04A1B2C3', 'active', datetime(2026, 1, 2, 3, 4, 5), USER)]])
+    response = client.put(f'/api/buildings/{BUILDING}/cards/{CARD}/status', json={'status': 'active'},
+                          headers=session())
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'active'
+
+
+def test_non_admin_cannot_set_building_card_status(client, pool):
+    pool.results.append([[(False,)]])
+    response = client.put(f'/api/buildings/{BUILDING}/cards/{CARD}/status', json={'status': 'revoked'},
+                          headers=session())
+    assert response.status_code == 403
+    assert pool.checked_out == 0
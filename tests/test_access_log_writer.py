@@ -0,0 +1,78 @@
+import json
+import uuid
+import datetime
+
+import psycopg2
+import pytest
+
+from access_log_writer import AccessLogWriter, DEAD_LETTER_NAME, _journal_line
+
+WHEN = datetime.datetime(2026, 1, 2, 3, 4, 5)
+
+
+def record(card_id='card'):
+    return (str(uuid.uuid4()), card_id, 'door', True, WHEN)
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = AccessLogWriter(journal_path=str(tmp_path / 'access_logs.1.journal'), max_attempts=3)
+    writer.close()
+    writer.written = []
+
+    def write(records, source):
+        # Stands in for Postgres: rejects any batch holding a 'bad' card
+        if any(r[1] == 'bad' for r in records):
+            raise psycopg2.DataError('invalid input syntax for type uuid')
+        writer.written.extend(records)
+
+    writer._write = write
+    return writer
+
+
+def journal(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rejected_record_is_isolated_and_journaled(writer):
+    batch = [record() for _ in range(7)] + [record('bad')]
+    writer._flush(batch)
+    assert writer.written == batch[:7]
+    [entry] = journal(writer.journal_path)
+    assert entry[0] == batch[7][0] and entry[5] == 1
+
+
+def test_connection_error_spills_whole_batch(writer):
+    def down(records, source):
+        raise psycopg2.OperationalError('connection refused')
+
+    writer._write = down
+    batch = [record() for _ in range(3)]
+    writer._flush(batch)
+    assert [entry[0] for entry in journal(writer.journal_path)] == [r[0] for r in batch]
+
+
+def test_replay_retries_then_dead_letters_without_blocking(writer, tmp_path):
+    poison, later = record('bad'), record()
+    with open(writer.journal_path, 'w') as f:
+        f.write(_journal_line(poison, 1))
+        f.write(_journal_line(later))
+    writer._replay_journal()
+    assert [r[0] for r in writer.written] == [later[0]]
+    assert journal(writer.journal_path)[0][5] == 2
+
+    writer._replay_journal()
+    assert not writer._has_journal()
+    [dead] = journal(tmp_path / DEAD_LETTER_NAME)
+    assert dead[0] == poison[0] and dead[5] == 3
+
+
+def test_submit_stores_naive_utc(writer, monkeypatch):
+    monkeypatch.setenv('ACCESS_TIMEZONE', 'Europe/Berlin')
+    writer.submit('card', 'door', True, WHEN)
+    writer.submit('card', 'door', True, WHEN.replace(tzinfo=datetime.timezone.utc))
+    writer.submit('card', 'door', True)
+    stamps = [writer._queue.get_nowait()[4] for _ in range(3)]
+    assert stamps[:2] == [WHEN - datetime.timedelta(hours=1), WHEN]
+    assert all(stamp.tzinfo is None for stamp in stamps)
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import auth
+from auth import (
+    LoginRateLimiter, PasswordVerifier, RateLimited, SharedLoginRateLimiter, VerifierTimeout, dummy_hash
+)
+
+
+@pytest.fixture
+def verifier():
+    verifier = PasswordVerifier(workers=1, timeout=0.05, rounds=4)
+    yield verifier
+    verifier.shutdown()
+
+
+def test_a_job_that_outlives_the_timeout_raises_verifier_timeout(verifier, monkeypatch):
+    monkeypatch.setattr(verifier, '_submit', lambda fn, *args: Future())
+    with pytest.raises(VerifierTimeout):
+        verifier.check(b'pw', dummy_hash(4))
+    with pytest.raises(VerifierTimeout):
+        asyncio.run(verifier.check_async(b'pw', dummy_hash(4)))
+
+
+def test_unknown_accounts_run_one_check_against_the_fixed_hash(verifier, monkeypatch):
+    jobs = []
+    monkeypatch.setattr(verifier, '_run', lambda fn, operation, *args: jobs.append((fn, args)) or True)
+    assert verifier.check(b'pw', None) is False
+    assert jobs == [(auth._checkpw, (b'pw', dummy_hash(4)))]
+
+
+def test_the_dummy_hash_matches_no_password_at_the_configured_cost():
+    import bcrypt
+    assert auth.hash_rounds(dummy_hash(4)) == 4
+    assert not bcrypt.checkpw(b'', dummy_hash(4))
+
+
+def test_the_verifier_timeout_answers_503(pool, client, monkeypatch):
+    pool.results = [[[('6f1c2a34-0000-4000-8000-000000000001', dummy_hash(4).decode())]]]
+
+    class SlowVerifier:
+        def check(self, password, stored_hash):
+            raise VerifierTimeout('Password check took longer than 10s')
+
+    monkeypatch.setattr('web_server.get_verifier', lambda: SlowVerifier())
+    response = client.post('/api/login', json={'email': 'slow@example.com', 'password': 'pw'})
+    assert response.status_code == 503
+    assert response.get_json() == {'error': 'Password check timed out, retry shortly'}
+
+
+def test_malformed_login_bodies_answer_400(client):
+    for body in (b'{bad', b'["x"]'):
+        response = client.post('/api/login', data=body, content_type='application/json')
+        assert response.status_code == 400
+
+
+class FakeRedis:
+    """The commands SharedLoginRateLimiter uses, with PX expiries."""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.down = False
+
+    def _live(self, key):
+        if self.down:
+            raise ConnectionError('redis is down')
+        if self.expires.get(key, float('inf')) <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and self._live(key):
+            return None
+        self.values[key] = value
+        self.expires[key] = time.monotonic() + px / 1000
+        return True
+
+    def incr(self, key):
+        self._live(key)
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def pttl(self, key):
+        if not self._live(key):
+            return -2
+        return int((self.expires[key] - time.monotonic()) * 1000)
+
+    def delete(self, key):
+        self._live(key)
+        self.values.pop(key, None)
+
+    def pipeline(self):
+        client, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+        return Pipeline()
+
+
+def test_the_shared_limit_holds_across_workers():
+    redis = FakeRedis()
+    first, second = (SharedLoginRateLimiter(redis, attempts=3, per_seconds=60) for _ in range(2))
+    first.hit('a@example.com')
+    second.hit('a@example.com')
+    first.hit('a@example.com')
+    with pytest.raises(RateLimited) as raised:
+        second.hit('a@example.com')
+    assert 0 < raised.value.retry_after <= 60
+    second.reset('a@example.com')
+    first.hit('a@example.com')
+
+
+def test_the_shared_window_expires():
+    redis = FakeRedis()
+    limiter = SharedLoginRateLimiter(redis, attempts=1, per_seconds=60)
+    limiter.hit('a@example.com')
+    redis.expires[limiter._key('a@example.com')] = time.monotonic()
+    limiter.hit('a@example.com')
+
+
+def test_without_redis_the_limit_falls_back_to_the_process():
+    redis = FakeRedis()
+    redis.down = True
+    limiter = SharedLoginRateLimiter(redis, attempts=1, per_seconds=60, fallback=LoginRateLimiter(1, 60))
+    limiter.hit('a@example.com')
+    with pytest.raises(RateLimited):
+        limiter.hit('a@example.com')
@@ -0,0 +1,66 @@
+import uuid
+
+import web_server
+from bulk_ingest import validate_rows
+
+USER = str(uuid.uuid4())
+
+
+def session():
+    return {'Authorization': f"Bearer {web_server.session_tokens.issue(USER, 'user@example.com')}"}
+
+
+def test_non_string_fields_are_row_errors():
+    rows, errors = validate_rows([
+        {'user_id': USER, 'card_uid': 12345678, 'card_type': 'mifare'},
+        {'user_id': USER, 'card_uid': '04A1B2C3', 'card_type': ['mifare']},
+        {'user_id': 7, 'card_uid': '04D4E5F6', 'card_type': 'mifare'},
+        {'user_id': USER, 'card_uid': '04a1b2c4', 'card_type': 'mifare', 'status': 'lost'},
+    ])
+    assert [err['error'] for err in errors] == [
+        'card_uid must be a string', 'card_type must be a string', 'user_id must be a string'
+    ]
+    assert errors[1]['card_uid'] == '04A1B2C3'
+    assert [row[2] for row in rows] == ['04A1B2C4']
+
+
+def test_bulk_reports_bad_types_instead_of_failing(client, pool):
+    response = client.post('/api/cards/bulk', headers=session(),
+                           json=[{'user_id': USER, 'card_uid': {'hex': '04A1B2C3'}, 'card_type': 'mifare'}])
+    assert response.status_code == 200
+    assert response.get_json()['errors'] == [{'row': 1, 'card_uid': None, 'error': 'card_uid must be a string'}]
+    assert pool.checked_out == 0
+
+
+def test_bulk_requires_a_session(client, pool):
+    body = [{'user_id': USER, 'card_uid': '04A1B2C3', 'card_type': 'mifare'}]
+    assert client.post('/api/cards/bulk', json=body).status_code == 401
+    assert client.post('/api/cards/bulk', json=body, headers={'Authorization': 'Bearer nope'}).status_code == 401
+
+
+OTHER = str(uuid.uuid4())
+
+
+def enroll(client, pool, monkeypatch, admin_row):
+    copied = []
+    monkeypatch.setattr(web_server, 'copy_cards', lambda conn, rows: (copied.extend(rows) or len(rows), []))
+    pool.results.append([[admin_row]])
+    response = client.post('/api/cards/bulk', headers=session(), json=[
+        {'card_uid': '04A1B2C3', 'card_type': 'mifare'},
+        {'user_id': OTHER, 'card_uid': '04D4E5F6', 'card_type': 'mifare'},
+    ])
+    return response, copied
+
+
+def test_users_enroll_only_their_own_cards(client, pool, monkeypatch):
+    response, copied = enroll(client, pool, monkeypatch, (False, []))
+    assert [row[1] for row in copied] == [USER]
+    assert response.get_json()['errors'] == [
+        {'row': 2, 'card_uid': '04D4E5F6', 'error': 'only admins may enroll cards for other users'}
+    ]
+
+
+def test_admins_enroll_cards_for_others(client, pool, monkeypatch):
+    response, copied = enroll(client, pool, monkeypatch, (False, [str(uuid.uuid4())]))
+    assert [row[1] for row in copied] == [USER, OTHER]
+    assert response.get_json()['failed'] == 0
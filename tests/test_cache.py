@@ -0,0 +1,150 @@
+import time
+import threading
+
+import pytest
+from prometheus_client import REGISTRY
+
+from cache import _MISSING, LocalCache, SharedCache, TwoTierCache
+
+
+class FakeRedis:
+    """The string commands SharedCache uses, held in a dict."""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('redis is down')
+
+    def get(self, name):
+        self._check()
+        if self.expires.get(name, float('inf')) <= time.monotonic():
+            self.values.pop(name, None)
+        return self.values.get(name)
+
+    def setex(self, name, seconds, value):
+        self._check()
+        self.values[name] = value
+        self.expires[name] = time.monotonic() + seconds
+
+    def incr(self, name):
+        self._check()
+        self.values[name] = str(int(self.values.get(name, 0)) + 1)
+        return int(self.values[name])
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+def two_tier(redis, name='test'):
+    return TwoTierCache(LocalCache(name, maxsize=2, ttl=60), SharedCache(name, redis))
+
+
+def test_local_lru_evicts_least_recently_used():
+    local = LocalCache('lru', maxsize=2, ttl=60)
+    local.set('cards', 'a', 1)
+    local.set('cards', 'b', 2)
+    local.get('cards', 'a')
+    local.set('cards', 'c', 3)
+    assert local.get('cards', 'a') == 1
+    assert local.get('cards', 'b') is _MISSING
+
+
+def test_second_worker_is_served_from_the_shared_tier(redis):
+    loads = []
+    first, second = two_tier(redis), two_tier(redis)
+    assert first.get_or_load('cards', 'page', lambda: loads.append(1) or [1, 2]) == [1, 2]
+    assert second.get_or_load('cards', 'page', lambda: loads.append(1) or [9]) == [1, 2]
+    assert len(loads) == 1
+
+
+def test_invalidate_is_seen_by_every_worker(redis):
+    first, second = two_tier(redis), two_tier(redis)
+    first.get_or_load('cards', 'page', lambda: ['old'])
+    first.invalidate('cards')
+    assert second.get_or_load('cards', 'page', lambda: ['new']) == ['new']
+
+
+def test_concurrent_misses_share_one_load(redis):
+    cache = two_tier(redis, 'coalesce')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['rows']
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('cards', 'page', loader)))
+               for _ in range(8)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Let every follower join the leader's flight before it finishes
+    deadline = time.monotonic() + 5
+    while (REGISTRY.get_sample_value('cache_coalesced_total', {'cache': 'coalesce'}) or 0) < 7:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert results == [['rows']] * 8
+
+
+def test_load_errors_are_not_cached(redis):
+    cache = two_tier(redis)
+
+    def failing():
+        raise RuntimeError('db down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('cards', 'page', failing)
+    assert cache.get_or_load('cards', 'page', lambda: ['rows']) == ['rows']
+
+
+def test_write_during_load_is_not_cached(redis):
+    cache = two_tier(redis)
+
+    def loader():
+        cache.invalidate('cards')
+        return ['stale']
+
+    assert cache.get_or_load('cards', 'page', loader) == ['stale']
+    assert cache.get_or_load('cards', 'page', lambda: ['fresh']) == ['fresh']
+
+
+def test_shared_tier_outage_falls_back_to_the_loader(redis):
+    cache = two_tier(redis)
+    redis.down = True
+    assert cache.get_or_load('cards', 'page', lambda: ['rows']) == ['rows']
+    cache.invalidate('cards')
+
+
+def test_shared_entries_expire_on_their_own(redis):
+    shared = SharedCache('ttl', redis, ttl=30)
+    shared.set('cards', 0, 'old', ['a'])
+    shared.set('cards', 0, 'new', ['b'])
+    redis.expires[shared._key('cards', 0, 'old')] = time.monotonic()
+    assert shared.get('cards', 0, 'old') is _MISSING
+    assert shared.get('cards', 0, 'new') == ['b']
+
+
+def test_another_workers_write_during_load_is_not_cached(redis):
+    first, second = two_tier(redis), two_tier(redis)
+
+    def loader():
+        second.invalidate('cards')
+        return ['stale']
+
+    assert first.get_or_load('cards', 'page', loader) == ['stale']
+    assert second.get_or_load('cards', 'page', lambda: ['fresh']) == ['fresh']
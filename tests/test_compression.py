@@ -0,0 +1,84 @@
+import gzip
+import json
+import zlib
+import brotli
+import zstandard
+from http_compression import CompressedStream, StreamCompressor, compress, negotiate, should_compress, weak_etag
+from test_streaming import CARD, queue_list, session
+
+DECODERS = {
+    'gzip': gzip.decompress,
+    'br': brotli.decompress,
+    'zstd': lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+def test_negotiate_prefers_server_order_among_accepted():
+    assert negotiate('gzip, deflate, br') == 'br'
+    assert negotiate('gzip;q=0.5, br;q=0') == 'gzip'
+    assert negotiate('zstd;q=0.1, gzip') == 'gzip'
+    assert negotiate('identity') is None
+    assert negotiate('') is None
+
+
+def test_should_compress():
+    assert should_compress(200, 'application/json; charset=utf-8')
+    assert not should_compress(200, 'text/event-stream')
+    assert not should_compress(304, 'application/json')
+    assert not should_compress(200, 'application/json', 'gzip')
+
+
+def test_compress_round_trips_and_caches_by_etag():
+    body = json.dumps([{'n': i} for i in range(500)]).encode()
+    for encoding, decode in DECODERS.items():
+        data = compress(body, encoding, '"round-trip"')
+        assert decode(data) == body
+        assert compress(body, encoding, '"round-trip"') is data
+
+
+def test_stream_chunks_decode_as_they_arrive():
+    compressor = StreamCompressor('gzip')
+    decoder = zlib.decompressobj(31)
+    assert decoder.decompress(compressor.compress(b'[1,')) == b'[1,'
+    assert decoder.decompress(compressor.compress(b'2]') + compressor.finish()) == b'2]'
+
+
+def test_compressed_stream_closes_unstarted_body():
+    class Body:
+        closed = False
+
+        def __iter__(self):
+            return iter([b'x'])
+
+        def close(self):
+            self.closed = True
+
+    body = Body()
+    CompressedStream(body, 'gzip').close()
+    assert body.closed
+
+
+def test_streamed_list_is_compressed(pool, client):
+    queue_list(pool, [CARD] * 50)
+    response = client.get('/api/cards', headers=session(**{'Accept-Encoding': 'gzip'}))
+    data = response.get_data()
+    response.close()
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/"')
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(json.loads(gzip.decompress(data))) == 50
+    assert pool.checked_out == 0
+
+
+def test_head_on_compressed_stream_releases_connection(pool, client):
+    queue_list(pool, [CARD] * 50)
+    response = client.head('/api/cards', headers=session(**{'Accept-Encoding': 'br'}))
+    response.close()
+    assert response.headers['Content-Encoding'] == 'br'
+    assert pool.checked_out == 0
+
+
+def test_small_bodies_are_sent_as_is(client):
+    response = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert weak_etag('W/"a"') == 'W/"a"'
@@ -0,0 +1,81 @@
+import json
+
+import psycopg2
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import init_corporate_db
+from dashboard import DashboardArgsError, SECTIONS, parse_dashboard_args, query_dashboard
+from test_streaming import USER, session
+
+
+def test_defaults_cover_every_section_and_field():
+    sections, fields, limits = parse_dashboard_args(MultiDict())
+    assert sections == list(SECTIONS)
+    assert fields == {name: list(SECTIONS[name][2]) for name in SECTIONS}
+    assert set(limits.values()) == {100}
+
+
+def test_fields_trim_only_the_sections_they_name():
+    sections, fields, limits = parse_dashboard_args(MultiDict({
+        'sections': 'cards,history,cards', 'fields': 'cards.id,cards.name,cards.id',
+        'limit': '5', 'history_limit': '0'
+    }))
+    assert sections == ['cards', 'history']
+    assert fields == {'cards': ['id', 'name'], 'history': list(SECTIONS['history'][2])}
+    assert limits == {'cards': 5, 'history': 0}
+
+
+@pytest.mark.parametrize('args, error', [
+    ({'sections': 'cards,secrets'}, 'unknown section secrets'),
+    ({'fields': 'cards.password_hash'}, 'unknown field cards.password_hash'),
+    ({'fields': 'cards'}, 'unknown field cards'),
+    ({'limit': 'ten'}, 'limit must be an integer'),
+    ({'cards_limit': '1001'}, 'cards_limit must be between 0 and 1000'),
+])
+def test_malformed_arguments_are_rejected(args, error):
+    with pytest.raises(DashboardArgsError, match=error):
+        parse_dashboard_args(MultiDict(args))
+
+
+def test_the_route_needs_a_session_and_returns_the_statements_text(pool, client):
+    assert client.get('/api/dashboard').status_code == 401
+    assert client.get('/api/dashboard?limit=x', headers=session()).status_code == 400
+    pool.results = [[[('{"cards":[]}',)]]]
+    response = client.get('/api/dashboard?sections=cards', headers=session())
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == '{"cards":[]}'
+    [conn] = pool.connections
+    [(query, params)] = conn.queries
+    assert params == {'user_id': USER, 'cards_limit': 100}
+
+
+def test_one_statement_returns_only_the_users_rows(database):
+    init_corporate_db.init_corporate_database()
+    conn = psycopg2.connect(database)
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO users (id, username, password_hash, email)
+            VALUES (%s, 'dash', 'x', 'dash@example.com'), (gen_random_uuid(), 'other', 'x', 'other@example.com')
+        ''', (USER,))
+        cur.execute('''
+            INSERT INTO cards (user_id, card_uid, card_type, name)
+            SELECT id, uid_from_hex(CASE WHEN username = 'dash' THEN '04A1B2C3' ELSE '04D4E5F6' END), 'mifare', username
+            FROM users WHERE username IN ('dash', 'other')
+        ''')
+        cur.execute("INSERT INTO locations (user_id, name) VALUES (%s, 'Desk'), (%s, 'Attic')", (USER, USER))
+        conn.commit()
+        sections, fields, limits = parse_dashboard_args(MultiDict({
+            'sections': 'cards,locations', 'fields': 'cards.card_uid,cards.name', 'locations_limit': '1'
+        }))
+        body = json.loads(query_dashboard(conn, USER, sections, fields, limits))
+    finally:
+        conn.close()
+    assert body == {
+        'cards': [{'card_uid': '04A1B2C3', 'name': 'dash'}],
+        'locations': [{'id': body['locations'][0]['id'], 'name': 'Attic', 'description': None,
+                       'created_at': body['locations'][0]['created_at'],
+                       'updated_at': body['locations'][0]['updated_at']}],
+        'has_more': {'cards': False, 'locations': True},
+    }
@@ -0,0 +1,170 @@
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+import db
+from db import ConnectionPool, PooledConnection, PoolTimeout
+
+
+class FakeConnection:
+    """A psycopg2 connection as far as the pool looks at one."""
+
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.pings = 0
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, query):
+                conn.pings += 1
+                if conn.dead:
+                    raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+        return Cursor()
+
+    def get_transaction_status(self):
+        if self.in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(dsn, cursor_factory=None):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_an_exhausted_pool_times_out(connections):
+    pool = ConnectionPool('dsn', minconn=0, maxconn=2, timeout=0.05)
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert (pool.size, pool.in_use) == (2, 2)
+    pool.putconn(second)
+    assert pool.getconn() is second
+    assert len(connections) == 2
+    pool.putconn(first)
+
+
+def test_a_waiter_gets_the_connection_put_back(connections):
+    pool = ConnectionPool('dsn', minconn=1, maxconn=1, timeout=5)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+
+
+def test_an_idle_connection_is_pinged_and_a_dead_one_replaced(connections):
+    pool = ConnectionPool('dsn', minconn=1, maxconn=1, health_check_after=0)
+    [stale] = connections
+    stale.dead = True
+    conn = pool.getconn()
+    assert conn is not stale and stale.closed
+    assert stale.pings == 1
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.pings == 1
+
+
+def test_recently_used_connections_skip_the_ping(connections):
+    pool = ConnectionPool('dsn', minconn=1, maxconn=1, health_check_after=30)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.pings == 0
+
+
+def test_connections_past_max_age_are_recycled(connections):
+    pool = ConnectionPool('dsn', minconn=1, maxconn=1, max_age=-1)
+    [old] = connections
+    conn = pool.getconn()
+    assert conn is not old and old.closed
+    pool.putconn(conn)
+    assert conn.closed and pool.size == 0
+
+
+def test_an_open_transaction_is_rolled_back_on_return(connections):
+    pool = ConnectionPool('dsn', minconn=0, maxconn=1)
+    with pytest.raises(RuntimeError):
+        with PooledConnection(pool, pool.getconn()) as conn:
+            conn.in_transaction = True
+            raise RuntimeError('statement failed')
+    [raw] = connections
+    assert raw.rollbacks == 1 and not raw.closed
+    assert pool.in_use == 0
+    with pytest.raises(psycopg2.InterfaceError):
+        conn.cursor()
+
+
+def test_a_closed_pool_refuses_checkouts(connections):
+    pool = ConnectionPool('dsn', minconn=1, maxconn=1)
+    pool.closeall()
+    assert connections[0].closed
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+
+def test_one_listen_session_serves_every_channel(database):
+    listener = db.NotifyListener(database, poll_interval=0.1, batch_window=0.01)
+    received = {'events': [], 'changes': []}
+    done = threading.Event()
+    ready = threading.Semaphore(0)
+
+    def handler(name):
+        def handle(notifies):
+            received[name].extend(n.payload for n in notifies)
+            if received['events'] and len(received['changes']) == 2:
+                done.set()
+        return handle
+
+    listener.start()
+    try:
+        listener.subscribe('test_events', handler('events'), ready.release)
+        assert ready.acquire(timeout=5)
+        # A late consumer joins the same session and is told when it listens
+        listener.subscribe('test_changes', handler('changes'), ready.release)
+        assert ready.acquire(timeout=5)
+        conn = psycopg2.connect(database)
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            for channel, payload in [('test_changes', 'c1'), ('test_events', 'e1'), ('test_changes', 'c2')]:
+                cur.execute('SELECT pg_notify(%s, %s)', (channel, payload))
+            assert done.wait(5)
+            cur.execute("SELECT count(*) FROM pg_stat_activity WHERE query LIKE 'LISTEN %%'")
+            assert cur.fetchone()[0] == 1
+        finally:
+            conn.close()
+    finally:
+        listener.stop()
+        listener.join(5)
+    assert received == {'events': ['e1'], 'changes': ['c1', 'c2']}
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+import web_server
+from events import EventHub, Subscriber, scope_event_filters
+
+BUILDING = str(uuid.uuid4())
+OTHER = str(uuid.uuid4())
+DOOR = str(uuid.uuid4())
+
+
+def session():
+    token = web_server.session_tokens.issue(str(uuid.uuid4()), 'user@example.com')
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = EventHub()
+    monkeypatch.setattr(web_server, 'get_hub', lambda: hub)
+    return hub
+
+
+def test_scope_defaults_to_administered_buildings():
+    allowed = frozenset({BUILDING})
+    assert scope_event_filters(frozenset(), frozenset(), allowed) == allowed
+    assert scope_event_filters(frozenset({BUILDING}), frozenset(), allowed) == {BUILDING}
+    assert scope_event_filters(frozenset(), frozenset({DOOR}), allowed) == frozenset()
+    assert scope_event_filters(frozenset({OTHER}), frozenset(), allowed) is None
+    assert scope_event_filters(frozenset(), frozenset(), frozenset()) is None
+    assert scope_event_filters(frozenset(), frozenset(), None) == frozenset()
+
+
+def test_hub_only_delivers_allowed_buildings(hub):
+    # Filtered by door only; the door's events of other buildings stay out
+    subscriber = hub.subscribe(Subscriber(frozenset(), frozenset({DOOR}), allowed_buildings=frozenset({BUILDING})))
+    hub.publish({'type': 'access', 'building_id': OTHER}, [OTHER], [DOOR])
+    hub.publish({'type': 'access', 'building_id': BUILDING}, [BUILDING], [DOOR])
+    delivered, dropped = subscriber.drain()
+    assert [event['building_id'] for event in delivered] == [BUILDING]
+
+
+def test_stream_rejects_buildings_the_caller_does_not_administer(client, pool, hub):
+    pool.results.append([[(False, [BUILDING])]])
+    response = client.get(f'/api/events/stream?building_id={OTHER}', headers=session())
+    assert response.status_code == 403
+    assert len(hub) == 0
+    assert pool.checked_out == 0
+
+
+def test_head_does_not_leave_a_subscriber(client, pool, hub):
+    pool.results.append([[(True, [])]])
+    response = client.head('/api/events/stream', headers=session())
+    assert response.status_code == 200
+    response.close()
+    assert len(hub) == 0
+
+
+def test_stream_subscribes_scoped_to_the_caller(client, pool, hub):
+    pool.results.append([[(False, [BUILDING])]])
+    response = client.get('/api/events/stream', headers=session(), buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks) == b': connected\n\n'
+    assert len(hub) == 1
+    assert not hub._all and set(hub._by_building) == {BUILDING}
+    response.close()
+    assert len(hub) == 0
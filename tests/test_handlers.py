@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+from handlers import BodyError, card_params, location_params, parse_login, parse_check, invalidate_user_lists
+
+USER = '6f1c2a34-0000-4000-8000-000000000001'
+
+
+@pytest.mark.parametrize('body', [None, [], 'x', {}, {'card_uid': '04a1b2c3'}, {'card_uid': '04a1b2c3', 'card_type': ' '},
+                                  {'card_uid': '04a1b2c3', 'card_type': 5}])
+def test_card_bodies_without_the_required_fields_are_rejected(body):
+    with pytest.raises(BodyError, match='Missing card_uid or card_type'):
+        card_params(USER, body)
+
+
+def test_card_params_canonicalise_the_uid():
+    assert card_params(USER, {'card_uid': '04:a1:b2:c3', 'card_type': ' mifare '}) == (
+        USER, '04A1B2C3', 'mifare', None)
+    with pytest.raises(BodyError, match='hex'):
+        card_params(USER, {'card_uid': 'zz', 'card_type': 'mifare'})
+
+
+def test_location_params():
+    assert location_params(USER, {'name': ' Lobby ', 'description': 'Ground floor'}) == (
+        USER, 'Lobby', 'Ground floor')
+    with pytest.raises(BodyError, match='Missing name'):
+        location_params(USER, {'name': ['Lobby']})
+
+
+@pytest.mark.parametrize('body', [None, ['x'], {'email': 'a@example.com'}, {'email': 1, 'password': 'pw'},
+                                  {'email': 'a@example.com', 'password': {'x': 1}}])
+def test_malformed_login_bodies_are_rejected(body):
+    with pytest.raises(BodyError, match='Missing email or password'):
+        parse_login(body)
+
+
+AP = '0b7e8d2c-3f4a-4c5d-9e6f-7a8b9c0d1e2f'
+
+
+def test_parse_check():
+    assert parse_check({'card_uid': '04a1b2c3', 'access_point_id': AP.upper(), 'timestamp': '2026-01-02T03:04:05'}) == (
+        bytes.fromhex('04a1b2c3'), AP, datetime(2026, 1, 2, 3, 4, 5))
+    with pytest.raises(BodyError, match='ISO-8601'):
+        parse_check({'card_uid': '04a1b2c3', 'access_point_id': AP, 'timestamp': 5})
+    for access_point_id in ('ap', [AP], {'id': AP}):
+        with pytest.raises(BodyError, match='access_point_id must be a UUID'):
+            parse_check({'card_uid': '04a1b2c3', 'access_point_id': access_point_id})
+    with pytest.raises(BodyError, match='Missing'):
+        parse_check(['04a1b2c3'])
+
+
+def test_invalidate_user_lists_drops_each_tenant_once():
+    class Cache:
+        def __init__(self):
+            self.dropped = []
+
+        def invalidate(self, namespace):
+            self.dropped.append(namespace)
+
+    cache = Cache()
+    invalidate_user_lists(cache, 'cards', [USER, USER])
+    assert cache.dropped == [f'cards:user:{USER}']
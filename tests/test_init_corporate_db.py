@@ -0,0 +1,37 @@
+import psycopg2
+
+import init_corporate_db
+
+
+def scalar(dsn, query):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_rerun_reuses_seed_rows_and_commits_migrations(database):
+    init_corporate_db.init_corporate_database()
+    conn = psycopg2.connect(database)
+    try:
+        # As created before the lost/suspended statuses
+        conn.cursor().execute('''
+            ALTER TABLE cards DROP CONSTRAINT cards_status_check;
+            ALTER TABLE cards ADD CONSTRAINT cards_status_check CHECK (status IN ('active', 'revoked', 'pending'))
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+    init_corporate_db.init_corporate_database()
+
+    assert scalar(database, "SELECT count(*) FROM buildings WHERE name = 'Test Building'") == 1
+    assert scalar(database, 'SELECT count(*) FROM access_points') == 4
+    assert scalar(database, 'SELECT count(*) FROM building_admins') == 1
+    assert scalar(database, 'SELECT count(*) FROM corporate_admins') == 1
+    assert 'suspended' in scalar(database, '''
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = 'cards_status_check'
+    ''')
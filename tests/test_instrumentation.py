@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from prometheus_client import REGISTRY
+from starlette.concurrency import run_in_threadpool
+
+from instrumentation import begin_request, end_request, observe, timed
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_phases_are_observed_under_the_route():
+    before = sample('http_request_phase_seconds_count', route='/test/phases', phase='db')
+    timings = begin_request()
+    with timed('db'):
+        time.sleep(0.01)
+    observe('db', 0.5)
+    end_request(timings, 'GET', '/test/phases', 200)
+    assert timings.phases['db'] >= 0.51
+    assert sample('http_request_phase_seconds_count', route='/test/phases', phase='db') == before + 1
+    assert sample('http_request_phase_seconds_count', route='/test/phases', phase='bcrypt') == 0
+
+
+def test_unknown_routes_and_methods_share_bounded_labels():
+    before = sample('http_requests_total', method='OTHER', route='<unmatched>', status='404')
+    end_request(begin_request(), 'BREW', None, 404)
+    assert sample('http_requests_total', method='OTHER', route='<unmatched>', status='404') == before + 1
+
+
+def test_time_outside_a_request_is_dropped():
+    observe('db', 1.0)
+    timings = begin_request()
+    end_request(timings, 'GET', '/test/outside', 200)
+    assert set(timings.phases.values()) == {0.0}
+
+
+def test_time_spent_in_the_threadpool_lands_on_its_request():
+    async def request(name, seconds):
+        timings = begin_request()
+        await run_in_threadpool(observe, 'db', seconds)
+        end_request(timings, 'GET', f'/test/{name}', 200)
+        return timings.phases['db']
+
+    async def both():
+        return await asyncio.gather(request('a', 0.25), request('b', 0.5))
+
+    assert asyncio.run(both()) == [0.25, 0.5]
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+from ui.local_store import BASE_SCHEMA, LocalStore
+
+ALICE = '6f1c2a34-0000-4000-8000-000000000001'
+BOB = '6f1c2a34-0000-4000-8000-000000000002'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalStore(str(tmp_path / 'local.db'))
+    yield store
+    store.close()
+
+
+def location(id, name, user_id=ALICE, **fields):
+    return {'id': id, 'user_id': user_id, 'name': name, **fields}
+
+
+def card(id, card_uid, user_id=ALICE):
+    return {'id': id, 'user_id': user_id, 'card_uid': card_uid, 'card_type': 'mifare', 'status': 'active'}
+
+
+def test_watermarks_are_kept_per_user(store):
+    store.apply_changes(ALICE, {'cards': [card('c1', '04A1')]}, 'w-alice')
+    assert store.watermark(ALICE) == 'w-alice'
+    assert store.watermark(BOB) is None
+    store.apply_changes(BOB, {'cards': [card('c2', '04B2', BOB)]}, 'w-bob')
+    assert (store.watermark(ALICE), store.watermark(BOB)) == ('w-alice', 'w-bob')
+
+
+def test_a_reset_only_drops_the_users_own_rows(store):
+    store.apply_changes(ALICE, {'cards': [card('c1', '04A1')], 'locations': [location('l1', 'Lobby')]}, 'w1')
+    store.apply_changes(BOB, {'cards': [card('c2', '04B2', BOB)]}, 'w1')
+    store.apply_changes(ALICE, {'reset': True, 'cards': [card('c3', '04A3')]}, 'w2')
+    assert [row['card_uid'] for row in store.cards(ALICE)] == ['04A3']
+    assert store.locations(ALICE) == []
+    assert [row['card_uid'] for row in store.cards(BOB)] == ['04B2']
+
+
+def test_a_server_card_replaces_the_pending_scan(store):
+    assert store.record_scan(ALICE, '04A1', 'mifare')
+    assert not store.record_scan(ALICE, '04A1', 'mifare')
+    assert [row['card_uid'] for row in store.pending_cards(10)] == ['04A1']
+    store.apply_changes(ALICE, {'cards': [card('c1', '04A1')]}, 'w1')
+    [row] = store.cards(ALICE)
+    assert (row['remote_id'], row['pending']) == ('c1', 0)
+    assert store.pending_cards(10) == []
+
+
+def test_a_location_made_before_syncing_is_adopted(store):
+    store._write(lambda conn: conn.execute(
+        "INSERT INTO locations (user_id, name, description) VALUES (?, 'Lobby', 'local')", (ALICE,)))
+    store.apply_changes(ALICE, {'locations': [location('l1', 'Lobby', description='server')]}, 'w1')
+    [row] = store.locations(ALICE)
+    assert (row['remote_id'], row['description']) == ('l1', 'server')
+
+
+def test_a_renamed_location_may_take_a_name_that_is_still_held(store):
+    store.apply_changes(ALICE, {'locations': [location('l1', 'Lobby'), location('l2', 'Yard')]}, 'w1')
+    # l1 took "Yard" before l2's own rename reached us
+    store.apply_changes(ALICE, {'locations': [location('l1', 'Yard')], 'has_more': True}, 'w2')
+    assert [(row['remote_id'], row['name']) for row in store.locations(ALICE)] == [('l1', 'Yard')]
+    store.apply_changes(ALICE, {'locations': [location('l2', 'Garden')]}, 'w3')
+    assert [(row['remote_id'], row['name']) for row in store.locations(ALICE)] == [('l2', 'Garden'), ('l1', 'Yard')]
+
+
+def test_the_shared_watermark_of_an_older_file_is_dropped(tmp_path):
+    path = str(tmp_path / 'old.db')
+    store = LocalStore(path)
+    store._conn.execute("INSERT INTO sync_state (name, watermark) VALUES ('changes', 'w-old')")
+    store._conn.execute('PRAGMA user_version = 1')
+    store.close()
+    store = LocalStore(path)
+    try:
+        assert store.watermark(ALICE) is None
+        assert store._conn.execute('SELECT COUNT(*) FROM sync_state').fetchone()[0] == 0
+    finally:
+        store.close()
+
+
+def test_a_desktop_file_is_migrated_in_place(tmp_path):
+    path = str(tmp_path / 'desktop.db')
+    conn = sqlite3.connect(path)
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO locations (user_id, name) VALUES (1, 'Office')")
+    conn.commit()
+    conn.close()
+    store = LocalStore(path)
+    try:
+        assert [row['name'] for row in store.locations(1)] == ['Office']
+        assert store.record_scan(ALICE, '04A1', 'mifare')
+    finally:
+        store.close()
@@ -0,0 +1,87 @@
+import json
+import logging
+import queue
+
+from logging_config import (
+    AsyncQueueHandler, Deduplicator, DedupQueueListener, JsonFormatter, request_id_from, request_id_var
+)
+
+
+def record(msg='disk full', level=logging.WARNING, name='test', **extra):
+    return logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level),
+                                  'msg': msg, **extra})
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_request_ids_are_reused_only_when_sane():
+    assert request_id_from('abc-123') == 'abc-123'
+    generated = request_id_from('bad id\r\nX-Injected: 1')
+    assert len(generated) == 32 and generated.isalnum()
+    assert request_id_from(None) != request_id_from(None)
+
+
+def test_json_lines_carry_extra_fields():
+    line = json.loads(JsonFormatter().format(record('served', logging.INFO, status=200, request_id='r1')))
+    assert (line['level'], line['msg'], line['status'], line['request_id']) == ('INFO', 'served', 200, 'r1')
+
+
+def test_the_queue_handler_captures_the_request_id_and_counts_drops():
+    handler = AsyncQueueHandler(queue.Queue(1))
+    token = request_id_var.set('req-1')
+    try:
+        handler.emit(record('%s failed', args=('job',)))
+        handler.emit(record('dropped'))
+    finally:
+        request_id_var.reset(token)
+    queued = handler.queue.get_nowait()
+    assert (queued.msg, queued.args, queued.request_id) == ('job failed', None, 'req-1')
+    assert handler.dropped == 1
+
+
+def test_repeats_within_the_window_collapse_into_one_summary():
+    dedup = Deduplicator(window=10, level=logging.WARNING)
+    assert dedup.process(record(), 0) is not None
+    assert dedup.process(record(), 1) is None
+    assert dedup.process(record(), 2) is None
+    assert dedup.process(record('other'), 3) is not None
+    assert dedup.process(record(level=logging.INFO), 4) is not None
+    assert dedup.expired(5) == []
+    [summary] = dedup.expired(10)
+    assert summary.repeated == 2
+    # The run stays open while it keeps repeating, and closes once it stops
+    assert dedup.process(record(), 11) is None
+    assert [s.repeated for s in dedup.expired(20)] == [1]
+    assert dedup.expired(30) == []
+    assert dedup.process(record(), 31) is not None
+
+
+def test_the_listener_reports_open_runs_on_stop():
+    log_queue = queue.Queue(10)
+    handler = AsyncQueueHandler(log_queue)
+    capture = Capture()
+    listener = DedupQueueListener(log_queue, handler, capture, dedup=Deduplicator(window=60))
+    listener.start()
+    for _ in range(3):
+        handler.emit(record())
+    listener.stop()
+    assert [(r.msg, getattr(r, 'repeated', None)) for r in capture.records] == [
+        ('disk full', None), ('disk full', 2)]
+
+
+def test_the_listener_reports_dropped_records():
+    handler = AsyncQueueHandler(queue.Queue(1))
+    capture = Capture()
+    listener = DedupQueueListener(handler.queue, handler, capture)
+    handler.dropped = 4
+    listener._flush(0.0)
+    listener._flush(1.0)
+    assert [(r.msg, r.dropped) for r in capture.records] == [('Log queue full, records dropped', 4)]
+    assert handler.dropped == 0
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+import nfc_bridge
+from pcsc_backend import MockBackend
+
+
+@pytest.fixture
+def service(monkeypatch):
+    backend = MockBackend(['Desk 0', 'Desk 1'])
+    service = nfc_bridge.ReaderService(backend)
+    service.start()
+    monkeypatch.setattr(nfc_bridge, '_service', service)
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def bridge(service):
+    return nfc_bridge.app.test_client()
+
+
+def test_tap_updates_reader_state_and_keeps_last_uid(service):
+    service.backend.tap('Desk 1', bytes.fromhex('04a1b2c3'))
+    state = service.current('Desk 1')
+    assert state['present'] and state['uid'] == '04A1B2C3'
+
+    service.backend.remove_card('Desk 1')
+    state = service.current('Desk 1')
+    assert not state['present'] and state['uid'] is None
+    assert state['last_uid'] == '04A1B2C3'
+    assert service.current('Desk 0')['last_uid'] is None
+
+
+def test_subscribers_get_tap_and_removal_events(service):
+    subscriber = service.subscribe()
+    service.backend.tap('Desk 0', [0x04, 0xD4, 0xE5, 0xF6])
+    service.backend.remove_card('Desk 0')
+    events = [subscriber.get_nowait() for _ in range(2)]
+    assert [event for event, _ in events] == ['tap', 'card_removed']
+    assert events[0][1]['uid'] == events[1][1]['uid'] == '04D4E5F6'
+    service.unsubscribe(subscriber)
+
+
+def test_current_waits_for_a_tap(service):
+    timer = threading.Timer(0.05, service.backend.tap, ('Desk 0', b'\x04\x01\x02\x03'))
+    timer.start()
+    state = service.current('Desk 0', wait=5)
+    timer.join()
+    assert state['uid'] == '04010203'
+
+
+def test_hot_plugged_readers_are_tracked(service):
+    service.backend.add_reader('Desk 2')
+    assert [state['name'] for state in service.readers()] == ['Desk 0', 'Desk 1', 'Desk 2']
+    service.backend.tap('Desk 2', b'\x04\x01\x02\x03')
+    service.backend.remove_reader('Desk 2')
+    assert service.current('Desk 2') is None
+
+
+def test_read_card_through_simulated_tap(bridge):
+    assert bridge.get('/read_card').status_code == 400
+    response = bridge.post('/mock/tap', json={'uid': '04:a1:b2:c3', 'reader': 'Desk 1'})
+    assert response.get_json() == {'reader': 'Desk 1', 'uid': '04A1B2C3'}
+    body = bridge.get('/read_card?reader=Desk%201').get_json()
+    assert body['uid'] == '04A1B2C3' and body['reader'] == 'Desk 1'
+    assert bridge.post('/mock/remove', json={'reader': 'Desk 1'}).status_code == 200
+    assert bridge.get('/read_card?reader=Desk%201').status_code == 400
+
+
+def test_mock_routes_reject_bad_input(bridge):
+    assert bridge.post('/mock/tap', json={}).status_code == 400
+    assert bridge.post('/mock/tap', json={'uid': 'zz'}).status_code == 400
+    assert bridge.post('/mock/tap', json={'uid': '04A1B2C3', 'reader': 'Nowhere'}).status_code == 404
+    assert bridge.get('/read_card?reader=Nowhere').status_code == 404
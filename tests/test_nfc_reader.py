@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from pcsc_backend import MockBackend
+from ui.nfc import NFCReader
+
+
+@pytest.fixture
+def backend():
+    return MockBackend(['Desk 0', 'Desk 1'])
+
+
+@pytest.fixture
+def nfc(backend):
+    nfc = NFCReader(backend, apdu_timeout=0.2, poll_interval=0.01)
+    nfc.start()
+    yield nfc
+    nfc.stop(timeout=1)
+
+
+def test_every_reader_reports_its_card(nfc, backend):
+    backend.tap('Desk 0', b'\x04\xa1\xb2\xc3')
+    backend.tap('Desk 1', b'\x04\xd4\xe5\xf6')
+    reads = {nfc.get_result(timeout=2), nfc.get_result(timeout=2)}
+    assert {(read.reader, read.uid, read.error) for read in reads} == {
+        ('Desk 0', '04A1B2C3', None), ('Desk 1', '04D4E5F6', None)
+    }
+
+
+def test_card_left_on_reader_is_reported_once(nfc, backend):
+    backend.tap('Desk 0', b'\x04\xa1\xb2\xc3')
+    assert nfc.get_result(timeout=2).uid == '04A1B2C3'
+    assert nfc.get_result(timeout=0.1) is None
+
+    connection = nfc._workers['Desk 0']._connection
+    assert connection.connected
+    backend.remove_card('Desk 0')
+    deadline = time.monotonic() + 2
+    while connection.connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Disconnected explicitly once the card left
+    assert not connection.connected
+    backend.tap('Desk 0', b'\x04\xa1\xb2\xc3')
+    assert nfc.get_result(timeout=2).uid == '04A1B2C3'
+    # The same connection is reused for the next card
+    assert nfc._workers['Desk 0']._connection is connection
+
+
+def test_hot_plugged_reader_gets_a_worker(nfc, backend):
+    backend.add_reader('Desk 2')
+    backend.tap('Desk 2', b'\x04\x01\x02\x03')
+    assert nfc.get_result(timeout=2)[:2] == ('Desk 2', '04010203')
+    backend.remove_reader('Desk 2')
+    assert 'Desk 2' not in nfc._workers
+
+
+def test_slow_reader_times_out_once(nfc, backend):
+    backend.get_reader('Desk 1').latency = 0.5
+    backend.tap('Desk 1', b'\x04\xa1\xb2\xc3')
+    read = nfc.get_result(timeout=2)
+    assert read.reader == 'Desk 1' and read.uid is None
+    assert 'did not answer' in read.error
+    assert nfc.get_result(timeout=0.3) is None
+
+
+def test_read_card_uid_one_shot(backend):
+    nfc = NFCReader(backend, apdu_timeout=0.2)
+    assert nfc.read_card_uid() == (None, 'No smart card inserted')
+    backend.tap('Desk 0', b'\x04\xa1\xb2\xc3')
+    assert nfc.read_card_uid() == ('04A1B2C3', None)
+    assert nfc.read_card_uid(backend.get_reader('Desk 1'))[0] is None
@@ -0,0 +1,58 @@
+from datetime import datetime, time
+
+from schedule import MINUTES_PER_WEEK, bitmap_allows, bitmap_windows, compile_schedule, minute_of_week, naive_utc
+
+# 2026-01-04 is a Sunday
+SUNDAY = datetime(2026, 1, 4)
+
+
+def allows(bitmap, day, hour, minute=0):
+    return bitmap_allows(bitmap, minute_of_week(SUNDAY.replace(day=4 + day, hour=hour, minute=minute)))
+
+
+def test_unrestricted_grant_compiles_to_none():
+    assert compile_schedule(None, None, None) is None
+    assert allows(None, 3, 3)
+    assert bitmap_windows(None) == []
+
+
+def test_office_hours_on_weekdays():
+    bitmap = compile_schedule(time(9), time(17), (1, 2, 3, 4, 5))
+    assert len(bitmap) == MINUTES_PER_WEEK // 8
+    assert allows(bitmap, 1, 9) and allows(bitmap, 5, 16, 59)
+    assert not allows(bitmap, 1, 8, 59) and not allows(bitmap, 1, 17)
+    assert not allows(bitmap, 0, 12) and not allows(bitmap, 6, 12)
+    assert bitmap_windows(bitmap)[0] == {'from': 'Mon 09:00', 'to': 'Mon 17:00', 'minutes': 480}
+    assert len(bitmap_windows(bitmap)) == 5
+
+
+def test_overnight_window_runs_into_the_next_day():
+    bitmap = compile_schedule(time(22), time(6), (5,))
+    assert allows(bitmap, 5, 23) and allows(bitmap, 6, 5, 59)
+    assert not allows(bitmap, 6, 6) and not allows(bitmap, 5, 21, 59)
+    assert bitmap_windows(bitmap) == [{'from': 'Fri 22:00', 'to': 'Sat 06:00', 'minutes': 480}]
+
+
+def test_saturday_night_wraps_onto_sunday_and_decodes_once():
+    bitmap = compile_schedule(time(22), time(6), (6,))
+    assert allows(bitmap, 6, 23) and allows(bitmap, 0, 5)
+    assert not allows(bitmap, 0, 6)
+    assert bitmap_windows(bitmap) == [{'from': 'Sat 22:00', 'to': 'Sun 06:00', 'minutes': 480}]
+
+
+def test_every_day_all_day_is_one_window():
+    bitmap = compile_schedule(None, None, tuple(range(7)))
+    assert bitmap_windows(bitmap) == [{'from': 'Sun 00:00', 'to': 'Sun 00:00', 'minutes': MINUTES_PER_WEEK}]
+
+
+def test_out_of_range_days_are_ignored_and_schedules_are_shared():
+    assert compile_schedule(time(8), time(9), (1, 9)) == compile_schedule(time(8), time(9), (1,))
+    assert compile_schedule(time(8), time(9), (1,)) is compile_schedule(time(8), time(9), (1,))
+    assert bitmap_windows(compile_schedule(time(8), time(9), (-1, 7))) == []
+
+
+def test_naive_utc_reads_naive_times_in_the_access_timezone(monkeypatch):
+    monkeypatch.setenv('ACCESS_TIMEZONE', 'America/New_York')
+    assert naive_utc(datetime(2026, 7, 1, 8)) == datetime(2026, 7, 1, 12)
+    assert naive_utc(datetime.fromisoformat('2026-07-01T08:00:00+02:00')) == datetime(2026, 7, 1, 6)
+    assert naive_utc(None).tzinfo is None
@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+import sightings
+from conftest import FakePool
+
+CARD = b'\x04\xa1\xb2\xc3'
+USER = '5b0c1e9e-0000-4000-8000-000000000001'
+WHEN = datetime.datetime(2026, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = sightings.SightingTracker(flush_interval=60, max_staleness=60, max_pending=2)
+    tracker._stop_event.set()
+    tracker._thread.join()
+    tracker.flushed = []
+    monkeypatch.setattr(sightings, 'get_db_connection', FakePool().connect)
+    monkeypatch.setattr(sightings, 'execute_values', lambda cur, sql, rows, **kwargs: tracker.flushed.extend(rows))
+    return tracker
+
+
+def test_repeated_taps_collapse_into_one_row(tracker):
+    for minute in (5, 1, 9):
+        tracker.record(USER, CARD, WHEN.replace(minute=minute))
+    tracker.record(USER, b'\x04\x01\x02\x03', WHEN)
+    tracker.flush()
+    assert tracker.flushed == [
+        (USER, b'\x04\x01\x02\x03', WHEN, WHEN, 1),
+        (USER, CARD, WHEN.replace(minute=5), WHEN.replace(minute=9), 3),
+    ]
+
+
+def test_naive_and_aware_timestamps_mix(tracker, monkeypatch):
+    monkeypatch.setenv('ACCESS_TIMEZONE', 'Europe/Berlin')
+    # 04:04 in Berlin and 03:30 UTC; naive client times are access-timezone local
+    assert tracker.record(USER, CARD, WHEN.replace(hour=4))
+    assert tracker.record(USER, CARD, datetime.datetime(2026, 1, 2, 3, 30, tzinfo=datetime.timezone.utc))
+    assert tracker.record(USER, CARD)
+    tracker.flush()
+    [(_, _, first, last, taps)] = tracker.flushed
+    assert first == WHEN and first.tzinfo is None
+    assert last.tzinfo is None and last > WHEN and taps == 3
+
+
+def test_new_keys_beyond_max_pending_are_dropped(tracker):
+    assert tracker.record(USER, b'\x04\x00\x00\x01', WHEN)
+    assert tracker.record(USER, b'\x04\x00\x00\x02', WHEN)
+    assert not tracker.record(USER, b'\x04\x00\x00\x03', WHEN)
+    assert tracker.record(USER, b'\x04\x00\x00\x01', WHEN)
+    assert not tracker.record(None, CARD, WHEN)
@@ -0,0 +1,94 @@
+import json
+import uuid
+import datetime
+
+import web_server
+
+CARD = (uuid.uuid4(), uuid.uuid4(), b'\x04\xa1\xb2\xc3', 'MIFARE Classic', 'Badge', 'active',
+        datetime.datetime(2024, 1, 2, 3, 4, 5), datetime.datetime(2024, 1, 2, 3, 4, 5))
+USER = str(uuid.uuid4())
+
+
+def session(user_id=USER, **headers):
+    return dict(headers, Authorization=f"Bearer {web_server.session_tokens.issue(user_id, 'user@example.com')}")
+
+
+def queue_list(pool, rows):
+    # VERSION_SQL, then the keyset query on the named cursor
+    pool.results.append([[(7,)], rows])
+
+
+def test_get_streams_rows_and_releases_connection(pool, client):
+    queue_list(pool, [CARD])
+    response = client.get('/api/cards', headers=session())
+    body = json.loads(response.get_data())
+    response.close()
+    assert response.status_code == 200
+    assert body[0]['card_uid'] == '04A1B2C3'
+    assert body[0]['created_at'] == '2024-01-02T03:04:05'
+    assert pool.checked_out == 0
+
+
+def test_head_releases_connection(pool, client):
+    queue_list(pool, [CARD])
+    response = client.head('/api/cards', headers=session())
+    response.close()
+    assert response.status_code == 200
+    assert pool.checked_out == 0
+
+
+def test_if_none_match_releases_connection(pool, client):
+    queue_list(pool, [CARD])
+    etag = client.get('/api/cards', headers=session()).headers['ETag']
+    queue_list(pool, [CARD])
+    response = client.get('/api/cards', headers=session(**{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert pool.checked_out == 0
+
+
+def test_building_cards_follow_grant_changes(pool, client):
+    building_id, user_id = str(uuid.uuid4()), str(uuid.uuid4())
+    token = web_server.session_tokens.issue(user_id, 'admin@example.com')
+    path = f'/api/buildings/{building_id}/cards?limit=10'
+
+    def get(version, etag=None):
+        # admin check; version for the cache key; on a miss, version and page
+        pool.results.extend([[[(True,)]], [[(version,)]], [[(version,)], [CARD]]])
+        headers = {'Authorization': f'Bearer {token}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        return client.get(path, headers=headers)
+
+    first = get(7)
+    assert first.status_code == 200
+    pool.results.clear()
+    assert get(7, first.headers['ETag']).status_code == 304
+    pool.results.clear()
+    # A grant changed: card_access moved the combined version on
+    changed = get(8, first.headers['ETag'])
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert pool.checked_out == 0
+
+
+def test_lists_require_a_session_and_are_scoped_to_it(pool, client):
+    assert client.get('/api/cards').status_code == 401
+    assert client.get('/api/locations').status_code == 401
+    queue_list(pool, [CARD])
+    client.get('/api/locations', headers=session()).close()
+    assert pool.connections[-1].queries[-1][1][0] == USER
+    assert pool.checked_out == 0
+
+
+def test_a_write_only_drops_the_writers_cached_pages(pool, client, monkeypatch):
+    other = str(uuid.uuid4())
+    loads = []
+    monkeypatch.setattr(web_server, 'load_page', lambda table, *args: loads.append(args[-1].key) or
+                        {'etag': '"e"', 'body': '[]'})
+    for user_id in (USER, other):
+        client.get('/api/cards?limit=10', headers=session(user_id))
+    assert client.post('/api/cards', json={'card_uid': '04a1b2c3', 'card_type': 'mifare'},
+                       headers=session()).status_code == 201
+    for user_id in (USER, other):
+        client.get('/api/cards?limit=10', headers=session(user_id))
+    assert loads == [f'user:{USER}', f'user:{other}', f'user:{USER}']
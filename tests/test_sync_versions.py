@@ -0,0 +1,41 @@
+import psycopg2
+
+import init_corporate_db
+from sync_changes import VERSION_SQL, version_params
+
+
+def version(conn, *tables):
+    cur = conn.cursor()
+    cur.execute(VERSION_SQL, dict(version_params(*tables), settle=0))
+    value = cur.fetchone()[0]
+    conn.commit()
+    return value
+
+
+def test_concurrent_writers_do_not_wait_on_the_version(database):
+    init_corporate_db.init_corporate_database()
+    conn, first, second = (psycopg2.connect(database) for _ in range(3))
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE username = 'building_admin'")
+        user_id = cur.fetchone()[0]
+        cur.execute('''
+            INSERT INTO cards (user_id, card_uid, card_type)
+            VALUES (%s, uid_from_hex('04000001'), 'MIFARE'), (%s, uid_from_hex('04000002'), 'MIFARE')
+        ''', (user_id, user_id))
+        conn.commit()
+        before = version(conn, 'cards')
+
+        first.cursor().execute("UPDATE cards SET name = 'a' WHERE card_uid = uid_from_hex('04000001')")
+        blocked = second.cursor()
+        blocked.execute("SET statement_timeout = '2s'")
+        blocked.execute("UPDATE cards SET name = 'b' WHERE card_uid = uid_from_hex('04000002')")
+        second.commit()
+        # The first write is still open, so the second one is not counted yet
+        assert version(conn, 'cards') == before
+        first.commit()
+        assert version(conn, 'cards') > before
+        assert version(conn, 'cards', 'locations') >= version(conn, 'cards')
+    finally:
+        for c in (conn, first, second):
+            c.close()
@@ -0,0 +1,87 @@
+import uuid
+
+import psycopg2
+import pytest
+
+import init_corporate_db
+from streaming import CARD_COLUMNS, build_keyset_query
+from tenants import (
+    TenantArgsError, building_cards_scope, parse_tenant_id, shape_admin_buildings, user_scope
+)
+from test_streaming import USER, queue_list, session
+
+
+def test_tenant_ids_are_canonical_uuids():
+    assert parse_tenant_id(USER.upper(), 'user_id') == USER
+    with pytest.raises(TenantArgsError, match='building_id must be a UUID'):
+        parse_tenant_id('1; DROP TABLE cards', 'building_id')
+
+
+def test_scopes_carry_their_predicate_and_cache_key():
+    query, params = build_keyset_query('cards', ('id',), after='a', limit=5,
+                                       where=user_scope(USER).where, params=user_scope(USER).params)
+    assert query == 'SELECT id FROM cards WHERE user_id = %s AND id > %s ORDER BY id LIMIT %s'
+    assert params == [USER, 'a', 5]
+    building = building_cards_scope('b1')
+    assert (building.key, building.params) == ('building:b1', ('b1',))
+    assert building.tables == ('card_access', 'access_points')
+    assert user_scope(USER).key != user_scope(str(uuid.uuid4())).key
+
+
+def test_corporate_admins_administer_every_building():
+    assert shape_admin_buildings((True, [])) is None
+    assert shape_admin_buildings((False, ['b1', 'b2'])) == frozenset({'b1', 'b2'})
+
+
+def test_user_lists_answer_only_the_session_user(pool, client):
+    path = f'/api/users/{USER}/cards'
+    assert client.get(path).status_code == 401
+    assert client.get(f'/api/users/{uuid.uuid4()}/cards', headers=session()).status_code == 403
+    assert client.get('/api/users/me/cards', headers=session()).status_code == 400
+    assert pool.connections == []
+    queue_list(pool, [])
+    client.get(path.replace(USER, USER.upper()), headers=session()).close()
+    assert pool.connections[-1].queries[-1][1][0] == USER
+
+
+def test_building_cards_need_a_building_admin(pool, client):
+    assert client.get('/api/buildings/lobby/cards', headers=session()).status_code == 400
+    pool.results = [[[(False,)]]]
+    assert client.get(f'/api/buildings/{uuid.uuid4()}/cards', headers=session()).status_code == 403
+    assert pool.checked_out == 0
+
+
+def test_scoped_queries_return_only_the_tenants_rows(database):
+    init_corporate_db.init_corporate_database()
+    conn = psycopg2.connect(database)
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO users (id, username, password_hash, email)
+            VALUES (%s, 'tenant', 'x', 'tenant@example.com'), (gen_random_uuid(), 'other', 'x', 'other@example.com')
+        ''', (USER,))
+        cur.execute('''
+            INSERT INTO cards (user_id, card_uid, card_type, name)
+            SELECT id, uid_from_hex(CASE WHEN username = 'tenant' THEN '04A1B2C3' ELSE '04D4E5F6' END), 'mifare', username
+            FROM users WHERE username IN ('tenant', 'other')
+        ''')
+        # Only the other user's card is granted a door of the building
+        cur.execute('''
+            INSERT INTO card_access (card_id, access_point_id)
+            SELECT c.id, (SELECT id FROM access_points LIMIT 1)
+            FROM cards c JOIN users u ON u.id = c.user_id WHERE u.username = 'other'
+        ''')
+        cur.execute('SELECT building_id FROM access_points LIMIT 1')
+        building_id = str(cur.fetchone()[0])
+        conn.commit()
+
+        def names(scope):
+            query, params = build_keyset_query('cards', CARD_COLUMNS, where=scope.where, params=scope.params)
+            cur.execute(query, params)
+            return [row[CARD_COLUMNS.index('name')] for row in cur.fetchall()]
+
+        assert names(user_scope(USER)) == ['tenant']
+        assert names(building_cards_scope(building_id)) == ['other']
+        assert names(building_cards_scope(str(uuid.uuid4()))) == []
+    finally:
+        conn.close()
@@ -0,0 +1,191 @@
+import pytest
+
+pytest.importorskip('PySide6')
+
+from PySide6.QtCore import QCoreApplication
+
+from ui import workers
+from ui.local_store import LocalStore
+from ui.nfc import CardRead
+
+ALICE = '6f1c2a34-0000-4000-8000-000000000001'
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+
+@pytest.fixture(scope='module', autouse=True)
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalStore(str(tmp_path / 'local.db'))
+    yield store
+    store.close()
+
+
+def test_pull_changes_pages_from_the_users_watermark(store, monkeypatch):
+    pages = [
+        {'cards': [{'id': 'c1', 'user_id': ALICE, 'card_uid': '04A1', 'card_type': 'mifare'}],
+         'watermark': 'w1', 'has_more': True},
+        {'locations': [{'id': 'l1', 'user_id': ALICE, 'name': 'Lobby'}],
+         'deleted': {'cards': ['c0']}, 'watermark': 'w2', 'has_more': False},
+    ]
+    calls = []
+
+    def get(url, params, headers, timeout):
+        calls.append((url, dict(params), headers))
+        return FakeResponse(pages[len(calls) - 1])
+
+    monkeypatch.setattr(workers.requests, 'get', get)
+    assert workers.pull_changes(store, 'token', ALICE) == 3
+    assert [params.get('since') for _, params, _ in calls] == [None, 'w1']
+    assert calls[0][2] == {'Authorization': 'Bearer token'}
+    assert store.watermark(ALICE) == 'w2'
+    assert [row['name'] for row in store.locations(ALICE)] == ['Lobby']
+
+
+class StopScan(Exception):
+    pass
+
+
+class FakeNFC:
+    def __init__(self, results):
+        self.results = list(results)
+        self.stopped = False
+
+    def start(self):
+        pass
+
+    def list_readers(self):
+        return ['Desk 0']
+
+    def get_result(self, timeout=None):
+        if not self.results:
+            raise StopScan()
+        return self.results.pop(0)
+
+    def stop(self, timeout=None):
+        self.stopped = True
+
+
+def scan(monkeypatch, results, debounce):
+    nfc = FakeNFC(results)
+    monkeypatch.setattr(workers, 'NFCReader', lambda: nfc)
+    worker = workers.ScanWorker(debounce=debounce)
+    seen = {'scanned': [], 'errors': [], 'readers': []}
+    worker.card_scanned.connect(lambda reader, uid: seen['scanned'].append(uid))
+    worker.scan_error.connect(lambda reader, error: seen['errors'].append(error))
+    worker.readers_changed.connect(seen['readers'].append)
+    # run() on this thread; the fake reader ends the loop once it runs dry
+    with pytest.raises(StopScan):
+        worker.run()
+    assert nfc.stopped
+    return seen
+
+
+def test_a_card_held_on_the_reader_is_reported_once(monkeypatch):
+    reads = [CardRead('Desk 0', '04A1', None, 0), None, CardRead('Desk 0', '04A1', None, 0),
+             CardRead('Desk 0', '04B2', None, 0), CardRead('Desk 0', None, 'card removed too early', 0)]
+    seen = scan(monkeypatch, reads, debounce=60)
+    assert seen == {'scanned': ['04A1', '04B2'], 'errors': ['card removed too early'], 'readers': [['Desk 0']]}
+
+
+def test_without_debounce_every_tap_is_reported(monkeypatch):
+    reads = [CardRead('Desk 0', '04A1', None, 0), CardRead('Desk 0', '04A1', None, 0)]
+    assert scan(monkeypatch, reads, debounce=0)['scanned'] == ['04A1', '04A1']
+
+
+def test_api_call_reports_the_result_or_the_error():
+    results = []
+    call = workers.ApiCall(lambda a, b: a + b, 1, 2)
+    call.signals.finished.connect(results.append)
+    call.run()
+    failing = workers.ApiCall(lambda: 1 / 0)
+    failing.signals.failed.connect(results.append)
+    failing.run()
+    assert results == [3, 'division by zero']
+
+
+class FakeCall:
+    """ApiCall that only starts when the test answers it."""
+
+    def __init__(self, calls, fn, *args):
+        self.fn = fn
+        self.args = args
+        self.signals = workers.CallSignals()
+        calls.append(self)
+
+    def start(self):
+        return self
+
+
+@pytest.fixture
+def batcher(store, monkeypatch):
+    calls = []
+    monkeypatch.setattr(workers, 'ApiCall', lambda fn, *args: FakeCall(calls, fn, *args))
+    batcher = workers.EnrollmentBatcher(store, 'token', batch_size=2, flush_ms=60000, retry_ms=60000)
+    batcher.calls = calls
+    batcher.seen = {'enrolled': [], 'rejected': [], 'failed': []}
+    batcher.enrolled.connect(batcher.seen['enrolled'].append)
+    batcher.rejected.connect(lambda uid, error: batcher.seen['rejected'].append((uid, error)))
+    batcher.batch_failed.connect(batcher.seen['failed'].append)
+    return batcher
+
+
+def scan_cards(store, batcher, *uids):
+    for uid in uids:
+        store.record_scan(ALICE, uid, 'mifare')
+        batcher.add(uid)
+
+
+def sent(call):
+    return [row['card_uid'] for row in call.args[1]]
+
+
+def test_a_full_batch_is_sent_with_one_request_in_flight(store, batcher):
+    scan_cards(store, batcher, '04A1', '04B2', '04C3')
+    assert len(batcher.calls) == 1
+    assert sent(batcher.calls[0]) == ['04A1', '04B2']
+    batcher.flush()
+    assert len(batcher.calls) == 1
+    batcher.calls[0].signals.finished.emit({'inserted': 2, 'errors': []})
+    assert batcher.seen['enrolled'] == ['04A1', '04B2']
+    # The answer frees the slot for the card that was waiting
+    assert sent(batcher.calls[1]) == ['04C3']
+    assert [card['card_uid'] for card in store.pending_cards(10)] == ['04C3']
+
+
+def test_rejected_cards_keep_the_servers_reason(store, batcher):
+    scan_cards(store, batcher, '04A1', '04B2')
+    batcher.calls[0].signals.finished.emit({'errors': [{'row': 2, 'card_uid': '04B2', 'error': 'duplicate'}]})
+    assert batcher.seen == {'enrolled': ['04A1'], 'rejected': [('04B2', 'duplicate')], 'failed': []}
+    assert {card['card_uid']: card['sync_error'] for card in store.cards(ALICE)} == {'04A1': None, '04B2': 'duplicate'}
+
+
+def test_an_error_for_the_whole_batch_rejects_every_card(store, batcher):
+    scan_cards(store, batcher, '04A1', '04B2')
+    batcher.calls[0].signals.finished.emit({'error': 'Invalid or expired session'})
+    assert batcher.seen['rejected'] == [('04A1', 'Invalid or expired session'), ('04B2', 'Invalid or expired session')]
+    assert store.pending_cards(10) == []
+
+
+def test_a_failed_batch_stays_pending_for_the_retry(store, batcher):
+    scan_cards(store, batcher, '04A1', '04B2')
+    batcher.calls[0].signals.failed.emit('Connection refused')
+    assert batcher.seen['failed'] == ['Connection refused']
+    assert len(store.pending_cards(10)) == 2
+    batcher.flush()
+    assert sent(batcher.calls[1]) == ['04A1', '04B2']
@@ -0,0 +1,30 @@
+import pytest
+
+from uids import UIDError, canonical_uid, format_uid, parse_uid, try_parse_uid
+
+
+@pytest.mark.parametrize('uid', [b'\x04\xa1\xb2\xc3', bytes(range(7)), b'\xff' * 10])
+def test_format_and_parse_round_trip(uid):
+    assert parse_uid(format_uid(uid)) == uid
+    assert format_uid(parse_uid(format_uid(uid))) == format_uid(uid)
+
+
+@pytest.mark.parametrize('spelling', ['04a1b2c3', '04:A1:b2:C3', '04-a1-b2-c3', '04 a1 b2 c3',
+                                      [4, 0xa1, 0xb2, 0xc3], b'\x04\xa1\xb2\xc3'])
+def test_every_spelling_has_one_canonical_form(spelling):
+    assert canonical_uid(spelling) == '04A1B2C3'
+
+
+@pytest.mark.parametrize('value, error', [
+    ('04a1b2', '4 to 10 bytes'),
+    ('00' * 11, '4 to 10 bytes'),
+    ('04a1b2c', 'hex'),
+    ('zz112233', 'hex'),
+    ([4, 256, 0, 0], 'sequence of bytes'),
+    (12345678, 'hex text'),
+    (None, 'hex text'),
+])
+def test_invalid_uids_are_rejected(value, error):
+    with pytest.raises(UIDError, match=error):
+        parse_uid(value)
+    assert try_parse_uid(value) is None
@@ -1,9 +1,17 @@
-from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, QListWidget, QHBoxLayout, QMessageBox
-from ui.nfc import NFCReader
+import os
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, QListWidget, QHBoxLayout
+from ui.local_store import LocalStore
+from ui.workers import ApiCall, ScanWorker, EnrollmentBatcher, CARD_TYPE, pull_changes
+
+SYNC_INTERVAL_MS = int(os.getenv("SYNC_INTERVAL_MS", "30000"))
 
 class DashboardWindow(QMainWindow):
-    def __init__(self, user_email):
+    def __init__(self, user_email, session_token=None, user_id=None, store=None):
         super().__init__()
+        self.user_email = user_email
+        self.session_token = session_token
+        self.user_id = user_id
         self.setWindowTitle(f"One - Dashboard ({user_email})")
         self.setMinimumSize(600, 400)
         central = QWidget()
@@ -12,11 +20,20 @@ class DashboardWindow(QMainWindow):
         self.info_label = QLabel(f"Logged in as: {user_email}")
         layout.addWidget(self.info_label)
 
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
         self.card_list = QListWidget()
         layout.addWidget(self.card_list)
 
+        layout.addWidget(QLabel("Locations"))
+        self.location_list = QListWidget()
+        self.location_list.setMaximumHeight(120)
+        layout.addWidget(self.location_list)
+
         btn_row = QHBoxLayout()
-        self.add_card_btn = QPushButton("Add Card (Scan)")
+        self.add_card_btn = QPushButton("Start Scanning")
+        self.add_card_btn.setCheckable(True)
         self.delete_card_btn = QPushButton("Delete Card")
         self.block_card_btn = QPushButton("Block Card")
         btn_row.addWidget(self.add_card_btn)
@@ -27,18 +44,117 @@ class DashboardWindow(QMainWindow):
         central.setLayout(layout)
         self.setCentralWidget(central)
 
-        self.nfc = NFCReader()
-        self.add_card_btn.clicked.connect(self.scan_and_add_card)
+        # Reader I/O runs on its own thread; enrollment calls go through the thread pool
+        self.card_items = {}
+        self.scanner = None
+        self.store = store or LocalStore()
+        self.batcher = EnrollmentBatcher(self.store, session_token, parent=self)
+        self.batcher.enrolled.connect(self.card_enrolled)
+        self.batcher.rejected.connect(self.card_rejected)
+        self.batcher.batch_failed.connect(self.enroll_failed)
+        self.add_card_btn.toggled.connect(self.toggle_scanning)
+
+        # Render what is stored locally straight away, then catch up with the server
+        self.load_cards()
+        self.load_locations()
+        self.sync_call = None
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.sync)
+        self.sync_timer.start(SYNC_INTERVAL_MS)
+        self.sync()
+        self.batcher.flush()
+
+    def card_label(self, card):
+        if card["pending"]:
+            return f"Card UID: {card['card_uid']} (enrolling...)"
+        if card["sync_error"]:
+            return f"Card UID: {card['card_uid']} (not enrolled: {card['sync_error']})"
+        return f"Card UID: {card['card_uid']}"
+
+    def load_cards(self):
+        self.card_list.clear()
+        self.card_items = {}
+        for card in self.store.cards(self.user_id):
+            self.card_list.addItem(self.card_label(card))
+            self.card_items[card["card_uid"]] = self.card_list.item(self.card_list.count() - 1)
+
+    def load_locations(self):
+        self.location_list.clear()
+        for location in self.store.locations(self.user_id):
+            if location["description"]:
+                self.location_list.addItem(f"{location['name']}: {location['description']}")
+            else:
+                self.location_list.addItem(location["name"])
+
+    def sync(self):
+        if self.sync_call is not None:
+            return
+        self.sync_call = ApiCall(pull_changes, self.store, self.session_token, self.user_id)
+        self.sync_call.signals.finished.connect(self.sync_finished)
+        self.sync_call.signals.failed.connect(self.sync_failed)
+        self.sync_call.start()
+
+    def sync_finished(self, applied):
+        self.sync_call = None
+        if applied:
+            self.load_cards()
+            self.load_locations()
+        if self.status_label.text().startswith("Offline"):
+            self.status_label.setText("")
 
-        readers = self.nfc.list_readers()
-        if not readers:
-            QMessageBox.critical(self, "NFC Reader", "No NFC reader detected. Please connect a reader and restart the app.")
+    def sync_failed(self, error):
+        self.sync_call = None
+        self.status_label.setText(f"Offline, showing local data: {error}")
+
+    def toggle_scanning(self, enabled):
+        if enabled:
+            self.scanner = ScanWorker(parent=self)
+            self.scanner.card_scanned.connect(self.card_scanned)
+            self.scanner.scan_error.connect(self.scan_error)
+            self.scanner.readers_changed.connect(self.readers_changed)
+            self.scanner.start()
+            self.add_card_btn.setText("Stop Scanning")
+            self.status_label.setText("Scanning: tap cards one after another")
         else:
-            self.info_label.setText(f"Logged in as: {user_email}\nNFC Reader: {readers[0]}")
+            self.stop_scanning()
+            self.add_card_btn.setText("Start Scanning")
+            self.status_label.setText("")
+
+    def stop_scanning(self):
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner = None
 
-    def scan_and_add_card(self):
-        uid, error = self.nfc.read_card_uid()
-        if uid:
-            self.card_list.addItem(f"Card UID: {uid}")
+    def readers_changed(self, readers):
+        if readers:
+            self.info_label.setText(f"Logged in as: {self.user_email}\nNFC Reader: {', '.join(readers)}")
         else:
-            QMessageBox.warning(self, "NFC Error", error or "No card detected or reader not found.") 
\ No newline at end of file
+            self.info_label.setText(f"Logged in as: {self.user_email}\nNo NFC reader detected. Please connect a reader.")
+
+    def card_scanned(self, reader, uid):
+        if self.store.record_scan(self.user_id, uid, CARD_TYPE):
+            self.card_list.addItem(f"Card UID: {uid} (enrolling...)")
+            self.card_items[uid] = self.card_list.item(self.card_list.count() - 1)
+            self.batcher.add(uid)
+        item = self.card_items.get(uid)
+        if item is not None:
+            self.card_list.setCurrentItem(item)
+
+    def card_enrolled(self, uid):
+        if uid in self.card_items:
+            self.card_items[uid].setText(f"Card UID: {uid}")
+
+    def card_rejected(self, uid, error):
+        if uid in self.card_items:
+            self.card_items[uid].setText(f"Card UID: {uid} (not enrolled: {error})")
+
+    def enroll_failed(self, error):
+        self.status_label.setText(f"Offline, cards will be enrolled when the server is back: {error}")
+
+    def scan_error(self, reader, error):
+        self.status_label.setText(f"{reader}: {error}")
+
+    def closeEvent(self, event):
+        self.stop_scanning()
+        self.batcher.flush()
+        super().closeEvent(event)
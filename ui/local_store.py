@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "access_points.db")
+
+# The original desktop schema; kept as-is so existing files open unchanged
+BASE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS locations (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        UNIQUE(user_id, name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS access_points (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        location_id INTEGER NOT NULL,
+        card_id TEXT NOT NULL,
+        access_level INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (location_id) REFERENCES locations (id),
+        UNIQUE(location_id, card_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS card_history (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        card_id TEXT NOT NULL,
+        card_type TEXT NOT NULL,
+        custom_name TEXT,
+        frequency TEXT,
+        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    '''
+]
+
+# Applied in order; PRAGMA user_version records how many have run.
+# user_id columns hold the server's user id (a UUID string) from here on.
+MIGRATIONS = [
+    [
+        'ALTER TABLE locations ADD COLUMN remote_id TEXT',
+        'ALTER TABLE locations ADD COLUMN updated_at TIMESTAMP',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_locations_remote_id ON locations (remote_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS cards (
+            id INTEGER PRIMARY KEY,
+            remote_id TEXT UNIQUE,
+            user_id TEXT NOT NULL,
+            card_uid TEXT NOT NULL UNIQUE,
+            card_type TEXT NOT NULL,
+            name TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            pending INTEGER NOT NULL DEFAULT 0,
+            sync_error TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_cards_user ON cards (user_id, card_uid)',
+        'CREATE INDEX IF NOT EXISTS idx_cards_pending ON cards (pending) WHERE pending = 1',
+        # One history row per card and user, so sightings can be upserted
+        '''
+        DELETE FROM card_history WHERE id NOT IN (
+            SELECT MIN(id) FROM card_history GROUP BY user_id, card_id
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_card_history_user_card ON card_history (user_id, card_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            watermark TEXT
+        )
+        '''
+    ],
+    [
+        # Watermarks are kept per user now; the shared one forces a full sync
+        "DELETE FROM sync_state WHERE name = 'changes'"
+    ]
+]
+
+CARD_FIELDS = ('remote_id', 'user_id', 'card_uid', 'card_type', 'name', 'status', 'created_at', 'updated_at')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class LocalStore:
+    """Offline-first copy of the user's cards and locations.
+
+    Dashboard reads are answered from here. Cards scanned while offline are
+    kept with ``pending = 1`` until the server accepts them, and
+    ``apply_changes`` merges the deltas pulled from ``/api/sync``. One
+    connection is shared between the GUI thread and the sync workers; WAL
+    mode keeps the readers from blocking on a sync in progress.
+    """
+
+    def __init__(self, path=LOCAL_DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+
+    def _migrate(self):
+        with self._lock:
+            for statement in BASE_SCHEMA:
+                self._conn.execute(statement)
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for statement in statements:
+                        self._conn.execute(statement)
+                    self._conn.execute(f'PRAGMA user_version = {number}')
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
+
+    def _write(self, fn):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self._conn)
+                self._conn.execute('COMMIT')
+                return result
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Reads
+
+    def cards(self, user_id):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                'SELECT * FROM cards WHERE user_id = ? ORDER BY created_at, id', (user_id,))]
+
+    def locations(self, user_id):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                'SELECT * FROM locations WHERE user_id = ? ORDER BY name', (user_id,))]
+
+    def pending_cards(self, limit):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                'SELECT * FROM cards WHERE pending = 1 ORDER BY id LIMIT ?', (limit,))]
+
+    def watermark(self, user_id):
+        with self._lock:
+            row = self._conn.execute('SELECT watermark FROM sync_state WHERE name = ?',
+                                     (f'changes:{user_id}',)).fetchone()
+        return row[0] if row else None
+
+    # Local writes
+
+    def record_scan(self, user_id, card_uid, card_type):
+        """Queue a scanned card not known locally for enrollment.
+
+        Returns True if the card was new. Sightings are recorded by the
+        server's access checks, so none are kept here.
+        """
+        now = _now()
+
+        def write(conn):
+            cur = conn.execute('''
+                INSERT INTO cards (user_id, card_uid, card_type, created_at, updated_at, pending)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT (card_uid) DO NOTHING
+            ''', (user_id, card_uid, card_type, now, now))
+            return cur.rowcount == 1
+
+        return self._write(write)
+
+    def mark_enrolled(self, card_uids):
+        self._write(lambda conn: conn.executemany(
+            'UPDATE cards SET pending = 0, sync_error = NULL WHERE card_uid = ?',
+            [(uid,) for uid in card_uids]))
+
+    def mark_rejected(self, card_uid, error):
+        self._write(lambda conn: conn.execute(
+            'UPDATE cards SET pending = 0, sync_error = ? WHERE card_uid = ?', (error, card_uid)))
+
+    # Sync
+
+    def apply_changes(self, user_id, changes, watermark):
+        """Merge one page of ``user_id``'s server deltas and advance their
+        watermark atomically.
+
+        ``changes`` is the ``/api/sync`` payload: changed rows under
+        ``cards``/``locations`` and deleted ids under ``deleted``. A server
+        card replaces a pending local row with the same UID and a server
+        location adopts an unsynced local one with the same name; ``reset``
+        drops everything of the user previously synced first.
+        """
+        def write(conn):
+            if changes.get('reset'):
+                # The server no longer has tombstones back to our watermark
+                conn.execute('DELETE FROM cards WHERE user_id = ? AND remote_id IS NOT NULL AND pending = 0',
+                             (user_id,))
+                conn.execute('DELETE FROM locations WHERE user_id = ? AND remote_id IS NOT NULL', (user_id,))
+            for card in changes.get('cards', []):
+                values = [card.get('id')] + [card.get(field) for field in CARD_FIELDS[1:]]
+                conn.execute(f'''
+                    INSERT INTO cards ({', '.join(CARD_FIELDS)}, pending, sync_error)
+                    VALUES ({', '.join('?' * len(CARD_FIELDS))}, 0, NULL)
+                    ON CONFLICT (card_uid) DO UPDATE SET
+                        {', '.join(f'{field} = excluded.{field}' for field in CARD_FIELDS)},
+                        pending = 0, sync_error = NULL
+                ''', values)
+            for location in changes.get('locations', []):
+                # UNIQUE(user_id, name) is still on the legacy table: a row made
+                # before syncing becomes the server's, and any other row holding
+                # the name is superseded (a synced one was renamed or deleted
+                # since; its own change follows)
+                conn.execute('''
+                    UPDATE locations SET remote_id = ?
+                    WHERE user_id = ? AND name = ? AND remote_id IS NULL
+                      AND NOT EXISTS (SELECT 1 FROM locations WHERE remote_id = ?)
+                ''', (location['id'], location['user_id'], location['name'], location['id']))
+                conn.execute('DELETE FROM locations WHERE user_id = ? AND name = ? AND remote_id IS NOT ?',
+                             (location['user_id'], location['name'], location['id']))
+                conn.execute('''
+                    INSERT INTO locations (remote_id, user_id, name, description, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (remote_id) DO UPDATE SET
+                        user_id = excluded.user_id, name = excluded.name,
+                        description = excluded.description, updated_at = excluded.updated_at
+                ''', (location['id'], location['user_id'], location['name'], location.get('description'),
+                      location.get('created_at'), location.get('updated_at')))
+            deleted = changes.get('deleted', {})
+            conn.executemany('DELETE FROM cards WHERE remote_id = ?', [(i,) for i in deleted.get('cards', [])])
+            conn.executemany('DELETE FROM locations WHERE remote_id = ?', [(i,) for i in deleted.get('locations', [])])
+            conn.execute('''
+                INSERT INTO sync_state (name, watermark) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark
+            ''', (f'changes:{user_id}', watermark))
+
+        self._write(write)
@@ -2,12 +2,15 @@ from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButt
 from PySide6.QtCore import Signal
 import requests
 import os
+from ui.workers import ApiCall, REQUEST_TIMEOUT
 
 class LoginWindow(QDialog):
     login_successful = Signal(str)
 
     def __init__(self):
         super().__init__()
+        self.session_token = None
+        self.user_id = None
         self.setWindowTitle("One - Login")
         self.setMinimumWidth(320)
         layout = QVBoxLayout()
@@ -37,13 +40,42 @@ class LoginWindow(QDialog):
         if not email or not password:
             QMessageBox.warning(self, "Error", "Please enter both email and password.")
             return
-        # Call backend API for authentication
+        # The request runs on the thread pool so the dialog stays responsive
         api_url = os.getenv("API_URL", "http://localhost:5000/api/login")
-        try:
-            response = requests.post(api_url, json={"email": email, "password": password})
-            if response.status_code == 200:
-                self.accept()
-            else:
-                QMessageBox.warning(self, "Login Failed", "Invalid credentials or server error.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Could not connect to server: {e}") 
\ No newline at end of file
+        self.login_button.setEnabled(False)
+        self.login_button.setText("Logging in...")
+        call = ApiCall(post_login, api_url, email, password)
+        call.signals.finished.connect(self.login_finished)
+        call.signals.failed.connect(self.login_failed)
+        call.start()
+
+    def login_finished(self, result):
+        status_code, body = result
+        self.reset_button()
+        if status_code == 200:
+            # Later API calls authenticate with the token, not the password
+            self.session_token = body.get("token")
+            self.user_id = body.get("user_id")
+            self.login_successful.emit(self.email_input.text().strip())
+            self.accept()
+        elif status_code == 429:
+            QMessageBox.warning(self, "Login Failed", "Too many attempts. Please wait a minute and try again.")
+        else:
+            QMessageBox.warning(self, "Login Failed", "Invalid credentials or server error.")
+
+    def login_failed(self, error):
+        self.reset_button()
+        QMessageBox.critical(self, "Error", f"Could not connect to server: {error}")
+
+    def reset_button(self):
+        self.login_button.setEnabled(True)
+        self.login_button.setText("Login")
+
+
+def post_login(api_url, email, password):
+    response = requests.post(api_url, json={"email": email, "password": password}, timeout=REQUEST_TIMEOUT)
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    return response.status_code, body
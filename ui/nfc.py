@@ -1,24 +1,220 @@
-from smartcard.System import readers
-from smartcard.util import toHexString
+import os
+import time
+import queue
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as APDUTimeout
+from pcsc_backend import GET_UID_APDU, get_backend
+from uids import format_uid
+
+logger = logging.getLogger(__name__)
+
+APDU_TIMEOUT = float(os.getenv('NFC_APDU_TIMEOUT', '2.0'))
+POLL_INTERVAL = float(os.getenv('NFC_POLL_INTERVAL', '0.2'))
+
+# One entry on NFCReader.results: uid is None when error is set
+CardRead = namedtuple('CardRead', ['reader', 'uid', 'error', 'at'])
+
+
+class _ReaderWorker(threading.Thread):
+    """Owns one reader: a single reused connection and its own APDU thread.
+
+    A card is reported once when it arrives; the connection is kept while
+    the card stays on the reader and disconnected explicitly when it leaves.
+    """
+
+    def __init__(self, reader, results, apdu_timeout, poll_interval):
+        super().__init__(name=f'nfc-{reader}', daemon=True)
+        self.reader = reader
+        self.results = results
+        self.apdu_timeout = apdu_timeout
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._apdu = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'nfc-apdu-{reader}')
+        self._connection = None
+        self._connected = False
+        self._current_uid = None
+        self._stalled = False
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                self._poll()
+                self._stop_event.wait(self.poll_interval)
+        finally:
+            self._disconnect()
+            self._apdu.shutdown(wait=False)
+
+    def _poll(self):
+        if not self._connected:
+            try:
+                if self._connection is None:
+                    self._connection = self.reader.createConnection()
+                self._call(self._connection.connect)
+                self._connected = True
+            except APDUTimeout:
+                self._report_stall('Reader did not respond to connect')
+                return
+            except Exception:
+                # No card on the reader; stay quiet until one arrives
+                return
+        try:
+            response, sw1, sw2 = self._call(self._connection.transmit, GET_UID_APDU)
+        except APDUTimeout:
+            self._report_stall(f'Card did not answer within {self.apdu_timeout:.1f}s')
+            self._disconnect()
+            return
+        except Exception:
+            # Card left the field
+            self._disconnect()
+            return
+        if sw1 != 0x90:
+            if self._current_uid is not False:
+                self._report(None, 'Card not detected or unsupported')
+                self._current_uid = False
+            return
+        self._stalled = False
+        uid = format_uid(response)
+        if uid != self._current_uid:
+            self._current_uid = uid
+            self._report(uid, None)
+
+    def _call(self, fn, *args):
+        future = self._apdu.submit(fn, *args)
+        try:
+            return future.result(timeout=self.apdu_timeout)
+        except APDUTimeout:
+            # Don't queue more work behind a call the driver is still stuck in
+            future.cancel()
+            raise
+
+    def _disconnect(self):
+        if self._connected:
+            try:
+                self._connection.disconnect()
+            except Exception as e:
+                logger.debug(f"Disconnect from {self.reader} failed: {str(e)}")
+        self._connected = False
+        self._current_uid = None
+
+    def _report_stall(self, error):
+        # A hung reader is reported once, not on every poll
+        if not self._stalled:
+            self._stalled = True
+            self._report(None, error)
+
+    def _report(self, uid, error):
+        self.results.put(CardRead(str(self.reader), uid, error, time.time()))
+
+
+class _HotplugObserver:
+    def __init__(self, nfc):
+        self.nfc = nfc
+
+    def update(self, observable, actions):
+        added, removed = actions
+        for reader in added:
+            self.nfc._add_reader(reader)
+        for reader in removed:
+            self.nfc._remove_reader(reader)
+
 
 class NFCReader:
-    def __init__(self):
-        self.readers = readers()
-        self.reader = self.readers[0] if self.readers else None
+    """All attached readers, each served by its own worker thread.
+
+    Call ``start()`` and consume ``results`` (a thread-safe queue of
+    ``CardRead``) or ``get_result()``. Readers plugged in or removed while
+    running are picked up automatically. ``read_card_uid()`` still does a
+    one-shot read for callers that want a single answer.
+    """
+
+    def __init__(self, backend=None, apdu_timeout=APDU_TIMEOUT, poll_interval=POLL_INTERVAL):
+        self.backend = backend or get_backend()
+        self.apdu_timeout = apdu_timeout
+        self.poll_interval = poll_interval
+        self.results = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._observer = None
+
+    @property
+    def readers(self):
+        return self.backend.readers()
+
+    @property
+    def reader(self):
+        readers = self.readers
+        return readers[0] if readers else None
 
     def list_readers(self):
         return [str(r) for r in self.readers]
 
-    def read_card_uid(self):
-        if not self.reader:
+    def start(self):
+        if self._observer is not None:
+            return
+        self._observer = _HotplugObserver(self)
+        # The observer is called straight away with the readers already attached
+        self.backend.add_reader_observer(self._observer)
+
+    def stop(self, timeout=None):
+        if self._observer is not None:
+            self.backend.remove_observer(self._observer)
+            self._observer = None
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(timeout)
+
+    def get_result(self, timeout=None):
+        """Next ``CardRead`` from any reader, or None after ``timeout`` seconds."""
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _add_reader(self, reader):
+        name = str(reader)
+        with self._lock:
+            if name in self._workers:
+                return
+            worker = _ReaderWorker(reader, self.results, self.apdu_timeout, self.poll_interval)
+            self._workers[name] = worker
+        logger.info(f"NFC reader attached: {name}")
+        worker.start()
+
+    def _remove_reader(self, reader):
+        name = str(reader)
+        with self._lock:
+            worker = self._workers.pop(name, None)
+        if worker is not None:
+            logger.info(f"NFC reader detached: {name}")
+            worker.stop()
+
+    def read_card_uid(self, reader=None):
+        reader = reader or self.reader
+        if not reader:
             return None, "No NFC reader found"
+        connection = reader.createConnection()
+        executor = ThreadPoolExecutor(max_workers=1)
         try:
-            connection = self.reader.createConnection()
-            connection.connect()
-            get_uid_cmd = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-            response, sw1, sw2 = connection.transmit(get_uid_cmd)
+            executor.submit(connection.connect).result(timeout=self.apdu_timeout)
+            try:
+                response, sw1, sw2 = executor.submit(connection.transmit, GET_UID_APDU).result(timeout=self.apdu_timeout)
+            finally:
+                executor.submit(connection.disconnect)
             if sw1 == 0x90:
-                return toHexString(response).replace(' ', ''), None
+                return format_uid(response), None
             return None, "Card not detected or unsupported"
+        except APDUTimeout:
+            return None, "Reader timed out"
         except Exception as e:
-            return None, str(e) 
\ No newline at end of file
+            return None, str(e)
+        finally:
+            executor.shutdown(wait=False)
@@ -0,0 +1,201 @@
+import os
+import time
+import requests
+from PySide6.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, Signal
+from ui.nfc import NFCReader
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:5000")
+CARD_TYPE = os.getenv("NFC_CARD_TYPE", "MIFARE Classic")
+DEBOUNCE_SECONDS = float(os.getenv("NFC_DEBOUNCE_SECONDS", "2.0"))
+ENROLL_BATCH_SIZE = int(os.getenv("ENROLL_BATCH_SIZE", "50"))
+ENROLL_FLUSH_MS = int(os.getenv("ENROLL_FLUSH_MS", "500"))
+ENROLL_RETRY_MS = int(os.getenv("ENROLL_RETRY_MS", "5000"))
+REQUEST_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+
+
+def api_url(path):
+    return API_BASE_URL.rstrip('/') + path
+
+
+class CallSignals(QObject):
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class ApiCall(QRunnable):
+    """Run ``fn(*args)`` on the global QThreadPool.
+
+    The result or the error message comes back through ``signals``, which
+    Qt delivers on the receiver's (GUI) thread.
+    """
+
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = CallSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+        return self
+
+
+class ScanWorker(QThread):
+    """Continuous scanning across every reader, off the GUI thread.
+
+    Emits ``card_scanned(reader, uid)`` once per tap; the same UID seen
+    again within ``debounce`` seconds is ignored.
+    """
+
+    card_scanned = Signal(str, str)
+    scan_error = Signal(str, str)
+    readers_changed = Signal(list)
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS, parent=None):
+        super().__init__(parent)
+        self.debounce = debounce
+
+    def run(self):
+        nfc = NFCReader()
+        nfc.start()
+        last_seen = {}
+        readers = None
+        readers_checked = 0.0
+        try:
+            while not self.isInterruptionRequested():
+                now = time.monotonic()
+                if now - readers_checked >= 1.0:
+                    readers_checked = now
+                    current = nfc.list_readers()
+                    if current != readers:
+                        readers = current
+                        self.readers_changed.emit(current)
+                result = nfc.get_result(timeout=0.1)
+                if result is None:
+                    continue
+                if result.error:
+                    self.scan_error.emit(result.reader, result.error)
+                    continue
+                now = time.monotonic()
+                if now - last_seen.get(result.uid, float('-inf')) < self.debounce:
+                    continue
+                last_seen[result.uid] = now
+                self.card_scanned.emit(result.reader, result.uid)
+        finally:
+            nfc.stop(1.0)
+
+    def stop(self):
+        self.requestInterruption()
+        self.wait(2000)
+
+
+def auth_headers(session_token):
+    return {"Authorization": f"Bearer {session_token}"} if session_token else {}
+
+
+def post_cards(session_token, rows):
+    response = requests.post(api_url("/api/cards/bulk"), json=rows, headers=auth_headers(session_token),
+                             timeout=REQUEST_TIMEOUT)
+    if response.status_code >= 500:
+        raise RuntimeError(response.json().get("error", f"HTTP {response.status_code}"))
+    return response.json()
+
+
+def pull_changes(store, session_token, user_id):
+    """Pull every delta of ``user_id`` since their watermark; returns the number of rows applied."""
+    applied = 0
+    while True:
+        params = {"limit": SYNC_PAGE_SIZE}
+        since = store.watermark(user_id)
+        if since:
+            params["since"] = since
+        response = requests.get(api_url("/api/sync"), params=params, headers=auth_headers(session_token),
+                                timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        store.apply_changes(user_id, page, page["watermark"])
+        applied += sum(len(page.get(key, [])) for key in ("cards", "locations"))
+        applied += sum(len(ids) for ids in page.get("deleted", {}).values())
+        if not page.get("has_more"):
+            return applied
+
+
+class EnrollmentBatcher(QObject):
+    """Push cards queued in the local store to ``/api/cards/bulk``.
+
+    ``add()`` is called after each scan; a batch is sent when
+    ``batch_size`` scans are waiting or ``flush_ms`` after the first one,
+    with at most one request in flight. Cards stay pending in the store
+    until the server answers, so a failed batch is simply retried after
+    ``retry_ms`` and nothing is lost if the app is closed while offline.
+    """
+
+    enrolled = Signal(str)
+    rejected = Signal(str, str)
+    batch_failed = Signal(str)
+
+    def __init__(self, store, session_token, batch_size=ENROLL_BATCH_SIZE,
+                 flush_ms=ENROLL_FLUSH_MS, retry_ms=ENROLL_RETRY_MS, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.session_token = session_token
+        self.batch_size = batch_size
+        self.retry_ms = retry_ms
+        self._queued = 0
+        self._in_flight = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(flush_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def add(self, uid):
+        self._queued += 1
+        if self._queued >= self.batch_size:
+            self.flush()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        if self._in_flight is not None:
+            return
+        self._timer.stop()
+        self._queued = 0
+        batch = self.store.pending_cards(self.batch_size)
+        if not batch:
+            return
+        rows = [{"user_id": card["user_id"], "card_uid": card["card_uid"], "card_type": card["card_type"]}
+                for card in batch]
+        uids = [card["card_uid"] for card in batch]
+        call = ApiCall(post_cards, self.session_token, rows)
+        call.signals.finished.connect(lambda result: self._done(uids, result))
+        call.signals.failed.connect(self._failed)
+        self._in_flight = call.start()
+
+    def _done(self, batch, result):
+        self._in_flight = None
+        errors = {err.get("card_uid"): err["error"] for err in result.get("errors", [])}
+        if "error" in result:
+            errors = {uid: result["error"] for uid in batch}
+        enrolled = [uid for uid in batch if uid not in errors]
+        self.store.mark_enrolled(enrolled)
+        for uid in enrolled:
+            self.enrolled.emit(uid)
+        for uid, error in errors.items():
+            if uid in batch:
+                self.store.mark_rejected(uid, error)
+                self.rejected.emit(uid, error)
+        self.flush()
+
+    def _failed(self, error):
+        self._in_flight = None
+        self.batch_failed.emit(error)
+        QTimer.singleShot(self.retry_ms, self.flush)
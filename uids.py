@@ -0,0 +1,56 @@
+"""Card UID codec shared by the readers, the API and the database layer.
+
+A UID is stored and compared as raw bytes (the ``card_uid`` domain in
+Postgres) and shown as upper-case hex without separators. ISO 14443 UIDs
+are 4, 7 or 10 bytes; anything from 4 to 10 bytes is accepted so 8-byte
+ISO 15693 and FeliCa ids fit too.
+"""
+import re
+
+MIN_UID_BYTES = 4
+MAX_UID_BYTES = 10
+
+_SEPARATORS = re.compile(r'[\s:.-]')
+
+
+class UIDError(ValueError):
+    """Raised for values that are not a valid card UID."""
+
+
+def parse_uid(value):
+    """Return the UID bytes for hex text (any case, ``:``/``-``/space
+    separators allowed), a bytes-like object or a list of byte values.
+    """
+    if isinstance(value, str):
+        try:
+            uid = bytes.fromhex(_SEPARATORS.sub('', value))
+        except ValueError:
+            raise UIDError('card_uid must be hex')
+    elif isinstance(value, (bytes, bytearray, memoryview, list, tuple)):
+        try:
+            uid = bytes(value)
+        except (TypeError, ValueError):
+            raise UIDError('card_uid must be a sequence of bytes')
+    else:
+        raise UIDError('card_uid must be hex text')
+    if not MIN_UID_BYTES <= len(uid) <= MAX_UID_BYTES:
+        raise UIDError(f'card_uid must be {MIN_UID_BYTES} to {MAX_UID_BYTES} bytes')
+    return uid
+
+
+def try_parse_uid(value):
+    """``parse_uid``, or None if ``value`` is not a valid UID."""
+    try:
+        return parse_uid(value)
+    except UIDError:
+        return None
+
+
+def format_uid(value):
+    """Render UID bytes (or a reader's list of byte values) as upper-case hex."""
+    return bytes(value).hex().upper()
+
+
+def canonical_uid(value):
+    """Normalise any accepted UID spelling to its upper-case hex form."""
+    return format_uid(parse_uid(value))
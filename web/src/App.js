@@ -137,7 +137,7 @@ function DashboardComponent({ user, onLogout }) {
   // NFC scan
   const handleNFCScan = async () => {
     try {
-      const response = await fetch('http://localhost:5000/read_card');
+      const response = await fetch('http://localhost:5000/read_card?wait=10');
       const data = await response.json();
       if (data.error) {
         setScanResult(data.error);
@@ -1,13 +1,50 @@
 import os
-import time
-import logging
-from flask import Flask, request, jsonify
+import math
+import secrets
+from datetime import datetime
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CONTENT_TYPE_LATEST
 from dotenv import load_dotenv
-from logging.handlers import RotatingFileHandler
-import psycopg2
-import bcrypt
+from db import get_db_connection, PoolTimeout
+from instrumentation import begin_request, end_request, timed, metrics_payload
+from logging_config import configure_logging, request_id_var, request_id_from, log_request
+from streaming import (
+    CARD_COLUMNS, LOCATION_COLUMNS, NDJSON_MIMETYPE, PageArgsError,
+    parse_page_args, wants_ndjson, build_keyset_query, open_keyset_cursor, iter_json, encode_chunk, dumps
+)
+from http_compression import MIN_BYTES as COMPRESS_MIN_BYTES, negotiate, should_compress, weak_etag, compress, CompressedStream
+from cache import cache_from_env
+from bulk_ingest import BulkParseError, parse_upload, validate_rows, keep_own_rows, copy_cards
+from access_engine import get_index
+from access_log_writer import get_writer
+from sightings import get_tracker
+from dashboard import DashboardArgsError, parse_dashboard_args, query_dashboard
+from tenants import (
+    UNSCOPED, TenantArgsError, parse_tenant_id, user_scope, building_cards_scope, is_building_admin,
+    admin_buildings
+)
+from handlers import (
+    INSERT_CARD_SQL, INSERT_LOCATION_SQL, LOGIN_SQL, REHASH_SQL, BodyError, card_params, location_params,
+    parse_login, login_body, parse_check, list_namespace, invalidate_user_lists
+)
+from access_history import HistoryArgsError, parse_history_args, stats_filters, query_logs, query_stats
+from auth import (
+    VerifierBusy, VerifierTimeout, RateLimited, login_limiter_from_env, session_tokens_from_env,
+    get_verifier, hash_rounds, bearer_token
+)
+from sync_changes import (
+    SyncArgsError, VERSION_SQL, version_params, parse_sync_args, query_changes, list_etag, etag_matches,
+    user_id_from_claims
+)
+from access_lists import (
+    AccessListArgsError, MEDIA_TYPE, CARD_STATUSES, OWNER_STATUSES, SET_STATUS_SQL, ADMIN_SET_STATUS_SQL,
+    parse_access_list_args, query_access_list, encode_access_list, access_list_json, controller_token_valid
+)
+from events import (
+    EventArgsError, KEEPALIVE_SECONDS, Subscriber, parse_event_filters, scope_event_filters, format_sse,
+    format_dropped, get_hub
+)
 
 # Load environment variables
 load_dotenv()
@@ -15,71 +52,77 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Configure logging
+# Records are queued and written as JSON by a background thread
 log_dir = os.getenv('LOG_DIR', '/app/logs')
-log_file = os.path.join(log_dir, 'app.log')
-
-# Ensure log directory exists
-os.makedirs(log_dir, exist_ok=True)
-
-# Configure logging to both file and console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]',
-    handlers=[
-        RotatingFileHandler(log_file, maxBytes=10240, backupCount=10),
-        logging.StreamHandler()
-    ]
-)
+configure_logging(os.path.join(log_dir, 'app.log'))
 
-app.logger.setLevel(logging.INFO)
 app.logger.info('Application startup')
 
-# Prometheus metrics
-REQUEST_COUNT = Counter(
-    'http_requests_total',
-    'Total HTTP requests',
-    ['method', 'endpoint', 'status']
-)
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
 
-REQUEST_LATENCY = Histogram(
-    'http_request_duration_seconds',
-    'HTTP request latency',
-    ['method', 'endpoint']
-)
+if not os.getenv('SECRET_KEY'):
+    # gunicorn.conf.py sets a shared key before forking; this only covers `python web_server.py`
+    app.logger.warning('SECRET_KEY is not set; session tokens will not survive a restart')
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+
+login_limiter = login_limiter_from_env()
+session_tokens = session_tokens_from_env(app.config['SECRET_KEY'])
+
+class TimedJSONEncoder(app.json_encoder):
+    """Encodes ``jsonify`` output with orjson, timed as the ``serialize`` phase."""
+
+    def encode(self, o):
+        with timed('serialize'):
+            return dumps(o, sort_keys=self.sort_keys, indent=bool(self.indent)).decode('utf-8')
 
-def get_db_connection():
-    """Create a database connection."""
-    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-    return conn
+app.json_encoder = TimedJSONEncoder
 
 @app.before_request
 def before_request():
-    """Log request before processing."""
-    request.start_time = time.time()
+    """Start timing the request and tag its log records with a request id."""
+    request.metrics = begin_request()
+    request.request_id = request_id_from(request.headers.get('X-Request-ID'))
+    request_id_var.set(request.request_id)
+
+def compress_response(response):
+    """Compress the body for the client's ``Accept-Encoding`` (see ``http_compression``)."""
+    if response.direct_passthrough or not should_compress(
+            response.status_code, response.mimetype, response.headers.get('Content-Encoding')):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    etag = response.headers.get('ETag')
+    if response.is_streamed:
+        response.response = CompressedStream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(body, encoding, etag))
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.headers['ETag'] = weak_etag(etag)
+    return response
 
 @app.after_request
 def after_request(response):
-    """Log request after processing."""
-    if hasattr(request, 'start_time'):
-        duration = time.time() - request.start_time
-        REQUEST_LATENCY.labels(
-            method=request.method,
-            endpoint=request.endpoint
-        ).observe(duration)
-    
-    REQUEST_COUNT.labels(
-        method=request.method,
-        endpoint=request.endpoint,
-        status=response.status_code
-    ).inc()
-    
+    """Compress the response, record request metrics by route template, and log the request."""
+    response = compress_response(response)
+    timings = getattr(request, 'metrics', None)
+    if timings is not None:
+        route = request.url_rule.rule if request.url_rule is not None else None
+        elapsed = end_request(timings, request.method, route, response.status_code)
+        log_request(request.method, request.path, route, response.status_code, elapsed)
+        response.headers['X-Request-ID'] = request.request_id
     return response
 
 @app.route('/metrics')
 def metrics():
     """Expose Prometheus metrics."""
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    return metrics_payload(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 @app.route('/health')
 def health_check():
@@ -90,97 +133,687 @@ def health_check():
 def index():
     return "Backend is running!", 200
 
-@app.route('/api/cards', methods=['GET'])
-def get_cards():
-    """Get all cards."""
-    try:
-        conn = get_db_connection()
+# Pages up to this size are served from the list cache; larger reads stream
+CACHE_MAX_ROWS = int(os.getenv('CACHE_MAX_ROWS', '1000'))
+list_cache = cache_from_env('lists')
+
+def read_version(conn, table, scope=UNSCOPED):
+    """Change version of ``table`` and of the tables ``scope`` reads."""
+    cur = conn.cursor()
+    cur.execute(VERSION_SQL, version_params(table, *scope.tables))
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+def load_page(table, columns, limit, after, ndjson, scope=UNSCOPED):
+    """Render one bounded page and its ETag for the list cache."""
+    with get_db_connection() as conn:
+        version = read_version(conn, table, scope)
         cur = conn.cursor()
-        cur.execute('SELECT * FROM cards')
-        cards = cur.fetchall()
+        query, params = build_keyset_query(table, columns, after=after, limit=limit,
+                                           where=scope.where, params=scope.params)
+        cur.execute(query, params)
+        body, _ = encode_chunk(cur.fetchall(), columns, ndjson, True)
         cur.close()
+    return {
+        'etag': list_etag(table, version, scope.key, limit, after, ndjson),
+        'body': (body if ndjson else b'[' + body + b']').decode('utf-8')
+    }
+
+def cached_page(table, columns, label, limit, after, ndjson, scope=UNSCOPED):
+    try:
+        key = f'{limit}:{after}:{int(ndjson)}'
+        if scope.tables:
+            # Writes to those tables never reach list_cache.invalidate, so key by version
+            with get_db_connection() as conn:
+                key = f'{key}:{read_version(conn, table, scope)}'
+        # Namespaced by tenant so a write only drops the pages of the users it touched
+        page = list_cache.get_or_load(
+            list_namespace(table, scope), key, lambda: load_page(table, columns, limit, after, ndjson, scope)
+        )
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting {label}: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting {label}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    headers = {'ETag': page['etag'], 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('If-None-Match'), page['etag']):
+        return Response(status=304, headers=headers)
+    return Response(page['body'], mimetype=NDJSON_MIMETYPE if ndjson else 'application/json', headers=headers)
+
+def stream_table(table, columns, label, scope=UNSCOPED):
+    """Stream a keyset page of ``table`` as JSON or NDJSON, limited to ``scope``.
+
+    The response carries an ETag derived from the table's change version,
+    so a client revalidating with ``If-None-Match`` gets a 304 after one
+    short index lookup instead of the whole table. Pages of at most
+    ``CACHE_MAX_ROWS`` rows come from the list cache.
+    """
+    try:
+        limit, after = parse_page_args(request.args)
+    except PageArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    ndjson = wants_ndjson(request)
+    if limit is not None and limit <= CACHE_MAX_ROWS:
+        return cached_page(table, columns, label, limit, after, ndjson, scope)
+    try:
+        conn = get_db_connection()
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting {label}: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    try:
+        # Read the version before the rows so the ETag is never newer than the body
+        version = read_version(conn, table, scope)
+        etag = list_etag(table, version, scope.key, limit, after, ndjson)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            conn.close()
+            return Response(status=304, headers=headers)
+        cur = open_keyset_cursor(conn, table, columns, after=after, limit=limit,
+                                 where=scope.where, params=scope.params)
+    except Exception as e:
         conn.close()
-        return jsonify(cards), 200
+        app.logger.error(f"Error getting {label}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return Response(
+        iter_json(conn, cur, columns, ndjson=ndjson, logger=app.logger),
+        mimetype=NDJSON_MIMETYPE if ndjson else 'application/json',
+        headers=headers
+    )
+
+@app.route('/api/cards', methods=['GET'])
+def get_cards():
+    """Get the session user's cards, ordered by id.
+
+    Query parameters: ``limit`` (page size) and ``after`` (id of the last
+    card already seen). Send ``Accept: application/x-ndjson`` or
+    ``format=ndjson`` for one object per line.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    return stream_table('cards', CARD_COLUMNS, 'cards', user_scope(user_id))
+
+def stream_user_table(user_id, table, columns, label):
+    """``stream_table`` over the session user's own rows of ``table``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    session_user = user_id_from_claims(claims) if claims else None
+    if session_user is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        user_id = parse_tenant_id(user_id, 'user_id')
+    except TenantArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    if user_id != session_user:
+        return jsonify({'error': 'Access denied'}), 403
+    return stream_table(table, columns, label, user_scope(user_id))
+
+@app.route('/api/users/<user_id>/cards', methods=['GET'])
+def get_user_cards(user_id):
+    """Get the session user's cards; paginated like ``get_cards``."""
+    return stream_user_table(user_id, 'cards', CARD_COLUMNS, 'user cards')
+
+@app.route('/api/buildings/<building_id>/cards', methods=['GET'])
+def get_building_cards(building_id):
+    """Get the cards granted anywhere in a building; paginated like ``get_cards``.
+
+    Only the building's admins and corporate admins may look.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        building_id = parse_tenant_id(building_id, 'building_id')
+        with get_db_connection() as conn:
+            allowed = is_building_admin(conn, building_id, user_id)
+    except TenantArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting building cards: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
     except Exception as e:
-        app.logger.error(f"Error getting cards: {str(e)}")
+        app.logger.error(f"Error getting building cards: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    if not allowed:
+        return jsonify({'error': 'Access denied'}), 403
+    return stream_table('cards', CARD_COLUMNS, 'building cards', building_cards_scope(building_id))
 
 @app.route('/api/cards', methods=['POST'])
 def add_card():
-    """Add a new card."""
+    """Add a card for the session user.
+
+    Body: ``card_uid``, ``card_type`` and an optional ``name``.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
     try:
-        data = request.get_json()
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO cards (card_id, card_type, location_id) VALUES (%s, %s, %s)',
-            (data['card_id'], data['card_type'], data['location_id'])
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        params = card_params(user_id, request.get_json(silent=True))
+    except BodyError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(INSERT_CARD_SQL, params)
+            conn.commit()
+            cur.close()
+        invalidate_user_lists(list_cache, 'cards', [user_id])
         return jsonify({'message': 'Card added successfully'}), 201
+    except PoolTimeout as e:
+        app.logger.warning(f"Error adding card: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
     except Exception as e:
         app.logger.error(f"Error adding card: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/locations', methods=['GET'])
-def get_locations():
-    """Get all locations."""
+@app.route('/api/cards/bulk', methods=['POST'])
+def add_cards_bulk():
+    """Enroll many cards in one transaction.
+
+    Accepts a JSON array, NDJSON (``application/x-ndjson``) or CSV
+    (``text/csv``) body, or the same formats as a multipart ``file``
+    upload. Rows that fail validation or collide on ``card_uid`` are
+    reported individually; the rest are inserted. Requires a session;
+    ``user_id`` defaults to the session user, and only building and
+    corporate admins may name someone else.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    upload = request.files.get('file')
+    if upload is not None:
+        body, content_type = upload.read(), upload.mimetype
+        if upload.filename and upload.filename.lower().endswith('.csv'):
+            content_type = 'text/csv'
+    else:
+        body, content_type = request.get_data(), request.mimetype
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM locations')
-        locations = cur.fetchall()
-        cur.close()
-        conn.close()
-        return jsonify(locations), 200
+        records = parse_upload(body, content_type)
+    except (BulkParseError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Could not parse upload: {str(e)}'}), 400
+    max_rows = int(os.getenv('BULK_MAX_ROWS', '100000'))
+    if len(records) > max_rows:
+        return jsonify({'error': f'Upload exceeds {max_rows} rows'}), 413
+
+    inserted = 0
+    try:
+        rows, errors = validate_rows(records, user_id)
+        if rows:
+            with get_db_connection() as conn:
+                if any(row[1] != user_id for row in rows) and admin_buildings(conn, user_id) == frozenset():
+                    rows = keep_own_rows(rows, errors, user_id)
+                if rows:
+                    inserted, db_errors = copy_cards(conn, rows)
+                    conn.commit()
+                    errors.extend(db_errors)
+            if inserted:
+                invalidate_user_lists(list_cache, 'cards', [row[1] for row in rows])
+    except PoolTimeout as e:
+        app.logger.warning(f"Error adding cards in bulk: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error adding cards in bulk: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    errors.sort(key=lambda err: err['row'])
+    return jsonify({
+        'received': len(records),
+        'inserted': inserted,
+        'failed': len(errors),
+        'errors': errors
+    }), 201 if inserted else 200
+
+def write_card_status(conn, sql, params):
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return row
+
+def card_status_response(row):
+    if row is None:
+        return jsonify({'error': 'Card not found'}), 404
+    invalidate_user_lists(list_cache, 'cards', [str(row[4])])
+    return jsonify({
+        'id': str(row[0]), 'card_uid': row[1], 'status': row[2], 'updated_at': row[3].isoformat()
+    }), 200
+
+@app.route('/api/cards/<card_id>/status', methods=['PUT'])
+def set_card_status(card_id):
+    """Report one of the session user's cards lost, or suspend it.
+
+    Body: ``{"status": "lost"}`` (or ``suspended``). A revoked card stays
+    revoked; reactivating or revoking a card is up to the admins of a
+    building it is granted in (``set_building_card_status``). The change
+    reaches door controllers through their next access list diff.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    status = (request.get_json(silent=True) or {}).get('status')
+    if status not in OWNER_STATUSES:
+        return jsonify({'error': f"status must be one of {', '.join(OWNER_STATUSES)}"}), 400
+    try:
+        card_id = parse_tenant_id(card_id, 'card_id')
+        with get_db_connection() as conn:
+            row = write_card_status(conn, SET_STATUS_SQL, (status, card_id, user_id))
+    except TenantArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error setting card status: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error setting card status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return card_status_response(row)
+
+@app.route('/api/buildings/<building_id>/cards/<card_id>/status', methods=['PUT'])
+def set_building_card_status(building_id, card_id):
+    """Set the status of a card granted in a building.
+
+    Body: ``{"status": "revoked"}`` (or any of ``CARD_STATUSES``). Only
+    the building's admins and corporate admins may change it.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    status = (request.get_json(silent=True) or {}).get('status')
+    if status not in CARD_STATUSES:
+        return jsonify({'error': f"status must be one of {', '.join(CARD_STATUSES)}"}), 400
+    try:
+        building_id = parse_tenant_id(building_id, 'building_id')
+        card_id = parse_tenant_id(card_id, 'card_id')
+        with get_db_connection() as conn:
+            if not is_building_admin(conn, building_id, user_id):
+                return jsonify({'error': 'Access denied'}), 403
+            row = write_card_status(conn, ADMIN_SET_STATUS_SQL, (status, card_id, building_id))
+    except TenantArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error setting card status: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error setting card status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return card_status_response(row)
+
+@app.route('/api/cards/<card_id>/effective-access', methods=['GET'])
+def get_effective_access(card_id):
+    """Audit view of a card's compiled permissions, from the in-memory index.
+
+    Shows, per access point, the granted and required levels and the
+    weekly schedule windows, and whether the card opens it at ``at`` (an
+    ISO-8601 timestamp; defaults to now). Only the card's owner may look.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    when = None
+    if request.args.get('at'):
+        try:
+            when = datetime.fromisoformat(request.args['at'])
+        except ValueError:
+            return jsonify({'error': 'at must be ISO-8601'}), 400
+    try:
+        index = get_index()
+    except PoolTimeout as e:
+        app.logger.warning(f"Error loading access index: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
     except Exception as e:
-        app.logger.error(f"Error getting locations: {str(e)}")
+        app.logger.error(f"Error loading access index: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    result = index.effective_access(card_id, when)
+    if result is None or result['user_id'] != user_id:
+        return jsonify({'error': 'Card not found'}), 404
+    return jsonify(result), 200
+
+@app.route('/api/buildings/<building_id>/access-list', methods=['GET'])
+def get_access_list(building_id):
+    """Versioned allow/revocation list of a building for door controllers.
+
+    Without ``since`` the full list is returned; with ``since`` set to the
+    version a controller holds, only the UIDs changed after it (a full
+    list again if that version has been purged). ``format=bloom`` sends
+    the allowed UIDs of a full list as a Bloom filter. The body is the
+    binary layout described in ``access_lists``, or JSON with
+    ``Accept: application/json``. Requires the ``ACCESS_LIST_TOKEN``
+    bearer token, or the session of one of the building's admins.
+    """
+    token = bearer_token(request) or ''
+    admin_id = None
+    if not controller_token_valid(token):
+        claims = session_tokens.verify(token)
+        admin_id = user_id_from_claims(claims) if claims else None
+        if admin_id is None:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+    try:
+        building_id, since, bloom = parse_access_list_args(building_id, request.args)
+        with get_db_connection() as conn:
+            if admin_id is not None and not is_building_admin(conn, building_id, admin_id):
+                return jsonify({'error': 'Access denied'}), 403
+            result = query_access_list(conn, building_id, since)
+    except AccessListArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting access list: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting access list: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    as_json = 'application/json' in request.headers.get('Accept', '')
+    etag = list_etag('access_list', result['version'], building_id, result['since'], bloom, as_json)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Access-List-Version': str(result['version'])}
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    if as_json:
+        return jsonify(access_list_json(building_id, result)), 200, headers
+    return Response(encode_access_list(building_id, result, bloom), mimetype=MEDIA_TYPE, headers=headers)
+
+@app.route('/api/locations', methods=['GET'])
+def get_locations():
+    """Get the session user's locations, ordered by id; paginated like ``get_cards``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    return stream_table('locations', LOCATION_COLUMNS, 'locations', user_scope(user_id))
+
+@app.route('/api/users/<user_id>/locations', methods=['GET'])
+def get_user_locations(user_id):
+    """Get the session user's locations; paginated like ``get_cards``."""
+    return stream_user_table(user_id, 'locations', LOCATION_COLUMNS, 'user locations')
 
 @app.route('/api/locations', methods=['POST'])
 def add_location():
-    """Add a new location."""
+    """Add a location for the session user. Body: ``name`` and an optional ``description``."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
     try:
-        data = request.get_json()
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO locations (name, description) VALUES (%s, %s)',
-            (data['name'], data['description'])
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        params = location_params(user_id, request.get_json(silent=True))
+    except BodyError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(INSERT_LOCATION_SQL, params)
+            conn.commit()
+            cur.close()
+        invalidate_user_lists(list_cache, 'locations', [user_id])
         return jsonify({'message': 'Location added successfully'}), 201
+    except PoolTimeout as e:
+        app.logger.warning(f"Error adding location: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
     except Exception as e:
         app.logger.error(f"Error adding location: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Cards and locations of the session's user changed since a watermark.
+
+    Query parameters: ``since`` (the ``watermark`` of the previous
+    response; omit for a full sync) and ``limit``. Deletes are returned as
+    ids under ``deleted``. Keep calling while ``has_more`` is true. With
+    ``reset`` the client must drop its copy first.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        since, limit, reset = parse_sync_args(request.args)
+        with get_db_connection() as conn:
+            payload = query_changes(conn, user_id, since, limit, reset)
+        return jsonify(payload), 200
+    except SyncArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting changes: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting changes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """The session user's cards, locations, access point assignments and
+    recent card history, built by one statement on one connection.
+
+    Query parameters: ``sections`` (comma-separated), ``fields``
+    (``section.field`` names), ``limit`` and ``<section>_limit``; see
+    ``dashboard.parse_dashboard_args``. Each section's ``has_more`` says
+    whether its limit cut rows off.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        sections, fields, limits = parse_dashboard_args(request.args)
+        with get_db_connection() as conn:
+            body = query_dashboard(conn, user_id, sections, fields, limits)
+        return Response(body, mimetype='application/json')
+    except DashboardArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting dashboard: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting dashboard: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/events/stream', methods=['GET'])
+def event_stream():
+    """Server-Sent Events stream of access decisions and card status changes.
+
+    Query parameters: ``building_id`` and ``access_point_id``, each a
+    comma-separated list of UUIDs. Only events of buildings the session
+    user administers are sent (every building for corporate admins). A
+    client that falls behind loses its oldest events and is sent a
+    ``dropped`` event with the count. Each open stream holds a worker
+    thread here; serve large numbers of watchers from the ASGI app instead.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        building_ids, access_point_ids = parse_event_filters(request.args)
+        with get_db_connection() as conn:
+            allowed = admin_buildings(conn, user_id)
+    except EventArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    building_ids = scope_event_filters(building_ids, access_point_ids, allowed)
+    if building_ids is None:
+        return jsonify({'error': 'Access denied'}), 403
+    hub = get_hub()
+
+    def generate():
+        # Subscribed on first iteration, so a HEAD request, whose body is never iterated, leaves nothing behind
+        subscriber = hub.subscribe(Subscriber(building_ids, access_point_ids, allowed_buildings=allowed))
+        try:
+            yield ': connected\n\n'
+            while True:
+                if not subscriber.wait(KEEPALIVE_SECONDS):
+                    yield ': keepalive\n\n'
+                    continue
+                events, dropped = subscriber.drain()
+                if dropped:
+                    yield format_dropped(dropped)
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/access/check', methods=['POST'])
+def check_access():
+    """Decide whether a card may open an access point.
+
+    Body: ``card_uid``, ``access_point_id`` and an optional ISO-8601
+    ``timestamp`` (defaults to now). Answered from the in-memory index.
+    """
+    try:
+        card_uid, access_point_id, when = parse_check(request.get_json(silent=True))
+    except BodyError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        index = get_index()
+    except PoolTimeout as e:
+        app.logger.warning(f"Error loading access index: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error loading access index: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    decision = index.check(card_uid, access_point_id, when)
+    # access_logs needs a known card and door; the write happens off the request path
+    if decision.card_id and decision.reason != 'unknown_access_point':
+        get_writer().submit(decision.card_id, access_point_id, decision.granted, when)
+        get_tracker().record(decision.user_id, card_uid, when)
+    return jsonify(decision.to_dict()), 200
+
+@app.route('/api/access-logs', methods=['GET'])
+def get_access_logs():
+    """Get access log entries, newest first.
+
+    Filters: ``access_point_id``, ``card_id``, ``since``/``until``
+    (ISO-8601, default the last seven days). Pass the returned ``next``
+    value as ``after`` to fetch the following page. Only entries of the
+    session user's own cards, or of access points in buildings they
+    administer, are returned.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        args = parse_history_args(request.args)
+        with get_db_connection() as conn:
+            items, next_cursor = query_logs(conn, user_id, **args)
+        return jsonify({'items': items, 'next': next_cursor}), 200
+    except HistoryArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting access logs: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting access logs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/access-logs/stats', methods=['GET'])
+def get_access_log_stats():
+    """Get granted/denied counts per access point from the rollup tables.
+
+    ``granularity`` is ``hour`` (default) or ``day``; other parameters
+    match ``get_access_logs`` except ``card_id``. Only access points in
+    buildings the session user administers are counted.
+    """
+    claims = session_tokens.verify(bearer_token(request) or '')
+    user_id = user_id_from_claims(claims) if claims else None
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    try:
+        args = parse_history_args(request.args)
+        with get_db_connection() as conn:
+            items, next_cursor = query_stats(
+                conn, user_id,
+                granularity=request.args.get('granularity', 'hour'),
+                **stats_filters(args)
+            )
+        return jsonify({'items': items, 'next': next_cursor}), 200
+    except HistoryArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout as e:
+        app.logger.warning(f"Error getting access log stats: {str(e)}")
+        return jsonify({'error': 'Database busy, retry later'}), 503
+    except Exception as e:
+        app.logger.error(f"Error getting access log stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/login', methods=['POST'])
 def api_login():
-    data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-    if not email or not password:
-        return jsonify({'error': 'Missing email or password'}), 400
+    """Verify a password and issue a short-lived session token.
+
+    bcrypt runs in a separate process pool; the request is turned away
+    with 429 when the account is rate limited and 503 when the pool's
+    backlog is full. Hashes made with a different cost than
+    ``BCRYPT_ROUNDS`` are upgraded on a successful login.
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT password_hash FROM users WHERE lower(email) = lower(%s)', (email,))
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        if result:
-            stored_hash = result[0]
-            if isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-            if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
-                return jsonify({'message': 'Login successful'}), 200
-        return jsonify({'error': 'Invalid credentials'}), 401
+        email, password = parse_login(request.get_json(silent=True))
+    except BodyError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        login_limiter.hit(email.lower())
+    except RateLimited as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(math.ceil(e.retry_after))}
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(LOGIN_SQL, (email,))
+            result = cur.fetchone()
+            cur.close()
+        user_id, stored_hash = result if result else (None, None)
+        if isinstance(stored_hash, str):
+            stored_hash = stored_hash.encode('utf-8')
+        verifier = get_verifier()
+        if not verifier.check(password.encode('utf-8'), stored_hash):
+            return jsonify({'error': 'Invalid credentials'}), 401
+        login_limiter.reset(email.lower())
+        if hash_rounds(stored_hash) != BCRYPT_ROUNDS:
+            rehash_password(verifier, user_id, password, stored_hash)
+        return jsonify(login_body(session_tokens, user_id, email)), 200
+    except VerifierTimeout:
+        return jsonify({'error': 'Password check timed out, retry shortly'}), 503, {'Retry-After': '1'}
+    except VerifierBusy:
+        return jsonify({'error': 'Too many logins in progress, retry shortly'}), 503, {'Retry-After': '1'}
+    except PoolTimeout:
+        return jsonify({'error': 'Database busy, retry later'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def rehash_password(verifier, user_id, password, old_hash):
+    """Store the password again at the configured bcrypt cost."""
+    try:
+        new_hash = verifier.hash(password.encode('utf-8'), BCRYPT_ROUNDS)
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(REHASH_SQL, (new_hash.decode('utf-8'), user_id, old_hash.decode('utf-8')))
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        app.logger.warning(f"Could not rehash password for user {user_id}: {str(e)}")
+
+@app.route('/api/session/refresh', methods=['POST'])
+def refresh_session():
+    """Exchange a valid session token for a fresh one."""
+    claims = session_tokens.verify(bearer_token(request) or '')
+    if claims is None:
+        return jsonify({'error': 'Invalid or expired session'}), 401
+    return jsonify({
+        'token': session_tokens.issue(claims['sub'], claims['email']),
+        'expires_in': session_tokens.ttl
+    }), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file